@@ -11,11 +11,32 @@ from app.routes.payments import payments_bp
 from app.routes.admin import admin_bp
 from app.routes.search import search_bp
 from app.routes.seats import seats_bp
+from app.utils.seat_stream import hub as seat_stream_hub
+from app.utils.seat_cache import cache as seat_cache
+from app.utils.qr import cache as qr_cache
 import os
+import sys
 
 
-def create_app(config_name=None):
-    """Application factory"""
+def _serving():
+    """Whether this process serves requests, rather than running a CLI command
+
+    The flask CLI sets FLASK_RUN_FROM_CLI for every command; only ``flask run``
+    serves. Gunicorn and ``python wsgi.py`` never set it.
+    """
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        return True
+    return 'run' in sys.argv[1:]
+
+
+def create_app(config_name=None, bootstrap=True):
+    """Application factory
+
+    Pass ``bootstrap=False`` from one-off scripts to skip table creation, the
+    super admin bootstrap and the background schedulers. The schedulers are
+    also skipped under CLI commands such as ``flask db upgrade`` or
+    ``flask shell``, which load the app through wsgi.py but serve nothing.
+    """
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'development')
     
@@ -49,6 +70,9 @@ def create_app(config_name=None):
     app.register_blueprint(admin_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(seats_bp)
+    seat_stream_hub.init_app(app)
+    seat_cache.init_app(app)
+    qr_cache.init_app(app)
     
     # Error handlers
     @app.errorhandler(404)
@@ -76,6 +100,30 @@ def create_app(config_name=None):
     def serve_upload(filename):
         return send_from_directory(upload_dir, filename)
 
+    if not bootstrap:
+        return app
+    serving = _serving()
+
+    # Background release of expired seat holds
+    if serving and app.config.get('HOLD_EXPIRY_ENABLED'):
+        from app.utils.hold_expiry import scheduler as hold_expiry_scheduler
+        hold_expiry_scheduler.init_app(app)
+
+    # Background application of the gate scan log
+    if serving and app.config.get('SCAN_APPLIER_ENABLED'):
+        from app.utils.ticket_scans import applier as scan_applier
+        scan_applier.init_app(app)
+
+    # Background delivery of the email outbox
+    if serving and app.config.get('EMAIL_WORKER_ENABLED'):
+        from app.utils.email_outbox import worker as email_worker
+        email_worker.init_app(app)
+
+    # Background processing of the payment webhook inbox
+    if serving and app.config.get('WEBHOOK_PROCESSOR_ENABLED'):
+        from app.utils.webhook_inbox import processor as webhook_processor
+        webhook_processor.init_app(app)
+
     # Context for database operations
     with app.app_context():
         try:
@@ -1,5 +1,8 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, raiseload
 from datetime import datetime
+from app.utils.qr import content_hash, ticket_payload, url_signature
 import uuid
 
 db = SQLAlchemy()
@@ -168,11 +171,21 @@ class TicketType(BaseModel):
     description = db.Column(db.Text, nullable=True)
     start_sale = db.Column(db.DateTime, nullable=True)
     end_sale = db.Column(db.DateTime, nullable=True)
+    shard_count = db.Column(db.Integer, default=0, nullable=False)  # 0: counted on this row
     
     # Relationships
     tickets = db.relationship('Ticket', backref='ticket_type', lazy='dynamic', cascade='all, delete-orphan')
+    shards = db.relationship('TicketTypeShard', backref='ticket_type', lazy='select', cascade='all, delete-orphan')
+    
+    @property
+    def sold_count(self):
+        """Tickets sold, merged across counter shards for sharded types"""
+        if self.shard_count:
+            return sum(shard.sold for shard in self.shards)
+        return self.sold or 0
     
     def to_dict(self):
+        sold = self.sold_count
         base_dict = super().to_dict()
         base_dict.update({
             'event_id': self.event_id,
@@ -180,8 +193,8 @@ class TicketType(BaseModel):
             'type': self.type,
             'price': self.price,
             'quantity': self.quantity,
-            'sold': self.sold,
-            'available': self.quantity - self.sold,
+            'sold': sold,
+            'available': self.quantity - sold,
             'description': self.description,
             'start_sale': self.start_sale.isoformat() if self.start_sale else None,
             'end_sale': self.end_sale.isoformat() if self.end_sale else None,
@@ -189,6 +202,20 @@ class TicketType(BaseModel):
         return base_dict
 
 
+class TicketTypeShard(BaseModel):
+    """One slice of a hot ticket type's inventory, with its own sold counter"""
+    __tablename__ = 'ticket_type_shards'
+    
+    ticket_type_id = db.Column(db.String(36), db.ForeignKey('ticket_types.id'), nullable=False)
+    shard = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    sold = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('ticket_type_id', 'shard', name='uq_ticket_type_shard'),
+    )
+
+
 class Ticket(BaseModel):
     """Ticket model for purchased tickets"""
     __tablename__ = 'tickets'
@@ -210,11 +237,44 @@ class Ticket(BaseModel):
     ticket_number = db.Column(db.String(50), unique=True, nullable=False)
     price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default=Status.PENDING, nullable=False)
-    qr_code = db.Column(db.String(500), nullable=True)
+    qr_code = db.Column(db.String(500), nullable=True)  # QR payload text; images are rendered on demand
     used_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
-    payment = db.relationship('Payment', backref='tickets', lazy='joined')
+    payment = db.relationship('Payment', backref='tickets', lazy='select')
+    
+    __table_args__ = (
+        # Gate bundle deltas: an event's tickets changed since a version
+        db.Index('idx_tickets_event_updated', 'event_id', 'updated_at'),
+    )
+    
+    @staticmethod
+    def listing_options():
+        """
+        Loader options for serializing many tickets with to_dict().
+
+        The event, ticket type, seat and section columns to_dict() reads come
+        back joined in the ticket query itself; any other relationship raises
+        instead of quietly issuing a query per ticket.
+        """
+        return (
+            joinedload(Ticket.event).load_only(Event.title, Event.start_date, Event.location),
+            joinedload(Ticket.ticket_type).load_only(TicketType.name, TicketType.type),
+            joinedload(Ticket.seat).load_only(Seat.section_id, Seat.row, Seat.seat_number)
+            .joinedload(Seat.section).load_only(VenueSection.name),
+            raiseload('*'),
+        )
+    
+    @property
+    def qr_payload(self):
+        return self.qr_code or ticket_payload(self.ticket_number, self.event_id)
+    
+    @property
+    def qr_url(self):
+        """Image URL; it names the payload's content hash, so it never changes meaning"""
+        digest = content_hash(self.qr_payload)
+        sig = url_signature(current_app.config['TICKET_SIGNING_KEY'], self.id, digest)
+        return f'/api/tickets/{self.id}/qr/{digest}.png?sig={sig}'
     
     def to_dict(self):
         base_dict = super().to_dict()
@@ -237,7 +297,8 @@ class Ticket(BaseModel):
             'ticket_number': self.ticket_number,
             'price': self.price,
             'status': self.status,
-            'qr_code': self.qr_code,
+            'qr_code': self.qr_payload,
+            'qr_url': self.qr_url,
             'used_at': self.used_at.isoformat() if self.used_at else None,
         })
         return base_dict
@@ -290,6 +351,108 @@ class Payment(BaseModel):
         return base_dict
 
 
+class PaymentReference(BaseModel):
+    """A payment provider's identifier for one of our payments (order id, capture id)"""
+    __tablename__ = 'payment_references'
+    
+    class Provider:
+        PAYPAL = 'paypal'
+        
+        VALID_PROVIDERS = [PAYPAL]
+    
+    class Type:
+        ORDER = 'order'
+        CAPTURE = 'capture'
+        
+        VALID_TYPES = [ORDER, CAPTURE]
+    
+    payment_id = db.Column(db.String(36), db.ForeignKey('payments.id'), nullable=False, index=True)
+    provider = db.Column(db.String(20), nullable=False)
+    ref_type = db.Column(db.String(20), nullable=False)
+    ref_value = db.Column(db.String(255), nullable=False)
+    
+    __table_args__ = (
+        # Captures and webhooks find their payment by the provider's id
+        db.UniqueConstraint('provider', 'ref_type', 'ref_value', name='uq_payment_reference'),
+    )
+
+
+class WebhookEvent(BaseModel):
+    """A payment provider webhook delivery, stored as received and processed later"""
+    __tablename__ = 'webhook_events'
+    
+    class Status:
+        PENDING = 'pending'
+        PROCESSED = 'processed'
+        IGNORED = 'ignored'
+        FAILED = 'failed'
+        
+        VALID_STATUSES = [PENDING, PROCESSED, IGNORED, FAILED]
+    
+    provider = db.Column(db.String(20), nullable=False)
+    event_id = db.Column(db.String(255), nullable=False)
+    event_type = db.Column(db.String(100), nullable=False)
+    # The provider's id for the order or capture the event is about
+    resource_ref = db.Column(db.String(255), nullable=True)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default=Status.PENDING, nullable=False)
+    payment_id = db.Column(db.String(36), nullable=True, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Redeliveries of an event are dropped on insert
+        db.UniqueConstraint('provider', 'event_id', name='uq_webhook_event'),
+        # The processor's claim query: due pending events, in arrival order
+        db.Index('idx_webhook_events_status_due', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            'provider': self.provider,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'resource_ref': self.resource_ref,
+            'status': self.status,
+            'payment_id': self.payment_id,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+        })
+        return base_dict
+
+
+class IdempotencyKey(BaseModel):
+    """A client's Idempotency-Key with the response its first request got"""
+    __tablename__ = 'idempotency_keys'
+    
+    class Status:
+        IN_PROGRESS = 'in_progress'
+        COMPLETED = 'completed'
+        
+        VALID_STATUSES = [IN_PROGRESS, COMPLETED]
+    
+    # Endpoint and user the key was sent to; keys are only unique per scope
+    scope = db.Column(db.String(120), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), default=Status.IN_PROGRESS, nullable=False)
+    owner = db.Column(db.String(36), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_key'),
+    )
+
+
 class Review(BaseModel):
     """Review/Rating model for events"""
     __tablename__ = 'reviews'
@@ -359,7 +522,12 @@ class Venue(BaseModel):
 
 
 class VenueSection(BaseModel):
-    """Seating sections within a venue"""
+    """Seating sections within a venue
+
+    Virtual sections derive their seats from ``rows`` x ``seats_per_row``;
+    only seats that differ from the default (available, no price) have a
+    Seat row, created the first time they are touched.
+    """
     __tablename__ = 'venue_sections'
     
     venue_id = db.Column(db.String(36), db.ForeignKey('venues.id'), nullable=False)
@@ -368,6 +536,7 @@ class VenueSection(BaseModel):
     rows = db.Column(db.Integer, nullable=False)  # Number of rows
     seats_per_row = db.Column(db.Integer, nullable=False)  # Seats per row
     color = db.Column(db.String(7), nullable=True)  # Hex color for UI
+    is_virtual = db.Column(db.Boolean, default=False, nullable=False)
     
     # Relationships
     seats = db.relationship('Seat', backref='section', lazy='dynamic', cascade='all, delete-orphan')
@@ -381,6 +550,7 @@ class VenueSection(BaseModel):
             'rows': self.rows,
             'seats_per_row': self.seats_per_row,
             'color': self.color,
+            'is_virtual': self.is_virtual,
         })
         return base_dict
 
@@ -410,7 +580,7 @@ class Seat(BaseModel):
     tickets = db.relationship('Ticket', backref='seat', lazy='dynamic')
     
     __table_args__ = (
-        db.Index('idx_section_row_seat', 'section_id', 'row', 'seat_number'),
+        db.Index('idx_section_row_seat', 'section_id', 'row', 'seat_number', unique=True),
     )
     
     def to_dict(self):
@@ -428,6 +598,223 @@ class Seat(BaseModel):
         return base_dict
 
 
+class EventSeatInventory(BaseModel):
+    """Per-event seat states for one venue section, packed one byte per seat"""
+    __tablename__ = 'event_seat_inventory'
+    
+    event_id = db.Column(db.String(36), db.ForeignKey('events.id'), nullable=False)
+    section_id = db.Column(db.String(36), db.ForeignKey('venue_sections.id'), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    seats_per_row = db.Column(db.Integer, nullable=False)
+    statuses = db.Column(db.LargeBinary, nullable=False)  # row-major, see app.utils.seat_inventory
+    version = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'section_id', name='uq_event_seat_inventory_event_section'),
+    )
+    
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            'event_id': self.event_id,
+            'section_id': self.section_id,
+            'rows': self.rows,
+            'seats_per_row': self.seats_per_row,
+            'version': self.version,
+        })
+        return base_dict
+
+
+class SeatMapVersion(BaseModel):
+    """Monotonic seat-state version per venue, bumped on every seat change"""
+    __tablename__ = 'seat_map_versions'
+    
+    venue_id = db.Column(db.String(36), db.ForeignKey('venues.id'), unique=True, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    # Bumped when seats are added, so cached seat ids and prices are rebuilt
+    layout_version = db.Column(db.Integer, default=0, nullable=False)
+
+
+class SeatChange(BaseModel):
+    """Bounded log of seat state changes, used to serve seat map deltas"""
+    __tablename__ = 'seat_changes'
+    
+    venue_id = db.Column(db.String(36), db.ForeignKey('venues.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    # No foreign key: a released virtual seat's row is deleted, its log entries stay
+    seat_id = db.Column(db.String(36), nullable=False)
+    section_id = db.Column(db.String(36), db.ForeignKey('venue_sections.id'), nullable=False)
+    row = db.Column(db.Integer, nullable=False)
+    seat_number = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_seat_changes_venue_version', 'venue_id', 'version'),
+    )
+    
+    def to_dict(self):
+        return {
+            'seat_id': self.seat_id,
+            'section_id': self.section_id,
+            'row': self.row,
+            'seat_number': self.seat_number,
+            'status': self.status,
+            'version': self.version,
+        }
+
+
+class SchedulerLease(BaseModel):
+    """Named lease so only one process at a time runs a periodic job"""
+    __tablename__ = 'scheduler_leases'
+    
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    owner = db.Column(db.String(255), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+
+class BackgroundJob(BaseModel):
+    """Long-running admin task executed off the request thread"""
+    __tablename__ = 'background_jobs'
+    
+    class Status:
+        PENDING = 'pending'
+        RUNNING = 'running'
+        SUCCEEDED = 'succeeded'
+        FAILED = 'failed'
+        
+        VALID_STATUSES = [PENDING, RUNNING, SUCCEEDED, FAILED]
+    
+    kind = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), default=Status.PENDING, nullable=False)
+    progress_done = db.Column(db.Integer, default=0, nullable=False)
+    progress_total = db.Column(db.Integer, default=0, nullable=False)
+    params = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    checkpoint = db.Column(db.JSON, nullable=True)  # where a resumed run picks up
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            'kind': self.kind,
+            'status': self.status,
+            'progress_done': self.progress_done,
+            'progress_total': self.progress_total,
+            'progress': round(self.progress_done / self.progress_total, 4) if self.progress_total else None,
+            'params': self.params,
+            'result': self.result,
+            'checkpoint': self.checkpoint,
+            'error': self.error,
+            'created_by': self.created_by,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        })
+        return base_dict
+
+
+class EmailOutbox(BaseModel):
+    """Email waiting to be sent by the outbox worker"""
+    __tablename__ = 'email_outbox'
+    
+    class Status:
+        PENDING = 'pending'
+        SENT = 'sent'
+        FAILED = 'failed'
+        
+        VALID_STATUSES = [PENDING, SENT, FAILED]
+    
+    class Kind:
+        TICKETS = 'tickets'
+        WELCOME = 'welcome'
+        
+        VALID_KINDS = [TICKETS, WELCOME]
+    
+    kind = db.Column(db.String(20), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default=Status.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # The worker's claim query: due pending messages, oldest first
+        db.Index('idx_email_outbox_status_due', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            'kind': self.kind,
+            'recipient': self.recipient,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+        })
+        return base_dict
+
+
+class IdSequence(BaseModel):
+    """Named counter that ID allocators reserve blocks of values from"""
+    __tablename__ = 'id_sequences'
+    
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    next_value = db.Column(db.BigInteger, default=1, nullable=False)
+
+
+class TicketScan(BaseModel):
+    """Append-only log of gate scans; the ticket is marked used from it later"""
+    __tablename__ = 'ticket_scans'
+    
+    class Status:
+        PENDING = 'pending'
+        APPLIED = 'applied'
+        DUPLICATE = 'duplicate'
+        REJECTED = 'rejected'
+        
+        VALID_STATUSES = [PENDING, APPLIED, DUPLICATE, REJECTED]
+    
+    ticket_number = db.Column(db.String(50), nullable=False, index=True)
+    event_id = db.Column(db.String(36), nullable=False)
+    device_id = db.Column(db.String(100), nullable=False)
+    gate = db.Column(db.String(50), nullable=True)
+    scanned_by = db.Column(db.String(36), nullable=True)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default=Status.PENDING, nullable=False)
+    result = db.Column(db.String(50), nullable=True)  # why a scan was not applied
+    ticket_id = db.Column(db.String(36), db.ForeignKey('tickets.id'), nullable=True)
+    applied_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # A device retrying an upload must not log the same scan twice
+        db.UniqueConstraint('ticket_number', 'device_id', 'scanned_at', name='uq_ticket_scan'),
+        db.Index('idx_ticket_scans_status_scanned', 'status', 'scanned_at'),
+        db.Index('idx_ticket_scans_event', 'event_id', 'scanned_at'),
+    )
+    
+    def to_dict(self):
+        base_dict = super().to_dict()
+        base_dict.update({
+            'ticket_number': self.ticket_number,
+            'event_id': self.event_id,
+            'device_id': self.device_id,
+            'gate': self.gate,
+            'scanned_by': self.scanned_by,
+            'scanned_at': self.scanned_at.isoformat() if self.scanned_at else None,
+            'status': self.status,
+            'result': self.result,
+            'ticket_id': self.ticket_id,
+            'applied_at': self.applied_at.isoformat() if self.applied_at else None,
+        })
+        return base_dict
+
+
 # Association table for saved events
 saved_events = db.Table(
     'saved_events',
@@ -1,6 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from app.models import db, User, Event, Payment, Ticket, Venue, VenueSection, Seat, TicketType
+from app.models import db, User, Event, Payment, Ticket, Venue, VenueSection, Seat, TicketType, BackgroundJob, TicketScan
+from app.utils.seat_generation import JOB_KIND as SEAT_GENERATION_JOB, build_event_seating, seat_generation_job
+from app.utils.jobs import resume_job, start_job
+from app.utils.ga_inventory import check_ticket_type, set_shard_count
+from app.utils.hold_expiry import scheduler as hold_expiry_scheduler
+from app.utils.qr import cache as qr_cache
+from app.utils.qr_prewarm import JOB_KIND as QR_PREWARM_JOB, count_prewarm_tickets, prewarm_job
+from app.utils.ticket_scans import applier as scan_applier
+from app.utils.email_outbox import worker as email_worker
+from app.utils.webhook_inbox import processor as webhook_processor
+from app.utils import outbound
 from datetime import datetime, timedelta
 import os, uuid, base64
 
@@ -339,6 +349,173 @@ def revenue_report():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_metrics():
+    """Background job metrics for this worker process (Admin only)"""
+    return jsonify({
+        'pid': os.getpid(),
+        'hold_expiry': hold_expiry_scheduler.metrics(),
+        'qr_render': qr_cache.metrics(),
+        'ticket_scans': scan_applier.metrics(),
+        'email_outbox': email_worker.metrics(),
+        'webhook_inbox': webhook_processor.metrics(),
+        'outbound': outbound.metrics(),
+    }), 200
+
+
+@admin_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_job(job_id):
+    """Status and progress of a background job (Admin only)"""
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job.to_dict()}), 200
+
+
+@admin_bp.route('/jobs/<job_id>/rerun', methods=['POST'])
+@jwt_required()
+@admin_required
+def rerun_job(job_id):
+    """Run a failed seat generation job again from its stored params (Admin only)"""
+    try:
+        job = db.session.get(BackgroundJob, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        if job.kind != SEAT_GENERATION_JOB:
+            return jsonify({'error': f'{job.kind} jobs cannot be rerun'}), 400
+
+        # Rows already written are skipped, and the claim is atomic, so a
+        # rerun never generates seats twice
+        rerun = resume_job(job, seat_generation_job)
+        if not rerun:
+            db.session.refresh(job)
+            return jsonify({'error': f'Job is {job.status} and cannot be rerun'}), 409
+        return jsonify({'job': rerun.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/events/<event_id>/qr-prewarm', methods=['POST'])
+@jwt_required()
+@admin_required
+def prewarm_event_qr_codes(event_id):
+    """
+    Render QR images for an event's confirmed tickets ahead of
+    time (Admin only). Poll GET /api/admin/jobs/<job_id>; the result carries
+    the throughput.
+    """
+    try:
+        event = db.session.get(Event, event_id)
+        if not event:
+            return jsonify({'error': 'Event not found'}), 404
+
+        data = request.get_json(silent=True) or {}
+        params = {'event_id': event.id}
+        if data.get('batch_size'):
+            params['batch_size'] = int(data['batch_size'])
+        total = count_prewarm_tickets(event.id)
+        if not qr_cache.holds(total):
+            return jsonify({
+                'error': f'The QR disk cache holds {qr_cache.disk_max_files if qr_cache.directory else 0} images; '
+                         f'raise QR_DISK_CACHE_MAX_FILES above the event\'s {total} tickets to pre-warm it'
+            }), 400
+        job = start_job(
+            QR_PREWARM_JOB,
+            prewarm_job,
+            params=params,
+            total=total,
+            created_by=get_jwt_identity(),
+        )
+        return jsonify({'job': job.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/events/<event_id>/scans', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_event_scans(event_id):
+    """Gate scans for an event, newest first; ``?status=duplicate`` lists double scans (Admin only)"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        query = TicketScan.query.filter_by(event_id=event_id)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args['status'])
+        scans = query.order_by(TicketScan.scanned_at.desc()).paginate(page=page, per_page=limit)
+
+        return jsonify({
+            'scans': [s.to_dict() for s in scans.items],
+            'pagination': {
+                'page': page,
+                'limit': limit,
+                'total': scans.total,
+                'pages': scans.pages
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/ticket-types/<ticket_type_id>/inventory', methods=['GET'])
+@jwt_required()
+@admin_required
+def check_ticket_type_inventory(ticket_type_id):
+    """Compare a ticket type's sold counters with its tickets (Admin only)"""
+    ticket_type = db.session.get(TicketType, ticket_type_id)
+    if not ticket_type:
+        return jsonify({'error': 'Ticket type not found'}), 404
+    return jsonify({'report': check_ticket_type(ticket_type)}), 200
+
+
+@admin_bp.route('/ticket-types/<ticket_type_id>/inventory/repair', methods=['POST'])
+@jwt_required()
+@admin_required
+def repair_ticket_type_inventory(ticket_type_id):
+    """Reset a ticket type's sold counters to its ticket count (Admin only)"""
+    try:
+        ticket_type = db.session.get(TicketType, ticket_type_id)
+        if not ticket_type:
+            return jsonify({'error': 'Ticket type not found'}), 404
+        report = check_ticket_type(ticket_type, repair=True)
+        db.session.commit()
+        return jsonify({'report': report}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/ticket-types/<ticket_type_id>/shards', methods=['PUT'])
+@jwt_required()
+@admin_required
+def shard_ticket_type(ticket_type_id):
+    """Split a hot ticket type's counter over N rows, or merge with 0 (Admin only)"""
+    try:
+        ticket_type = db.session.get(TicketType, ticket_type_id)
+        if not ticket_type:
+            return jsonify({'error': 'Ticket type not found'}), 404
+        shards = int((request.get_json() or {}).get('shards', 0))
+        if not 0 <= shards <= 256:
+            return jsonify({'error': 'shards must be between 0 and 256'}), 400
+        set_shard_count(ticket_type, shards)
+        db.session.commit()
+        return jsonify({'ticket_type': ticket_type.to_dict(), 'shard_count': ticket_type.shard_count}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 # ──────────────────────────────────────────────
 # ADMIN EVENT CREATION (full pipeline)
 # ──────────────────────────────────────────────
@@ -394,13 +571,21 @@ def create_full_event():
     One-shot endpoint: creates Venue (or reuses existing), VenueSections,
     Seats, Event, and TicketTypes (VVIP / VIP / Regular).
 
+    Layouts of SEAT_GENERATION_ASYNC_THRESHOLD seats or more (or any layout
+    with "async": true) are created as a draft event and answered with 202
+    and a background job; the seats are generated by the job and the event
+    is published when it finishes. Poll GET /api/admin/jobs/<job_id>.
+    Sections marked virtual (or all, with "virtual_seats": true) get no Seat
+    rows; their seats are derived from the section geometry.
+
     Expected JSON body:
     {
       "event": { title, description, category, location, start_date, end_date, image_url, tags },
       "venue": { name, address, city, state, country, reuse_id (optional) },
       "sections": [
-        { name, ticket_type, rows, seats_per_row, color }
+        { name, ticket_type, rows, seats_per_row, color, virtual }
       ],
+      "virtual_seats": false,
       "ticket_types": [
         { name, type, price, description }
       ]
@@ -414,6 +599,16 @@ def create_full_event():
         vn = data.get('venue', {})
         sections_data = data.get('sections', [])
         ticket_types_data = data.get('ticket_types', [])
+        # Virtual sections store no seats until they are touched
+        virtual_default = bool(data.get('virtual_seats', False))
+        total_seats = sum(
+            int(s.get('rows', 5)) * int(s.get('seats_per_row', 10))
+            for s in sections_data
+            if not s.get('virtual', virtual_default)
+        )
+        run_async = bool(data.get('async')) or (
+            total_seats >= current_app.config.get('SEAT_GENERATION_ASYNC_THRESHOLD', 20000)
+        )
 
         # ── Venue ──
         venue = None
@@ -449,7 +644,7 @@ def create_full_event():
             end_date=end_date,
             image_url=ev.get('image_url', ''),
             tags=','.join(ev.get('tags', [])) if isinstance(ev.get('tags'), list) else ev.get('tags', ''),
-            status=Event.Status.PUBLISHED,
+            status=Event.Status.DRAFT if run_async else Event.Status.PUBLISHED,
             organizer_id=current_user_id,
             venue_id=venue.id,
             is_featured=ev.get('is_featured', False),
@@ -463,6 +658,7 @@ def create_full_event():
             'vip':  '#026CDF',   # blue
             'regular': '#6B7280' # gray
         }
+        section_ids = []
         for sec in sections_data:
             rows = int(sec.get('rows', 5))
             spr  = int(sec.get('seats_per_row', 10))
@@ -476,18 +672,11 @@ def create_full_event():
                 rows=rows,
                 seats_per_row=spr,
                 color=color,
+                is_virtual=bool(sec.get('virtual', virtual_default)),
             )
             db.session.add(section)
             db.session.flush()
-
-            for row in range(1, rows + 1):
-                for seat_num in range(1, spr + 1):
-                    db.session.add(Seat(
-                        section_id=section.id,
-                        row=row,
-                        seat_number=seat_num,
-                        status=Seat.Status.AVAILABLE,
-                    ))
+            section_ids.append(section.id)
 
         # ── Ticket Types ──
         for tt in ticket_types_data:
@@ -507,6 +696,24 @@ def create_full_event():
                 description=tt.get('description', ''),
             ))
 
+        # ── Seats + event seat inventory ──
+        if run_async:
+            db.session.commit()
+            job = start_job(
+                SEAT_GENERATION_JOB,
+                seat_generation_job,
+                params={'event_id': event.id, 'section_ids': section_ids, 'publish': True},
+                total=total_seats,
+                created_by=current_user_id,
+            )
+            return jsonify({
+                'message': 'Event created; seats are being generated',
+                'event': event.to_dict(),
+                'venue': venue.to_dict(),
+                'job': job.to_dict(),
+            }), 202
+
+        build_event_seating(event.id, section_ids)
         db.session.commit()
 
         return jsonify({
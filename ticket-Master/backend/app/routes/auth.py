@@ -1,10 +1,11 @@
 import os
 import secrets
-import requests as http_requests
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app.models import db, User
 from app.utils.security import PasswordHandler, ValidationHandler
+from app.utils import outbound
+from app.utils.outbound import ProviderUnavailable, unavailable_response
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -24,10 +25,9 @@ def google_login():
             return jsonify({'error': 'Missing Google credential'}), 400
 
         # Verify with Google's tokeninfo endpoint
-        resp = http_requests.get(
+        resp = outbound.client('google').get(
             'https://www.googleapis.com/oauth2/v3/tokeninfo',
             params={'id_token': credential},
-            timeout=10
         )
         if resp.status_code != 200:
             return jsonify({'error': 'Invalid Google token'}), 401
@@ -67,15 +67,11 @@ def google_login():
         user.last_login = datetime.utcnow()
         if picture and not user.profile_picture:
             user.profile_picture = picture
-        db.session.commit()
-
-        # Send welcome email for new users (non-blocking)
+        # Welcome email for new users, sent by the outbox worker
         if is_new:
-            try:
-                from app.utils.email import send_welcome_email
-                send_welcome_email(email, first_name)
-            except Exception:
-                pass
+            from app.utils.email_outbox import enqueue_welcome_email
+            enqueue_welcome_email(email, first_name)
+        db.session.commit()
 
         access_token = create_access_token(
             identity=user.id,
@@ -93,6 +89,9 @@ def google_login():
             'is_new_user': is_new,
         }), 200
 
+    except ProviderUnavailable as e:
+        db.session.rollback()
+        return unavailable_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
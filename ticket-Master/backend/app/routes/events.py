@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from app.models import db, Event, TicketType, Ticket, User, Review
-from datetime import datetime
+from app.models import db, Event, TicketType, Ticket, User, Review, BackgroundJob
+from app.utils.broadcast import JOB_KIND as BROADCAST_JOB, VARIANTS as BROADCAST_VARIANTS, broadcast_job, count_recipients, stale_seconds as broadcast_stale_seconds
+from app.utils.jobs import resume_job, start_job
+from datetime import datetime, timedelta
 from sqlalchemy import or_
 
 events_bp = Blueprint('events', __name__, url_prefix='/api/events')
@@ -408,3 +410,107 @@ def list_saved_events():
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+def _can_broadcast(event):
+    """Organizers for their own events, and admins"""
+    role = get_jwt().get('role')
+    if role in [User.Role.ADMIN, User.Role.SUPER_ADMIN]:
+        return True
+    return role == User.Role.ORGANIZER and event.organizer_id == get_jwt_identity()
+
+
+def _broadcast_job(event_id, job_id):
+    job = db.session.get(BackgroundJob, job_id)
+    if not job or job.kind != BROADCAST_JOB or (job.params or {}).get('event_id') != event_id:
+        return None
+    return job
+
+
+@events_bp.route('/<event_id>/broadcasts', methods=['POST'])
+@jwt_required()
+def start_broadcast(event_id):
+    """
+    Email every ticket holder of an event (Organizer only).
+
+    Body: ``variant`` (general, time_change, gate_info or cancellation),
+    ``subject`` and ``message``. Poll the returned job for progress.
+    """
+    try:
+        event = db.session.get(Event, event_id)
+        if not event:
+            return jsonify({'error': 'Event not found'}), 404
+        if not _can_broadcast(event):
+            return jsonify({'error': 'You can only message attendees of your own events'}), 403
+
+        data = request.get_json() or {}
+        variant = data.get('variant', 'general')
+        subject = (data.get('subject') or '').strip()
+        message = (data.get('message') or '').strip()
+        if variant not in BROADCAST_VARIANTS:
+            return jsonify({'error': f"variant must be one of {', '.join(BROADCAST_VARIANTS)}"}), 400
+        if not subject or not message:
+            return jsonify({'error': 'subject and message are required'}), 400
+        if len(subject) > 200 or '\n' in subject or '\r' in subject:
+            return jsonify({'error': 'subject must be a single line of at most 200 characters'}), 400
+        if len(message) > 10000:
+            return jsonify({'error': 'message must be at most 10000 characters'}), 400
+
+        job = start_job(
+            BROADCAST_JOB,
+            broadcast_job,
+            params={'event_id': event.id, 'variant': variant, 'subject': subject, 'message': message},
+            total=count_recipients(event.id),
+            created_by=get_jwt_identity(),
+        )
+        return jsonify({'job': job.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@events_bp.route('/<event_id>/broadcasts/<job_id>', methods=['GET'])
+@jwt_required()
+def get_broadcast(event_id, job_id):
+    """Progress and throughput of a broadcast (Organizer only)"""
+    try:
+        event = db.session.get(Event, event_id)
+        if not event:
+            return jsonify({'error': 'Event not found'}), 404
+        if not _can_broadcast(event):
+            return jsonify({'error': 'You can only message attendees of your own events'}), 403
+        job = _broadcast_job(event_id, job_id)
+        if not job:
+            return jsonify({'error': 'Broadcast not found'}), 404
+        return jsonify({'job': job.to_dict()}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@events_bp.route('/<event_id>/broadcasts/<job_id>/resume', methods=['POST'])
+@jwt_required()
+def resume_broadcast(event_id, job_id):
+    """Continue a failed or stalled broadcast from its last checkpoint (Organizer only)"""
+    try:
+        event = db.session.get(Event, event_id)
+        if not event:
+            return jsonify({'error': 'Event not found'}), 404
+        if not _can_broadcast(event):
+            return jsonify({'error': 'You can only message attendees of your own events'}), 403
+        job = _broadcast_job(event_id, job_id)
+        if not job:
+            return jsonify({'error': 'Broadcast not found'}), 404
+
+        # Claimed atomically, so two resumes never send the rest twice
+        stale_before = datetime.utcnow() - timedelta(seconds=broadcast_stale_seconds(current_app.config))
+        resumed = resume_job(job, broadcast_job, stale_before)
+        if not resumed:
+            db.session.refresh(job)
+            return jsonify({'error': f'Broadcast is {job.status} and cannot be resumed'}), 409
+        return jsonify({'job': resumed.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -1,9 +1,21 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Payment, Ticket, User, Seat, TicketType
+from app.models import db, Payment, PaymentReference, Ticket, User, Seat, TicketType, Event
 from app.utils.integrations import PayPalHandler
+from app.utils.outbound import ProviderUnavailable, unavailable_response
 from datetime import datetime, timedelta
 from app.utils.security import ValidationHandler
+from app.utils.seat_changes import record_seat_changes
+from app.utils.seat_inventory import seats_outside_event
+from app.utils.seatmap import resolve_seat_ids
+from app.utils.ga_inventory import cancel_pending_tickets, reserve_tickets, release_for_tickets, sold_total
+from app.utils.qr import cache as qr_cache, ticket_payload
+from app.utils.ticket_tokens import issue_ticket_token
+from app.utils.hold_expiry import scheduler as hold_expiry_scheduler
+from app.utils.email_outbox import enqueue_ticket_email
+from app.utils.payment_refs import add_reference, find_payment
+from app.utils.idempotency import idempotent
+from app.utils.webhook_inbox import record_paypal_event
 
 payments_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
 
@@ -43,6 +55,7 @@ def create_paypal_order():
                 'paypal_order_id': order_data.get('id'),
                 'status': order_data.get('status')
             }
+            add_reference(payment.id, PaymentReference.Provider.PAYPAL, PaymentReference.Type.ORDER, order_data.get('id'))
             db.session.commit()
             
             # Return approval link
@@ -63,12 +76,15 @@ def create_paypal_order():
                 'details': result.get('error')
             }), 400
     
+    except ProviderUnavailable as e:
+        return unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @payments_bp.route('/create', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_payment():
     """Create a payment and associated ticket placeholders (PENDING)"""
     try:
@@ -76,7 +92,7 @@ def create_payment():
         data = request.get_json() or {}
 
         ticket_type_id = data.get('ticket_type_id')
-        seat_ids = data.get('seat_ids', [])
+        seat_ids = resolve_seat_ids(data.get('seat_ids', []))
         quantity = int(data.get('quantity', 0)) or 0
 
         # Calculate amount
@@ -99,6 +115,23 @@ def create_payment():
                 tickets_to_create.append({'seat_id': None, 'price': tt.price, 'ticket_type_id': ticket_type_id})
         else:
             return jsonify({'error': 'No seats or ticket type specified'}), 400
+        if seat_ids and data.get('event_id') and seats_outside_event(data['event_id'], seat_ids):
+            db.session.rollback()
+            return jsonify({'error': "Seats are not at this event's venue"}), 400
+
+        # Claim ticket type inventory for every ticket, all or nothing
+        per_type = {}
+        for t in tickets_to_create:
+            if t.get('ticket_type_id'):
+                per_type[t['ticket_type_id']] = per_type.get(t['ticket_type_id'], 0) + 1
+        for tt_id, count in per_type.items():
+            tt = db.session.get(TicketType, tt_id)
+            if not tt:
+                db.session.rollback()
+                return jsonify({'error': 'Ticket type not found'}), 404
+            if not reserve_tickets(tt, count):
+                db.session.rollback()
+                return jsonify({'error': f'Only {max(tt.quantity - sold_total(tt), 0)} tickets available'}), 400
 
         # Create payment
         payment = Payment(
@@ -116,17 +149,21 @@ def create_payment():
 
         # Create tickets linked to this payment
         created_tickets = []
-        for t in tickets_to_create:
+        held_seat_ids = []
+        hold_until = datetime.utcnow() + timedelta(minutes=10)
+        ticket_numbers = ValidationHandler.generate_ticket_numbers(len(tickets_to_create))
+        for t, ticket_number in zip(tickets_to_create, ticket_numbers):
             ticket = Ticket(
                 event_id=data.get('event_id') or None,
                 ticket_type_id=t.get('ticket_type_id') or None,
                 seat_id=t.get('seat_id'),
                 attendee_id=current_user_id,
                 payment_id=payment.id,
-                ticket_number=ValidationHandler.generate_ticket_number(),
+                ticket_number=ticket_number,
                 price=t.get('price') or 0,
                 status=Ticket.Status.PENDING
             )
+            ticket.qr_code = ticket_payload(ticket.ticket_number, ticket.event_id)
             db.session.add(ticket)
             created_tickets.append(ticket)
 
@@ -136,9 +173,12 @@ def create_payment():
                 if s and s.status == Seat.Status.AVAILABLE:
                     s.status = Seat.Status.RESERVED
                     s.reserved_by = current_user_id
-                    s.reserved_until = datetime.utcnow() + timedelta(minutes=10)
+                    s.reserved_until = hold_until
+                    held_seat_ids.append(s.id)
 
+        record_seat_changes(held_seat_ids, event_id=data.get('event_id'))
         db.session.commit()
+        hold_expiry_scheduler.schedule(held_seat_ids, hold_until)
 
         return jsonify({'payment_id': payment.id, 'payment': payment.to_dict(), 'tickets': [t.to_dict() for t in created_tickets]}), 201
 
@@ -147,6 +187,19 @@ def create_payment():
         return jsonify({'error': str(e)}), 500
 
 
+def _capture_outcome(payment):
+    """Response for a payment that is no longer pending: its tickets once captured, else 409"""
+    if payment.status != Payment.Status.COMPLETED:
+        return jsonify({'error': f'Payment is {payment.status} and cannot be captured'}), 409
+    # Reload the confirmed tickets with what to_dict() needs in one query
+    tickets = Ticket.query.options(*Ticket.listing_options()).filter_by(payment_id=payment.id).all()
+    return jsonify({
+        'message': 'Payment captured successfully',
+        'payment': payment.to_dict(),
+        'tickets': [t.to_dict() for t in tickets]
+    }), 200
+
+
 @payments_bp.route('/paypal/capture-order', methods=['POST'])
 @jwt_required()
 def capture_paypal_order():
@@ -160,7 +213,7 @@ def capture_paypal_order():
             return jsonify({'error': 'Missing order_id'}), 400
         
         # Find payment by PayPal order ID
-        payment = Payment.query.filter(Payment.metadata_json.contains({'paypal_order_id': data['order_id']})).first()
+        payment = find_payment(PaymentReference.Provider.PAYPAL, PaymentReference.Type.ORDER, data['order_id'])
         
         if not payment:
             return jsonify({'error': 'Payment not found'}), 404
@@ -168,52 +221,79 @@ def capture_paypal_order():
         if payment.user_id != current_user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
+        # A retried capture gets the first one's outcome; PayPal would
+        # replay its 201 for the same PayPal-Request-Id
+        if payment.status != Payment.Status.PENDING:
+            return _capture_outcome(payment)
+        
         # Capture payment
         paypal = PayPalHandler()
         result = paypal.capture_payment(data['order_id'])
         
         if result['success']:
             order_data = result['data']
-            payment.status = Payment.Status.COMPLETED
-            payment.metadata_json['paypal_order_data'] = order_data
+            # Only one capture of a pending payment confirms its tickets
+            captured = db.session.execute(
+                db.update(Payment)
+                .where(Payment.id == payment.id, Payment.status == Payment.Status.PENDING)
+                .values(status=Payment.Status.COMPLETED)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not captured:
+                db.session.rollback()
+                db.session.refresh(payment)
+                return _capture_outcome(payment)
+            db.session.refresh(payment)
+            # Reassigned, not mutated in place, so the JSON column is written
+            metadata = dict(payment.metadata_json or {}, paypal_order_data=order_data)
             
             # Extract capture ID from purchase units
             try:
                 capture_id = order_data['purchase_units'][0]['payments']['captures'][0]['id']
-                payment.metadata_json['paypal_capture_id'] = capture_id
+                metadata['paypal_capture_id'] = capture_id
+                add_reference(payment.id, PaymentReference.Provider.PAYPAL, PaymentReference.Type.CAPTURE, capture_id)
             except (KeyError, IndexError):
                 pass
+            payment.metadata_json = metadata
             
-            # Update ticket statuses
-            tickets = Ticket.query.filter_by(payment_id=payment.id).all()
+            # Confirm the tickets still pending; refunded or cancelled ones stay as they are
+            tickets = Ticket.query.filter_by(payment_id=payment.id, status=Ticket.Status.PENDING).all()
             for ticket in tickets:
                 ticket.status = Ticket.Status.CONFIRMED
+                # Confirmed tickets get a signed QR code gates can verify offline
+                issue_ticket_token(ticket)
             
             # Update event attendees count
-            if tickets:
-                event = tickets[0].event
-                event.total_attendees += len(tickets)
+            event_id = tickets[0].event_id if tickets else None
+            if event_id:
+                db.session.execute(
+                    db.update(Event)
+                    .where(Event.id == event_id)
+                    .values(total_attendees=Event.total_attendees + len(tickets))
+                    .execution_options(synchronize_session=False)
+                )
+            
+            # One email for the whole order, sent by the outbox worker
+            user = db.session.get(User, current_user_id)
+            enqueue_ticket_email(user.email, tickets)
             
+            payloads = [t.qr_code for t in tickets]
             db.session.commit()
-
-            # Send emails to the user for each ticket
-            try:
-                from app.utils.email import send_ticket_email
-                user = db.session.get(User, current_user_id)
-                for ticket in tickets:
-                    ticket_dict = ticket.to_dict()
-                    event_dict = ticket.event.to_dict() if ticket.event else {}
-                    send_ticket_email(user.email, ticket_dict, event_dict)
-            except Exception as email_err:
-                current_app.logger.error(f"[PURCHASE EMAIL ERROR] {email_err}")
+            # Render the order's codes on the pool before the email needs them
+            qr_cache.prerender(payloads)
             
-            return jsonify({
-                'message': 'Payment captured successfully',
-                'payment': payment.to_dict(),
-                'tickets': [t.to_dict() for t in tickets]
-            }), 200
+            return _capture_outcome(payment)
         else:
-            payment.status = Payment.Status.FAILED
+            # A failed payment gives its tickets' inventory back, unless a
+            # concurrent capture of the same order got there first
+            failed = db.session.execute(
+                db.update(Payment)
+                .where(Payment.id == payment.id, Payment.status == Payment.Status.PENDING)
+                .values(status=Payment.Status.FAILED)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if failed:
+                cancel_pending_tickets([payment.id])
             db.session.commit()
             
             return jsonify({
@@ -221,6 +301,9 @@ def capture_paypal_order():
                 'details': result.get('error')
             }), 400
     
+    except ProviderUnavailable as e:
+        db.session.rollback()
+        return unavailable_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -228,7 +311,7 @@ def capture_paypal_order():
 
 @payments_bp.route('/paypal/callback', methods=['POST'])
 def paypal_callback():
-    """Handle PayPal webhook callback"""
+    """Store a PayPal webhook for the webhook processor and acknowledge it"""
     try:
         webhook_data = request.get_json()
         
@@ -237,45 +320,14 @@ def paypal_callback():
         if not paypal.verify_webhook(webhook_data):
             return jsonify({'status': 'ignored'}), 200
         
-        event_type = webhook_data.get('event_type')
-        resource = webhook_data.get('resource', {})
-        
-        if event_type == 'PAYMENT.CAPTURE.COMPLETED':
-            # Payment completed via webhook
-            order_id = resource.get('supplementary_data', {}).get('related_ids', {}).get('order_id')
-            
-            payment = Payment.query.filter(Payment.metadata_json.contains({'paypal_order_id': order_id})).first()
-            
-            if payment:
-                payment.status = Payment.Status.COMPLETED
-                
-                # Update tickets
-                tickets = Ticket.query.filter_by(payment_id=payment.id).all()
-                for ticket in tickets:
-                    ticket.status = Ticket.Status.CONFIRMED
-                
-                db.session.commit()
-        
-        elif event_type == 'PAYMENT.CAPTURE.REFUNDED':
-            # Refund processed
-            capture_id = resource.get('id')
-            
-            payment = Payment.query.filter(Payment.metadata_json.contains({'paypal_capture_id': capture_id})).first()
-            
-            if payment:
-                payment.status = Payment.Status.REFUNDED
-                
-                # Update tickets
-                tickets = Ticket.query.filter_by(payment_id=payment.id).all()
-                for ticket in tickets:
-                    ticket.status = Ticket.Status.REFUNDED
-                    ticket.ticket_type.sold -= 1
-                
-                db.session.commit()
+        # One insert; a redelivered event id is dropped by the unique index
+        if not record_paypal_event(webhook_data):
+            return jsonify({'status': 'duplicate'}), 200
         
         return jsonify({'status': 'received'}), 200
     
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"PayPal webhook error: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -296,7 +348,7 @@ def get_payment_status(payment_id):
         
         return jsonify({
             'payment': payment.to_dict(),
-            'tickets': [t.to_dict() for t in Ticket.query.filter_by(payment_id=payment_id).all()]
+            'tickets': [t.to_dict() for t in Ticket.query.options(*Ticket.listing_options()).filter_by(payment_id=payment_id).all()]
         }), 200
     
     except Exception as e:
@@ -365,9 +417,9 @@ def refund_payment(payment_id):
             
             # Mark tickets as refunded
             tickets = Ticket.query.filter_by(payment_id=payment_id).all()
+            release_for_tickets(tickets)
             for ticket in tickets:
                 ticket.status = Ticket.Status.REFUNDED
-                ticket.ticket_type.sold -= 1
             
             db.session.commit()
             
@@ -381,6 +433,9 @@ def refund_payment(payment_id):
                 'details': result.get('error')
             }), 400
     
+    except ProviderUnavailable as e:
+        db.session.rollback()
+        return unavailable_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1,53 +1,228 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Seat, VenueSection, Venue
+from app.models import db, Seat, VenueSection, Venue, Event
+from app.utils.seat_holds import claim_seats
+from app.utils.seat_inventory import STATUS_CODES, load_event, seats_outside_event
+from app.utils.seat_changes import changes_since, current_version, record_seat_changes
+from app.utils.seatmap import NO_SEAT, compact_seatmap, drop_default_seats, full_seatmap_sections, resolve_seat_ids
+from app.utils.seat_cache import cache as seat_cache
+from app.utils.hold_expiry import release_venue_holds, scheduler as hold_expiry_scheduler
+from app.utils.seat_finder import ROW_PREFERENCES, get_index
+from app.utils.seat_stream import hub as seat_stream_hub
 from datetime import datetime, timedelta
+import base64
 
 seats_bp = Blueprint('seats', __name__, url_prefix='/api/seats')
 
 
-@seats_bp.route('/venue/<int:venue_id>/seatmap', methods=['GET'])
+@seats_bp.route('/venue/<venue_id>/seatmap', methods=['GET'])
 def get_venue_seatmap(venue_id):
+    """Venue seat map
+
+    ``?format=compact`` returns run-length-encoded sections and
+    ``?since=<version>`` returns only the seats changed after that version.
+    Full maps carry the seat map version as their ETag and answer 304 while
+    it is unchanged.
+    """
     try:
+        # An expired hold must bump the version before it is served as taken
+        release_venue_holds(venue_id)
+        since = request.args.get('since', type=int)
+        if since is not None:
+            version, changes = changes_since(venue_id, since)
+            return jsonify({
+                'version': version,
+                'refetch': changes is None,
+                'changes': changes or []
+            }), 200
+
         venue = db.session.get(Venue, venue_id)
         if not venue:
             return jsonify({'error': 'Venue not found'}), 404
 
-        sections = VenueSection.query.filter_by(venue_id=venue_id).all()
+        fmt = 'compact' if request.args.get('format') == 'compact' else 'full'
+        # Seat states come from the host-wide seat state cache
+        version, layout_version, states = seat_cache.states(venue_id)
+        etag = f'venue-{venue_id}-v{version}-{fmt}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        if fmt == 'compact':
+            payload = compact_seatmap(venue, version, layout_version, states)
+        else:
+            payload = {
+                'venue': venue.to_dict(),
+                'sections': full_seatmap_sections(venue_id, layout_version, states),
+                'version': version,
+            }
+
+        response = jsonify(payload)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response, 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _seat_stream_response(venue_id):
+    since = request.args.get('since', type=int)
+    if since is None and request.headers.get('Last-Event-ID', '').isdigit():
+        since = int(request.headers['Last-Event-ID'])
+    backlog = changes_since(venue_id, since) if since is not None else None
+    # The stream can stay open for minutes; do not pin a pooled connection
+    db.session.remove()
+    return Response(
+        seat_stream_hub.stream(venue_id, backlog),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@seats_bp.route('/venue/<venue_id>/stream', methods=['GET'])
+def stream_venue_seats(venue_id):
+    """Server-sent events with the seats of a venue as they change
+
+    Each ``seats`` event carries the latest state of the seats changed since
+    the previous one and the seat map version as its id. A client that
+    reconnects with ``Last-Event-ID`` (or ``?since=``) first receives what it
+    missed, or a ``refetch`` event if that has aged out of the change log.
+    """
+    try:
+        if not db.session.get(Venue, venue_id):
+            return jsonify({'error': 'Venue not found'}), 404
+        return _seat_stream_response(venue_id)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@seats_bp.route('/event/<event_id>/stream', methods=['GET'])
+def stream_event_seats(event_id):
+    """Seat change stream for the venue an event is held at"""
+    try:
+        event = db.session.get(Event, event_id)
+        if not event or not event.venue_id:
+            return jsonify({'error': 'Event not found'}), 404
+        return _seat_stream_response(event.venue_id)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@seats_bp.route('/venue/<venue_id>/availability', methods=['GET'])
+def get_venue_availability(venue_id):
+    """Seat counts per status for each section of a venue
+
+    Answered from the host-wide seat state cache, so on-sale read storms do
+    not reach the database. ``?statuses=1`` adds each section's row-major
+    status array (one byte per seat, base64).
+    """
+    try:
+        release_venue_holds(venue_id)
+        version, _, sections = seat_cache.states(venue_id)
+        if not sections:
+            return jsonify({'error': 'No seats for this venue'}), 404
+
+        include_statuses = request.args.get('statuses') in ('1', 'true')
+        codes = dict(STATUS_CODES, none=NO_SEAT)
+        payload = []
+        for section_id, (rows, seats_per_row, statuses) in sections.items():
+            entry = {
+                'id': section_id,
+                'rows': rows,
+                'seats_per_row': seats_per_row,
+                'counts': {name: statuses.count(code) for name, code in STATUS_CODES.items()},
+            }
+            if include_statuses:
+                entry['statuses'] = base64.b64encode(statuses).decode()
+            payload.append(entry)
+
+        return jsonify({'venue_id': venue_id, 'version': version, 'status_codes': codes, 'sections': payload}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@seats_bp.route('/event/<event_id>/inventory', methods=['GET'])
+def get_event_inventory(event_id):
+    """Event-scoped seat states, one packed status array per section
+
+    A mirror of the holds and sales made for this event, for display only:
+    holds are decided on the venue's Seat rows, which the venue seat map
+    serves.
+    """
+    try:
+        event = db.session.get(Event, event_id)
+        if not event:
+            return jsonify({'error': 'Event not found'}), 404
+        if event.venue_id:
+            # Lapsed holds are freed, and so shown available, before the read
+            release_venue_holds(event.venue_id)
+        sections = load_event(event_id)
+        if not sections:
+            return jsonify({'error': 'No seat inventory for this event'}), 404
+
         payload = []
-        for sec in sections:
-            seats = Seat.query.filter_by(section_id=sec.id).order_by(Seat.row.asc(), Seat.seat_number.asc()).all()
-            payload.append({
-                'section': {
-                    'id': sec.id,
-                    'name': sec.name,
-                    'rows': sec.rows,
-                    'seats_per_row': sec.seats_per_row,
-                },
-                'seats': [s.to_dict() for s in seats]
-            })
-
-        return jsonify({'venue': venue.to_dict(), 'sections': payload}), 200
+        for section in sections.values():
+            entry = section.to_dict()
+            entry['statuses'] = base64.b64encode(bytes(section.statuses)).decode()
+            payload.append(entry)
+
+        return jsonify({'event_id': event_id, 'status_codes': STATUS_CODES, 'sections': payload}), 200
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+def _not_at_event(event_id, seat_ids):
+    """400 response if an ``event_id`` was given and any of ``seat_ids`` is not at its venue"""
+    outside = seats_outside_event(event_id, seat_ids) if event_id else []
+    if not outside:
+        return None
+    db.session.rollback()
+    return jsonify({'error': "Seats are not at this event's venue", 'seat_ids': outside}), 400
+
+
 @seats_bp.route('/reserve', methods=['POST'])
 @jwt_required()
 def reserve_seats():
-    """Reserve seats temporarily for the current user"""
+    """Reserve seats temporarily for the current user
+
+    With ``atomic: true`` the whole group is held with one conditional UPDATE
+    and the request fails with 409 unless every seat could be claimed.
+    """
     try:
         data = request.get_json() or {}
-        seat_ids = data.get('seat_ids', [])
+        seat_ids = resolve_seat_ids(data.get('seat_ids', []))
         event_id = data.get('event_id')
         hold_seconds = int(data.get('hold_seconds', 600))
 
         if not seat_ids:
             return jsonify({'error': 'No seats specified'}), 400
+        mismatch = _not_at_event(event_id, seat_ids)
+        if mismatch:
+            return mismatch
 
         current_user_id = get_jwt_identity()
         now = datetime.utcnow()
+
+        if data.get('atomic'):
+            claimed, conflicts = claim_seats(seat_ids, current_user_id, hold_seconds, now=now)
+            if not claimed:
+                return jsonify({
+                    'error': 'Some seats are no longer available',
+                    'reserved': [],
+                    'conflicts': conflicts
+                }), 409
+            record_seat_changes(seat_ids, event_id=event_id)
+            db.session.commit()
+            hold_expiry_scheduler.schedule(seat_ids, now + timedelta(seconds=hold_seconds))
+            return jsonify({'reserved': list(dict.fromkeys(seat_ids)), 'conflicts': []}), 200
+
         reserved = []
         conflicts = []
 
@@ -83,7 +258,9 @@ def reserve_seats():
 
             reserved.append(seat.id)
 
+        record_seat_changes(reserved, event_id=event_id)
         db.session.commit()
+        hold_expiry_scheduler.schedule(reserved, now + timedelta(seconds=hold_seconds))
 
         return jsonify({'reserved': reserved, 'conflicts': conflicts}), 200
 
@@ -92,15 +269,78 @@ def reserve_seats():
         return jsonify({'error': str(e)}), 500
 
 
+@seats_bp.route('/best-available', methods=['POST'])
+@jwt_required()
+def hold_best_available():
+    """Find and hold the best block of adjacent seats for the current user
+
+    Body: venue_id, quantity, optional event_id, price or max_price, an
+    ordered list of preferred section_ids, row_preference (front/back) and
+    hold_seconds.
+    """
+    try:
+        data = request.get_json() or {}
+        venue_id = data.get('venue_id')
+        quantity = int(data.get('quantity', 0))
+        event_id = data.get('event_id')
+        hold_seconds = int(data.get('hold_seconds', 600))
+        row_preference = data.get('row_preference', 'front')
+
+        if not venue_id or quantity < 1:
+            return jsonify({'error': 'venue_id and a positive quantity are required'}), 400
+        if row_preference not in ROW_PREFERENCES:
+            return jsonify({'error': f'row_preference must be one of {list(ROW_PREFERENCES)}'}), 400
+        if event_id:
+            event = db.session.get(Event, event_id)
+            if not event or event.venue_id != venue_id:
+                return jsonify({'error': 'Event is not at this venue'}), 400
+
+        current_user_id = get_jwt_identity()
+        release_venue_holds(venue_id)
+        index = get_index(venue_id)
+        candidates = index.find(
+            quantity,
+            price=data.get('price'),
+            max_price=data.get('max_price'),
+            section_ids=data.get('section_ids'),
+            row_preference=row_preference,
+        )
+
+        # Another buyer may win a candidate between search and hold; try the next one
+        for block in candidates:
+            now = datetime.utcnow()
+            # Seats of virtual sections are addressed until first held
+            block['seat_ids'] = resolve_seat_ids(block['seat_ids'])
+            claimed, _ = claim_seats(block['seat_ids'], current_user_id, hold_seconds, now=now)
+            if not claimed:
+                continue
+            record_seat_changes(block['seat_ids'], event_id=event_id)
+            db.session.commit()
+            hold_expiry_scheduler.schedule(block['seat_ids'], now + timedelta(seconds=hold_seconds))
+            block['reserved_until'] = (now + timedelta(seconds=hold_seconds)).isoformat()
+            return jsonify({'reserved': block['seat_ids'], 'block': block}), 200
+
+        return jsonify({'error': f'No block of {quantity} adjacent seats is available'}), 409
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @seats_bp.route('/release', methods=['POST'])
 @jwt_required()
 def release_seats():
     try:
         data = request.get_json() or {}
-        seat_ids = data.get('seat_ids', [])
+        # Releasing a virtual seat that was never taken must not create its row
+        seat_ids = resolve_seat_ids(data.get('seat_ids', []), create=False)
+        event_id = data.get('event_id')
 
         if not seat_ids:
             return jsonify({'error': 'No seats specified'}), 400
+        mismatch = _not_at_event(event_id, seat_ids)
+        if mismatch:
+            return mismatch
 
         for sid in seat_ids:
             seat = db.session.get(Seat, sid)
@@ -112,6 +352,8 @@ def release_seats():
             if hasattr(seat, 'reserved_until'):
                 seat.reserved_until = None
 
+        record_seat_changes(seat_ids, event_id=event_id)
+        drop_default_seats(seat_ids)
         db.session.commit()
         return jsonify({'released': seat_ids}), 200
 
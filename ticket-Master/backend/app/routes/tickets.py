@@ -1,17 +1,20 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, make_response
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app.models import db, Ticket, TicketType, Event, Payment, User, Seat
 from app.utils.security import ValidationHandler
-from app.utils.email import send_ticket_email
+from app.utils.email_outbox import enqueue_ticket_email
+from app.utils.seat_changes import record_seat_changes
+from app.utils.seat_inventory import seats_outside_event
+from app.utils.seatmap import resolve_seat_ids
+from app.utils.ga_inventory import reserve_tickets, release_for_tickets, sold_total
+from app.utils.qr import HAS_QR, cache as qr_cache, content_hash, ticket_payload, url_signature
+from app.utils.ticket_tokens import InvalidTicketToken, is_ticket_token, issue_ticket_token, verify_ticket_token
+from app.utils.ticket_scans import MAX_BATCH_SCANS, gate_memory, ingest_scans, parse_scan_time, record_scan
+from app.utils.gate_bundle import build_bundle
+from app.utils.idempotency import idempotent
 from datetime import datetime
-try:
-    import qrcode
-    HAS_QR = True
-except Exception:
-    qrcode = None
-    HAS_QR = False
-import io
-import base64
+import hmac
+import re
 
 tickets_bp = Blueprint('tickets', __name__, url_prefix='/api/tickets')
 
@@ -25,9 +28,9 @@ def get_user_tickets():
         page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
         
-        query = Ticket.query.filter_by(attendee_id=current_user_id)
-        total = query.count()
+        query = Ticket.query.options(*Ticket.listing_options()).filter_by(attendee_id=current_user_id)
         tickets = query.paginate(page=page, per_page=limit)
+        total = tickets.total
         
         return jsonify({
             'tickets': [t.to_dict() for t in tickets.items],
@@ -69,6 +72,7 @@ def get_ticket(ticket_id):
 
 @tickets_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def purchase_ticket():
     """Purchase a ticket for an event"""
     try:
@@ -88,9 +92,12 @@ def purchase_ticket():
             return jsonify({'error': 'Event not found'}), 404
         
         quantity = int(data['quantity'])
-        available = ticket_type.quantity - ticket_type.sold
+        if quantity < 1:
+            return jsonify({'error': 'Quantity must be at least 1'}), 400
         
-        if quantity > available:
+        # Claim the inventory first; concurrent buyers cannot oversell
+        if not reserve_tickets(ticket_type, quantity):
+            available = max(ticket_type.quantity - sold_total(ticket_type), 0)
             return jsonify({'error': f'Only {available} tickets available'}), 400
         
         # Calculate total price
@@ -112,37 +119,23 @@ def purchase_ticket():
         
         # Create tickets
         tickets_created = []
-        for i in range(quantity):
+        ticket_numbers = ValidationHandler.generate_ticket_numbers(quantity)
+        for ticket_number in ticket_numbers:
             ticket = Ticket(
                 event_id=event.id,
                 ticket_type_id=ticket_type.id,
                 attendee_id=current_user_id,
                 payment_id=payment.id,
-                ticket_number=ValidationHandler.generate_ticket_number(),
+                ticket_number=ticket_number,
                 price=ticket_type.price,
                 status=Ticket.Status.PENDING
             )
-            
-            # Generate QR code if library is available
-            if HAS_QR:
-                qr = qrcode.QRCode(version=1, box_size=10, border=5)
-                qr.add_data(ticket.ticket_number)
-                qr.make(fit=True)
-                img = qr.make_image(fill_color="black", back_color="white")
-                # Convert to base64
-                img_io = io.BytesIO()
-                img.save(img_io, 'PNG')
-                img_io.seek(0)
-                ticket.qr_code = base64.b64encode(img_io.getvalue()).decode()
-            else:
-                ticket.qr_code = None
+            # Only the payload is stored; the image is served by /qr/<hash>.png
+            ticket.qr_code = ticket_payload(ticket.ticket_number, event.id)
             
             db.session.add(ticket)
             tickets_created.append(ticket)
         
-        # Update ticket type sold count
-        ticket_type.sold += quantity
-        
         db.session.commit()
         
         return jsonify({
@@ -170,15 +163,22 @@ def cancel_ticket(ticket_id):
         if ticket.attendee_id != current_user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        if ticket.status not in [Ticket.Status.PENDING, Ticket.Status.CONFIRMED]:
+        # Only the request whose UPDATE flips the status releases inventory,
+        # so concurrent cancels cannot return the same ticket to sale twice
+        cancelled = db.session.execute(
+            db.update(Ticket)
+            .where(Ticket.id == ticket.id, Ticket.status.in_([Ticket.Status.PENDING, Ticket.Status.CONFIRMED]))
+            .values(status=Ticket.Status.CANCELLED, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if cancelled != 1:
+            db.session.rollback()
             return jsonify({'error': 'Cannot cancel this ticket'}), 400
-        
-        ticket.status = Ticket.Status.CANCELLED
-        
-        # Update ticket type sold count
-        ticket.ticket_type.sold -= 1
-        
+
+        # Return the ticket's inventory to sale; ``ticket`` still has its old status
+        release_for_tickets([ticket])
         db.session.commit()
+        db.session.refresh(ticket)
         
         return jsonify({
             'message': 'Ticket cancelled successfully',
@@ -193,7 +193,7 @@ def cancel_ticket(ticket_id):
 @tickets_bp.route('/<ticket_id>/download', methods=['GET'])
 @jwt_required()
 def download_ticket(ticket_id):
-    """Download ticket data (with QR code, generated on-the-fly if needed)"""
+    """Download ticket data; the QR image is fetched from ``qr_url``"""
     try:
         current_user_id = get_jwt_identity()
         ticket = db.session.get(Ticket, ticket_id)
@@ -204,24 +204,6 @@ def download_ticket(ticket_id):
         if ticket.attendee_id != current_user_id:
             return jsonify({'error': 'Unauthorized'}), 403
 
-        # Generate / refresh QR code if missing or is a plain URL (not base64)
-        need_qr = (
-            not ticket.qr_code or
-            ticket.qr_code.startswith('http') or
-            ticket.qr_code.startswith('https')
-        )
-        if need_qr:
-            try:
-                import qrcode, io, base64
-                qr_content = f"TICKET:{ticket.ticket_number}|EVENT:{ticket.event_id}"
-                qr_img = qrcode.make(qr_content)
-                buf = io.BytesIO()
-                qr_img.save(buf, format='PNG')
-                ticket.qr_code = base64.b64encode(buf.getvalue()).decode()
-                db.session.commit()
-            except Exception as qr_err:
-                current_app.logger.error(f"[QR GEN ERROR] {qr_err}")
-
         ticket_data = ticket.to_dict()
         return jsonify(ticket_data), 200
 
@@ -229,6 +211,49 @@ def download_ticket(ticket_id):
         return jsonify({'error': str(e)}), 500
 
 
+def _valid_qr_signature(ticket_id, digest):
+    sig = request.args.get('sig', '')
+    keys = [current_app.config['TICKET_SIGNING_KEY']]
+    keys.extend(current_app.config.get('TICKET_SIGNING_PREVIOUS_KEYS') or [])
+    return any(hmac.compare_digest(sig, url_signature(key, ticket_id, digest)) for key in keys)
+
+
+@tickets_bp.route('/<ticket_id>/qr/<digest>.png', methods=['GET'])
+def ticket_qr_image(ticket_id, digest):
+    """Ticket QR code as PNG
+
+    The URL names the content hash of the ticket's QR payload and is signed
+    for this ticket, so only someone who was given the URL can fetch it and
+    its bytes never change: responses carry a strong ETag and are cacheable
+    as immutable.
+    """
+    try:
+        if not re.fullmatch(r'[0-9a-f]{32}', digest) or not _valid_qr_signature(ticket_id, digest):
+            return jsonify({'error': 'QR code not found'}), 404
+
+        etag = digest
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            png = qr_cache.get(digest)
+            if png is None:
+                ticket = db.session.get(Ticket, ticket_id)
+                if not ticket or content_hash(ticket.qr_payload) != digest:
+                    return jsonify({'error': 'QR code not found'}), 404
+                if not HAS_QR:
+                    return jsonify({'error': 'QR rendering is not available'}), 503
+                _, png = qr_cache.png_for(ticket.qr_payload)
+            response = make_response(png)
+            response.mimetype = 'image/png'
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @tickets_bp.route('/<ticket_id>/email', methods=['POST'])
 @jwt_required()
 def email_ticket(ticket_id):
@@ -244,17 +269,12 @@ def email_ticket(ticket_id):
         if ticket.attendee_id != current_user_id:
             return jsonify({'error': 'Unauthorized'}), 403
 
-        # Reuse existing logic
-        ticket_dict = ticket.to_dict()
-        event_dict = ticket.event.to_dict() if ticket.event else {}
-        
-        success = send_ticket_email(user.email, ticket_dict, event_dict)
-        if success:
-            return jsonify({'message': 'Ticket sent to email successfully'}), 200
-        else:
-            return jsonify({'error': 'Failed to send email'}), 500
+        enqueue_ticket_email(user.email, [ticket])
+        db.session.commit()
+        return jsonify({'message': 'Ticket email queued for delivery'}), 202
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -297,6 +317,148 @@ def validate_ticket(ticket_id):
         return jsonify({'error': str(e)}), 500
 
 
+def _is_gate_staff(event_id=None):
+    """Staff role from the token claims; organizers only for their own events"""
+    role = get_jwt().get('role')
+    if role not in [User.Role.ORGANIZER, User.Role.ADMIN, User.Role.SUPER_ADMIN]:
+        return False
+    return event_id is None or role != User.Role.ORGANIZER or gate_memory.event_organizer(event_id) == get_jwt_identity()
+
+
+@tickets_bp.route('/gate-bundle/<event_id>', methods=['GET'])
+@jwt_required()
+def get_gate_bundle(event_id):
+    """
+    Offline validation set for an event's scanners (for event staff).
+
+    Pass ``?since=<version>`` with the version of the bundle the scanner
+    holds to get only the tickets changed since.
+    """
+    try:
+        if not _is_gate_staff(event_id):
+            return jsonify({'error': 'You can only validate tickets for your events'}), 403
+
+        since = request.args.get('since', type=int)
+        version, bundle, count = build_bundle(event_id, since)
+
+        response = make_response(bundle)
+        response.mimetype = 'application/octet-stream'
+        response.headers['X-Gate-Bundle-Version'] = str(version)
+        response.headers['X-Gate-Bundle-Entries'] = str(count)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@tickets_bp.route('/scan', methods=['POST'])
+@jwt_required()
+def scan_ticket():
+    """
+    Check a QR code at the gate (for event staff).
+
+    Signed codes are verified without reading the ticket; the scan is
+    logged and the ticket marked used in the background. ``duplicate`` is a
+    hint from this server's recent scans; the log decides which scan wins.
+    """
+    try:
+        if not _is_gate_staff():
+            return jsonify({'error': 'Only event staff can validate tickets'}), 403
+
+        data = request.get_json() or {}
+        code = data.get('code')
+        device_id = data.get('device_id')
+        if not code or not device_id:
+            return jsonify({'error': 'code and device_id are required'}), 400
+        # Devices replaying scans made offline send the time of the scan
+        scanned_at = datetime.utcnow()
+        if data.get('scanned_at'):
+            try:
+                scanned_at = parse_scan_time(data['scanned_at'])
+            except ValueError:
+                return jsonify({'error': 'scanned_at must be an ISO 8601 timestamp'}), 400
+
+        if is_ticket_token(code):
+            try:
+                ticket = verify_ticket_token(code, scanned_at)
+            except InvalidTicketToken as e:
+                return jsonify({'valid': False, 'error': e.reason}), 400
+        else:
+            # Codes issued before tickets were signed are checked against the
+            # database, and only while they are still the ticket's own code:
+            # anyone who knows a ticket number can write one of these
+            match = re.fullmatch(r'TICKET:([^|]+)\|EVENT:(.+)', code)
+            row = Ticket.query.filter_by(ticket_number=match.group(1), event_id=match.group(2)).first() if match else None
+            if not row or row.qr_code != code or row.status not in [Ticket.Status.CONFIRMED, Ticket.Status.USED]:
+                return jsonify({'valid': False, 'error': 'unknown_ticket'}), 400
+            ticket = {'ticket_number': row.ticket_number, 'event_id': row.event_id, 'tier': '', 'seat': ''}
+
+        if not _is_gate_staff(ticket['event_id']):
+            return jsonify({'error': 'You can only validate tickets for your events'}), 403
+
+        logged = record_scan(
+            ticket['ticket_number'], ticket['event_id'], device_id, scanned_at,
+            gate=data.get('gate'), scanned_by=get_jwt_identity(),
+        )
+        # A device resending a scan it already uploaded is not a second entry
+        duplicate = logged and gate_memory.seen_before(ticket['ticket_number'])
+
+        return jsonify({'valid': True, 'duplicate': duplicate, 'ticket': ticket}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@tickets_bp.route('/scans/batch', methods=['POST'])
+@jwt_required()
+def upload_scans():
+    """
+    Upload scans a scanner buffered while offline (for event staff).
+
+    Body: ``{"event_id": ..., "scans": [{"ticket_number", "scanned_at",
+    "device_id", "gate"?}, ...]}``. Returns one result per scan: applied,
+    duplicate or rejected with a reason. Safe to retry.
+    """
+    try:
+        data = request.get_json() or {}
+        event_id = data.get('event_id')
+        scans = data.get('scans')
+        if not event_id or not isinstance(scans, list):
+            return jsonify({'error': 'event_id and scans are required'}), 400
+        if len(scans) > MAX_BATCH_SCANS:
+            return jsonify({'error': f'At most {MAX_BATCH_SCANS} scans per upload'}), 400
+        if not _is_gate_staff(event_id):
+            return jsonify({'error': 'You can only validate tickets for your events'}), 403
+
+        items = []
+        for i, scan in enumerate(scans):
+            if not scan.get('ticket_number') or not scan.get('device_id') or not scan.get('scanned_at'):
+                return jsonify({'error': f'scans[{i}] needs ticket_number, device_id and scanned_at'}), 400
+            items.append({
+                'ticket_number': scan['ticket_number'],
+                'device_id': scan['device_id'],
+                'gate': scan.get('gate'),
+                'scanned_at': parse_scan_time(scan['scanned_at']),
+            })
+
+        results = ingest_scans(event_id, items, scanned_by=get_jwt_identity())
+        db.session.commit()
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        return jsonify({'results': results, 'summary': summary}), 200
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @tickets_bp.route('/<ticket_id>/transfer', methods=['POST'])
 @jwt_required()
 def transfer_ticket(ticket_id):
@@ -342,17 +504,10 @@ def transfer_ticket(ticket_id):
             db.session.add(recipient)
             db.session.flush() # Get the player ID
             
-        # Perform transfer
+        # Perform transfer and notify the recipient by email
         ticket.attendee_id = recipient.id
+        enqueue_ticket_email(recipient_email, [ticket])
         db.session.commit()
-
-        # Notify recipient by email
-        try:
-            ticket_dict = ticket.to_dict()
-            event_dict = ticket.event.to_dict() if ticket.event else {}
-            send_ticket_email(recipient_email, ticket_dict, event_dict)
-        except Exception as email_err:
-            current_app.logger.error(f"[TRANSFER EMAIL ERROR] {email_err}")
         
         return jsonify({
             'message': f'Ticket transferred successfully to {recipient_email}',
@@ -366,6 +521,7 @@ def transfer_ticket(ticket_id):
 
 
 @tickets_bp.route('/quick-purchase', methods=['POST'])
+@idempotent
 def quick_purchase():
     """Create a ticket quickly with seat selection and QR code"""
     try:
@@ -404,12 +560,16 @@ def quick_purchase():
         # Handle seat selection if provided
         seat = None
         if seat_id:
-            seat = db.session.get(Seat, seat_id)
+            seat = db.session.get(Seat, resolve_seat_ids([seat_id])[0])
             if not seat:
                 return jsonify({'error': 'Seat not found'}), 404
+            if seats_outside_event(event.id, [seat.id]):
+                db.session.rollback()
+                return jsonify({'error': "Seat is not at this event's venue"}), 400
             if seat.status != Seat.Status.AVAILABLE and seat.status != Seat.Status.RESERVED:
                 return jsonify({'error': 'Seat is already taken'}), 400
             seat.status = Seat.Status.SOLD
+            record_seat_changes([seat.id], event_id=event.id)
 
         # Find a default ticket type for the event
         ticket_type = event.ticket_types.first()
@@ -425,6 +585,10 @@ def quick_purchase():
             db.session.add(ticket_type)
             db.session.flush()
 
+        if not reserve_tickets(ticket_type, 1):
+            db.session.rollback()
+            return jsonify({'error': 'Tickets for this event are sold out'}), 400
+
         # Create ticket
         ticket = Ticket(
             event_id=event.id,
@@ -436,30 +600,17 @@ def quick_purchase():
             status=Ticket.Status.CONFIRMED
         )
         
-        # Generate QR code
-        qr_data = f"TICKET:{ticket.ticket_number}|EVENT:{event.title}|USER:{email}"
-        if HAS_QR:
-            import qrcode
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            img = qr.make_image(fill_color="black", back_color="white")
-            img_io = io.BytesIO()
-            img.save(img_io, 'PNG')
-            img_io.seek(0)
-            ticket.qr_code = base64.b64encode(img_io.getvalue()).decode()
+        issue_ticket_token(ticket)
         
         db.session.add(ticket)
-        ticket_type.sold += 1
+        # Ticket confirmation email, sent by the outbox worker
+        enqueue_ticket_email(email, [ticket])
         db.session.commit()
         
-        # Send ticket confirmation email
         ticket_dict = ticket.to_dict()
-        event_dict = event.to_dict()
-        send_ticket_email(email, ticket_dict, event_dict)
         
         return jsonify({
-            'message': 'Ticket created and email sent successfully',
+            'message': 'Ticket created and email queued successfully',
             'ticket': ticket_dict
         }), 201
 
@@ -0,0 +1,264 @@
+"""
+Event broadcasts.
+An organizer's message (a time change, gate information, a cancellation) is
+emailed to everyone holding a ticket to the event. Recipients are streamed a
+keyset page at a time, one row per attendee however many tickets they hold,
+so memory stays flat however large the event is.
+
+The message is rendered once per broadcast; each recipient only adds a To
+header. A pool of BROADCAST_CONNECTIONS threads, each with its own SMTP
+session, sends it at no more than BROADCAST_RATE_PER_SECOND overall. After
+every page the job checkpoints the last attendee id it finished, so a
+resumed broadcast starts from the next page. Only the page in flight at the
+time of a crash can be sent twice.
+"""
+import html
+import logging
+import queue
+import threading
+import time
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from flask import current_app
+from app.models import db, Event, Ticket, User
+from app.utils.email import SMTP_FROM, SMTPConnection
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'event_broadcast'
+DEFAULT_PAGE_SIZE = 1000
+# A running broadcast that has not checkpointed for this long is presumed
+# dead, or for three pages' worth of sending if that is longer
+STALE_SECONDS = 600
+# Holders of these tickets hear about the event; pending orders are not theirs yet
+RECIPIENT_STATUSES = (Ticket.Status.CONFIRMED, Ticket.Status.USED)
+# Failed addresses kept in the job result for the organizer to follow up
+MAX_REPORTED_FAILURES = 100
+
+# variant: (heading, accent colour)
+VARIANTS = {
+    'general': ('Event update', '#026CDF'),
+    'time_change': ('Schedule change', '#d97706'),
+    'gate_info': ('Gate information', '#026CDF'),
+    'cancellation': ('Event cancelled', '#dc2626'),
+}
+
+
+def _recipients_query(event_id):
+    holders = db.select(Ticket.attendee_id).where(Ticket.event_id == event_id, Ticket.status.in_(RECIPIENT_STATUSES))
+    return db.select(User.id, User.email).where(User.id.in_(holders))
+
+
+def count_recipients(event_id):
+    return db.session.execute(
+        db.select(db.func.count()).select_from(_recipients_query(event_id).subquery())
+    ).scalar()
+
+
+def recipient_pages(event_id, page_size=DEFAULT_PAGE_SIZE, after=''):
+    """Yield lists of ``(user_id, email)`` in user id order, starting after ``after``"""
+    while True:
+        rows = db.session.execute(
+            _recipients_query(event_id).where(User.id > after).order_by(User.id.asc()).limit(page_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1].id
+
+
+def render_broadcast(event, variant, subject, message):
+    """The message as serialized text, minus its To header"""
+    heading, colour = VARIANTS[variant]
+    paragraphs = ''.join(
+        f'<p style="color:#333; font-size:15px; line-height:1.6;">{html.escape(line)}</p>'
+        for line in message.splitlines() if line.strip()
+    )
+    start = event.start_date.strftime('%A %d %B %Y, %H:%M') if event.start_date else 'TBD'
+    html_body = f"""
+<!DOCTYPE html>
+<html>
+<head><meta charset="UTF-8" /></head>
+<body style="font-family: Arial, sans-serif; background:#f0f2f5; margin:0; padding:20px;">
+  <div style="max-width:560px; margin:0 auto; background:#fff; border-radius:16px; overflow:hidden;">
+    <div style="background:{colour}; color:#fff; padding:32px; text-align:center;">
+      <h1 style="margin:0; font-size:24px; font-weight:900;">{heading}</h1>
+      <p style="margin:6px 0 0; opacity:0.8; font-size:14px;">{html.escape(event.title)}</p>
+    </div>
+    <div style="padding:32px;">
+      {paragraphs}
+      <div style="margin-top:24px; background:#f8fafc; border-radius:8px; padding:16px;">
+        <p style="margin:4px 0; font-size:13px; color:#555;">📍 <strong>Location:</strong> {html.escape(event.location or 'TBD')}</p>
+        <p style="margin:4px 0; font-size:13px; color:#555;">📅 <strong>Date:</strong> {start}</p>
+      </div>
+    </div>
+    <div style="text-align:center; padding:20px; background:#f8fafc; color:#aaa; font-size:12px;">
+      You are receiving this because you hold a ticket to this event.<br/>
+      Ticket Master &copy; 2026
+    </div>
+  </div>
+</body>
+</html>
+"""
+    msg = MIMEText(html_body, 'html', 'utf-8')
+    msg['From'] = SMTP_FROM
+    msg['Subject'] = Header(subject, 'utf-8')
+    msg['Date'] = formatdate(usegmt=True)
+    return msg.as_string()
+
+
+class TokenBucket:
+    """Blocking rate limiter shared by the sender threads; a rate of 0 is unlimited"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SendPipeline:
+    """Sender threads fed from a bounded queue, one SMTP session per thread"""
+
+    def __init__(self, rendered, connections, rate, idle_seconds=60):
+        self.rendered = rendered
+        self.bucket = TokenBucket(rate)
+        self.sent = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=connections * 100)
+        self._threads = [
+            threading.Thread(target=self._run, args=(SMTPConnection(idle_seconds),), name=f'broadcast-{i}', daemon=True)
+            for i in range(connections)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, connection):
+        while True:
+            email = self._queue.get()
+            try:
+                if email is None:
+                    connection.close()
+                    return
+                self._send(connection, email)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, connection, email):
+        data = f'To: {email}\nMessage-ID: {make_msgid()}\n' + self.rendered
+        for attempt in range(2):
+            self.bucket.acquire()
+            try:
+                connection.send_raw(email, data)
+                with self._lock:
+                    self.sent += 1
+                return
+            except Exception as e:
+                # One retry on a fresh session; then the address is reported
+                connection.close()
+                if attempt:
+                    logger.warning(f"[BROADCAST] Failed to send to {email}: {e}")
+                    with self._lock:
+                        self.failed.append(email)
+
+    def submit(self, email):
+        self._queue.put(email)
+
+    def drain(self):
+        """Wait until everything submitted so far has been sent or failed"""
+        self._queue.join()
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def stale_seconds(config):
+    """How long a healthy broadcast can go between checkpoints, with margin"""
+    rate = config.get('BROADCAST_RATE_PER_SECOND', 50)
+    if rate <= 0:
+        return STALE_SECONDS
+    return max(STALE_SECONDS, 3 * config.get('BROADCAST_PAGE_SIZE', DEFAULT_PAGE_SIZE) / rate)
+
+
+def broadcast_event(event_id, variant, subject, message, config, checkpoint=None, on_page=None):
+    """
+    Email ``event_id``'s ticket holders; returns totals and throughput.
+
+    ``checkpoint`` is a previous run's ``{'after', 'sent', 'failed', 'skipped'}``.
+    ``on_page(progress, checkpoint)`` is called after each page has been sent.
+    """
+    event = db.session.get(Event, event_id)
+    if not event:
+        raise ValueError('Event not found')
+    rendered = render_broadcast(event, variant, subject, message)
+    checkpoint = {'after': '', 'sent': 0, 'failed': 0, 'skipped': 0, **(checkpoint or {})}
+    started = time.perf_counter()
+    pipeline = SendPipeline(
+        rendered,
+        max(config.get('BROADCAST_CONNECTIONS', 4), 1),
+        config.get('BROADCAST_RATE_PER_SECOND', 50),
+        config.get('SMTP_IDLE_SECONDS', 60),
+    )
+    sent_before = checkpoint['sent']
+    failed = []
+    try:
+        for page in recipient_pages(event_id, config.get('BROADCAST_PAGE_SIZE', DEFAULT_PAGE_SIZE), checkpoint['after']):
+            for row in page:
+                # Never put a header-breaking address into the raw message
+                if not row.email or '\n' in row.email or '\r' in row.email:
+                    checkpoint['skipped'] += 1
+                    continue
+                pipeline.submit(row.email)
+            pipeline.drain()
+            failed.extend(pipeline.failed[:MAX_REPORTED_FAILURES - len(failed)])
+            checkpoint['failed'] += len(pipeline.failed)
+            pipeline.failed = []
+            checkpoint['sent'] = sent_before + pipeline.sent
+            checkpoint['after'] = page[-1].id
+            if on_page:
+                on_page(checkpoint['sent'] + checkpoint['failed'] + checkpoint['skipped'], dict(checkpoint))
+    finally:
+        pipeline.close()
+
+    wall = time.perf_counter() - started
+    sent_now = checkpoint['sent'] - sent_before
+    return {
+        'event_id': event_id,
+        'variant': variant,
+        'sent': checkpoint['sent'],
+        'failed': checkpoint['failed'],
+        'skipped': checkpoint['skipped'],
+        'failed_recipients': failed,
+        'wall_seconds': round(wall, 3),
+        'emails_per_second': round(sent_now / wall, 1) if sent_now and wall else None,
+    }
+
+
+def broadcast_job(report, event_id, variant, subject, message, checkpoint=None):
+    """Background job target: progress is recipients handled, checkpointed per page"""
+
+    def on_page(done, checkpoint):
+        report(done, checkpoint=checkpoint)
+        db.session.commit()
+
+    return broadcast_event(event_id, variant, subject, message, current_app.config, checkpoint, on_page)
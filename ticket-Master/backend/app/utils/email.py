@@ -1,15 +1,20 @@
 """
-Email utility for sending ticket confirmation emails.
+Email utility for building and sending ticket confirmation emails.
 Uses Python's built-in smtplib. Configure SMTP settings in .env.
 If SMTP is not configured, emails are simulated (logged to console).
+
+Request handlers do not send mail themselves; they queue it with
+app/utils/email_outbox.py and the outbox worker sends it over an
+SMTPConnection.
 """
 import smtplib
 import os
-import base64
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
 import logging
+from app.utils.qr import HAS_QR, cache as qr_cache
 
 logger = logging.getLogger(__name__)
 
@@ -19,23 +24,111 @@ SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
 SMTP_USER = os.environ.get('SMTP_USER', '')
 SMTP_PASS = os.environ.get('SMTP_PASS', '')
 SMTP_FROM = os.environ.get('SMTP_FROM', SMTP_USER or 'noreply@ticketmaster.com')
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+
+
+class SMTPConnection:
+    """
+    One SMTP session reused across messages.
+
+    The handshake (connect, STARTTLS, login) happens once rather than per
+    message. A session the server dropped is reopened once before giving up,
+    and one idle for longer than ``idle_seconds`` is closed.
+    """
+
+    def __init__(self, idle_seconds=60):
+        self.idle_seconds = idle_seconds
+        self.connects = 0
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        server.login(SMTP_USER, SMTP_PASS)
+        self._server = server
+        self.connects += 1
+
+    def send(self, msg):
+        """Send ``msg`` to its To address; raises on failure"""
+        if not SMTP_HOST or not SMTP_USER:
+            logger.info(f"[EMAIL SIMULATED] No SMTP configured. Would send to: {msg['To']}")
+            logger.info(f"[EMAIL SIMULATED] Subject: {msg['Subject']}")
+            return
+        self.send_raw(msg['To'], msg.as_string())
+        logger.info(f"[EMAIL] Successfully sent to {msg['To']}")
+
+    def send_raw(self, recipient_email, data):
+        """Send an already serialized message; raises on failure"""
+        if not SMTP_HOST or not SMTP_USER:
+            logger.debug(f"[EMAIL SIMULATED] Would send to: {recipient_email}")
+            return
+        for attempt in range(2):
+            if self._server is None:
+                self._connect()
+            try:
+                self._server.sendmail(SMTP_FROM, recipient_email, data)
+                break
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt:
+                    raise
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+def _ticket_section(ticket: dict, cid: str) -> str:
+    seat = ticket.get('seat_details') or {}
+    return f"""
+      <div class="ticket-num">TICKET # {ticket.get('ticket_number', 'N/A')}</div>
+      {f'<div class="qr-wrap"><img src="cid:{cid}" alt="QR Code" /></div>' if cid else ''}
+      <div class="details">
+        <div class="detail-item">
+          <p>Section</p>
+          <p>{seat.get('section', '-')}</p>
+        </div>
+        <div class="detail-item">
+          <p>Row</p>
+          <p>{seat.get('row', '-')}</p>
+        </div>
+        <div class="detail-item">
+          <p>Seat</p>
+          <p>{seat.get('seat_number', '-')}</p>
+        </div>
+      </div>"""
 
 
-def send_ticket_email(recipient_email: str, ticket: dict, event: dict) -> bool:
+def build_ticket_email(recipient_email: str, tickets: list, event: dict) -> MIMEMultipart:
     """
-    Send a ticket confirmation email with the QR code embedded.
-    Returns True on success, False on failure.
+    Ticket confirmation email for all of an order's tickets, with each
+    ticket's QR code embedded.
     """
-    try:
-        seat = ticket.get('seat_details') or {}
-        ticket_number = ticket.get('ticket_number', 'N/A')
-        event_title = event.get('title', ticket.get('event_title', 'Event'))
-        event_location = event.get('location', 'TBD')
-        event_date = event.get('start_date', 'TBD')
-        price = ticket.get('price', 0)
-        qr_b64 = ticket.get('qr_code', '')
-
-        html_body = f"""
+    first = tickets[0] if tickets else {}
+    event_title = event.get('title', first.get('event_title', 'Event'))
+    event_location = event.get('location', 'TBD')
+    event_date = event.get('start_date', 'TBD')
+    total = sum(ticket.get('price') or 0 for ticket in tickets)
+    payloads = [ticket.get('qr_code', '') if HAS_QR else '' for ticket in tickets]
+    sections = '\n      <div style="height:24px;"></div>'.join(
+        _ticket_section(ticket, f'qrcode{i}' if payload else '')
+        for i, (ticket, payload) in enumerate(zip(tickets, payloads))
+    )
+
+    html_body = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -60,37 +153,22 @@ def send_ticket_email(recipient_email: str, ticket: dict, event: dict) -> bool:
 <body>
   <div class="card">
     <div class="header">
-      <h1>🎟 Your Ticket is Confirmed!</h1>
+      <h1>🎟 Your {'Tickets are' if len(tickets) > 1 else 'Ticket is'} Confirmed!</h1>
       <p>{event_title}</p>
     </div>
     <div class="body">
       <div style="text-align:center;">
         <span class="badge">✓ CONFIRMED</span>
       </div>
-      <div class="ticket-num">TICKET # {ticket_number}</div>
-      {'<div class="qr-wrap"><img src="cid:qrcode" alt="QR Code" /></div>' if qr_b64 else ''}
-      <div class="details">
-        <div class="detail-item">
-          <p>Section</p>
-          <p>{seat.get('section', '-')}</p>
-        </div>
-        <div class="detail-item">
-          <p>Row</p>
-          <p>{seat.get('row', '-')}</p>
-        </div>
-        <div class="detail-item">
-          <p>Seat</p>
-          <p>{seat.get('seat_number', '-')}</p>
-        </div>
-      </div>
+      {sections}
       <div style="margin-top:24px; background:#f8fafc; border-radius:8px; padding:16px;">
         <p style="margin:4px 0; font-size:13px; color:#555;">📍 <strong>Location:</strong> {event_location}</p>
         <p style="margin:4px 0; font-size:13px; color:#555;">📅 <strong>Date:</strong> {event_date}</p>
-        <p style="margin:4px 0; font-size:13px; color:#555;">💰 <strong>Price Paid:</strong> ${price:.2f}</p>
+        <p style="margin:4px 0; font-size:13px; color:#555;">💰 <strong>Price Paid:</strong> ${total:.2f}</p>
       </div>
     </div>
     <div class="footer">
-      Please present this ticket (or QR code) at the gate.<br/>
+      Please present {'these tickets' if len(tickets) > 1 else 'this ticket'} (or QR code) at the gate.<br/>
       Ticket Master &copy; 2026
     </div>
   </div>
@@ -98,48 +176,32 @@ def send_ticket_email(recipient_email: str, ticket: dict, event: dict) -> bool:
 </html>
         """
 
-        # Log to console regardless (useful for debugging)
-        logger.info(f"[EMAIL] Sending ticket {ticket_number} to {recipient_email}")
+    msg = MIMEMultipart('related')
+    msg['From'] = SMTP_FROM
+    msg['To'] = recipient_email
+    if len(tickets) == 1:
+        msg['Subject'] = f"Your Ticket - {event_title} | #{first.get('ticket_number', 'N/A')}"
+    else:
+        msg['Subject'] = f"Your {len(tickets)} Tickets - {event_title}"
 
-        # If SMTP is not configured, just simulate
-        if not SMTP_HOST or not SMTP_USER:
-            logger.info(f"[EMAIL SIMULATED] No SMTP configured. Would send to: {recipient_email}")
-            logger.info(f"[EMAIL SIMULATED] Subject: Your Ticket - {event_title}")
-            return True
-
-        msg = MIMEMultipart('related')
-        msg['From'] = SMTP_FROM
-        msg['To'] = recipient_email
-        msg['Subject'] = f"Your Ticket - {event_title} | #{ticket_number}"
-
-        msg.attach(MIMEText(html_body, 'html'))
-
-        # Attach QR code image if available
-        if qr_b64:
-            qr_bytes = base64.b64decode(qr_b64)
-            img = MIMEImage(qr_bytes, _subtype='png')
-            img.add_header('Content-ID', '<qrcode>')
-            img.add_header('Content-Disposition', 'inline', filename='ticket-qr.png')
-            msg.attach(img)
-
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(SMTP_FROM, recipient_email, msg.as_string())
-
-        logger.info(f"[EMAIL] Successfully sent to {recipient_email}")
-        return True
-
-    except Exception as e:
-        logger.error(f"[EMAIL ERROR] Failed to send to {recipient_email}: {e}")
-        return False
-
-
-def send_welcome_email(recipient_email: str, first_name: str) -> bool:
-    """Send a welcome email to a new user who registered via Google OAuth."""
-    try:
-        html_body = f"""
+    msg.attach(MIMEText(html_body, 'html'))
+
+    # Attach each ticket's QR code image
+    for i, payload in enumerate(payloads):
+        if not payload:
+            continue
+        _, qr_bytes = qr_cache.png_for(payload)
+        img = MIMEImage(qr_bytes, _subtype='png')
+        img.add_header('Content-ID', f'<qrcode{i}>')
+        img.add_header('Content-Disposition', 'inline', filename=f'ticket-qr-{i + 1}.png')
+        msg.attach(img)
+
+    return msg
+
+
+def build_welcome_email(recipient_email: str, first_name: str) -> MIMEMultipart:
+    """Welcome email for a new user who registered via Google OAuth."""
+    html_body = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -177,27 +239,9 @@ def send_welcome_email(recipient_email: str, first_name: str) -> bool:
 </html>
         """
 
-        logger.info(f"[EMAIL] Welcome email to {recipient_email}")
-
-        if not SMTP_HOST or not SMTP_USER:
-            logger.info(f"[EMAIL SIMULATED] Welcome email would be sent to {recipient_email}")
-            return True
-
-        msg = MIMEMultipart('related')
-        msg['From'] = SMTP_FROM
-        msg['To'] = recipient_email
-        msg['Subject'] = "Welcome to Ticket Master 🎟"
-        msg.attach(MIMEText(html_body, 'html'))
-
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(SMTP_FROM, recipient_email, msg.as_string())
-
-        logger.info(f"[EMAIL] Welcome sent to {recipient_email}")
-        return True
-
-    except Exception as e:
-        logger.error(f"[EMAIL ERROR] Welcome email failed for {recipient_email}: {e}")
-        return False
+    msg = MIMEMultipart('related')
+    msg['From'] = SMTP_FROM
+    msg['To'] = recipient_email
+    msg['Subject'] = "Welcome to Ticket Master 🎟"
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
@@ -0,0 +1,221 @@
+"""
+Email outbox.
+Request handlers never wait on SMTP: they add an EmailOutbox row in the same
+transaction as the change the mail is about, so a committed order always has
+its email queued and checkout latency does not depend on the mail server.
+
+Worker threads (EMAIL_WORKER_CONNECTIONS of them, each holding one
+persistent SMTP session) claim due rows, build the message from the current
+ticket state and send it. Failures are retried with exponential backoff up
+to EMAIL_MAX_ATTEMPTS. Claims use SKIP LOCKED, so any number of API or
+dedicated worker processes (tools/email_worker.py) can share the outbox.
+"""
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from app.models import db, EmailOutbox, Event, Ticket
+from app.utils.email import SMTPConnection, build_ticket_email, build_welcome_email
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+RETRY = 'retry'
+# A claimed message is handed out again after this long, in case its worker died
+CLAIM_SECONDS = 300
+
+
+def enqueue_ticket_email(recipient, tickets):
+    """Queue one email carrying every ticket in ``tickets``; the caller commits"""
+    if not tickets:
+        return None
+    db.session.flush()
+    entry = EmailOutbox(
+        kind=EmailOutbox.Kind.TICKETS,
+        recipient=recipient,
+        payload={'ticket_ids': [ticket.id for ticket in tickets]},
+    )
+    db.session.add(entry)
+    return entry
+
+
+def enqueue_welcome_email(recipient, first_name):
+    """Queue a welcome email; the caller commits"""
+    entry = EmailOutbox(kind=EmailOutbox.Kind.WELCOME, recipient=recipient, payload={'first_name': first_name})
+    db.session.add(entry)
+    return entry
+
+
+def build_message(entry):
+    if entry.kind == EmailOutbox.Kind.WELCOME:
+        return build_welcome_email(entry.recipient, entry.payload.get('first_name') or '')
+
+    ticket_ids = entry.payload.get('ticket_ids') or []
+    tickets = Ticket.query.options(*Ticket.listing_options()).filter(Ticket.id.in_(ticket_ids)).all()
+    if not tickets:
+        raise ValueError('tickets no longer exist')
+    tickets.sort(key=lambda t: ticket_ids.index(t.id))
+    event = db.session.get(Event, tickets[0].event_id)
+    return build_ticket_email(entry.recipient, [t.to_dict() for t in tickets], event.to_dict() if event else {})
+
+
+def retry_delay(attempts, base_seconds, max_seconds):
+    """Backoff before attempt ``attempts + 1``: doubling, capped, with 20% jitter"""
+    delay = min(base_seconds * 2 ** (attempts - 1), max_seconds)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_due(limit, now=None):
+    """Claim up to ``limit`` due messages for this worker and commit the claim"""
+    now = now or datetime.utcnow()
+    candidates = db.session.execute(
+        db.select(EmailOutbox.id)
+        .where(EmailOutbox.status == EmailOutbox.Status.PENDING, EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not candidates:
+        db.session.rollback()
+        return []
+    # Conditional, so a row another thread claimed in the meantime is skipped
+    claimed = db.session.execute(
+        db.update(EmailOutbox)
+        .where(
+            EmailOutbox.id.in_(candidates),
+            EmailOutbox.status == EmailOutbox.Status.PENDING,
+            EmailOutbox.next_attempt_at <= now,
+        )
+        .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS))
+        .returning(EmailOutbox.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.created_at).all()
+
+
+def deliver(entry, connection, config, now=None):
+    """Send one claimed message and record the outcome; returns its new status"""
+    try:
+        connection.send(build_message(entry))
+    except Exception as e:
+        db.session.rollback()
+        now = now or datetime.utcnow()
+        entry.last_error = str(e)[:1000]
+        if entry.attempts >= config.get('EMAIL_MAX_ATTEMPTS', 8):
+            entry.status = EmailOutbox.Status.FAILED
+            logger.error(f"[EMAIL FAILED] {entry.kind} to {entry.recipient} after {entry.attempts} attempts: {e}")
+        else:
+            entry.next_attempt_at = now + timedelta(seconds=retry_delay(
+                entry.attempts,
+                config.get('EMAIL_RETRY_BASE_SECONDS', 30),
+                config.get('EMAIL_RETRY_MAX_SECONDS', 3600),
+            ))
+            logger.warning(f"[EMAIL RETRY] {entry.kind} to {entry.recipient} (attempt {entry.attempts}): {e}")
+        db.session.commit()
+        return EmailOutbox.Status.FAILED if entry.status == EmailOutbox.Status.FAILED else RETRY
+
+    entry.status = EmailOutbox.Status.SENT
+    entry.sent_at = datetime.utcnow()
+    entry.last_error = None
+    db.session.commit()
+    return entry.status
+
+
+def deliver_due(connection, config, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Claim and send one batch; returns ``{outcome: count}``"""
+    counts = {}
+    for entry in claim_due(batch_size, now):
+        outcome = deliver(entry, connection, config, now)
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+
+class OutboxWorker:
+    """Background threads that send the email outbox, one SMTP session each"""
+
+    def __init__(self):
+        self.app = None
+        self._threads = []
+        self._connections = []
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'sent_total': 0,
+            'retried_total': 0,
+            'failed_total': 0,
+            'batches': 0,
+            'errors': 0,
+            'last_tick_at': None,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.connections = max(app.config.get('EMAIL_WORKER_CONNECTIONS', 2), 1)
+        self.interval_seconds = app.config.get('EMAIL_POLL_INTERVAL_SECONDS', 1.0)
+        self.idle_seconds = app.config.get('SMTP_IDLE_SECONDS', 60)
+        self.start()
+
+    def start(self):
+        # Threads do not survive a fork, so (re)start in whichever process we are in
+        if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._connections = [SMTPConnection(self.idle_seconds) for _ in range(self.connections)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(connection,), name=f'email-outbox-{i}', daemon=True)
+            for i, connection in enumerate(self._connections)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, connection):
+        while not self._stop.wait(self.interval_seconds):
+            with self.app.app_context():
+                try:
+                    self.tick(connection)
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    logger.error(f"[EMAIL OUTBOX ERROR] {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            connection.close_if_idle()
+        connection.close()
+
+    def tick(self, connection):
+        """Send due messages until a batch comes back short"""
+        self._metrics['last_tick_at'] = datetime.utcnow().isoformat()
+        while not self._stop.is_set():
+            counts = deliver_due(connection, self.app.config)
+            if not counts:
+                break
+            with self._lock:
+                self._metrics['batches'] += 1
+                self._metrics['sent_total'] += counts.get(EmailOutbox.Status.SENT, 0)
+                self._metrics['retried_total'] += counts.get(RETRY, 0)
+                self._metrics['failed_total'] += counts.get(EmailOutbox.Status.FAILED, 0)
+            if sum(counts.values()) < DEFAULT_BATCH_SIZE:
+                break
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['smtp_connects'] = sum(c.connects for c in self._connections)
+        stats['threads'] = sum(t.is_alive() for t in self._threads)
+        return stats
+
+
+worker = OutboxWorker()
@@ -0,0 +1,272 @@
+"""
+General admission inventory.
+Ticket type counters only move through conditional UPDATEs
+(``sold + n <= quantity``), so concurrent buyers can never oversell and a
+purchase costs one statement instead of a locked read-modify-write.
+
+Hot ticket types can be split into shards: each TicketTypeShard owns a slice
+of the quantity and its own sold counter. Buyers start at a random shard, so
+an on-sale spreads over N rows instead of queueing on one; the shards are
+summed for display.
+
+The shard count is read from the database on every claim and release, and
+the unsharded counter only moves while the count is 0, so a concurrent
+set_shard_count can never leave a purchase counted on the wrong row.
+"""
+import random
+from datetime import datetime
+from app.models import db, Ticket, TicketType, TicketTypeShard
+
+# Ticket statuses that occupy inventory
+ACTIVE_STATUSES = (Ticket.Status.PENDING, Ticket.Status.CONFIRMED, Ticket.Status.USED)
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _take(model, where, quantity):
+    result = db.session.execute(
+        db.update(model)
+        .where(*where, model.sold + quantity <= model.quantity)
+        .values(sold=model.sold + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _give_back(model, where, quantity):
+    result = db.session.execute(
+        db.update(model)
+        .where(*where, model.sold >= quantity)
+        .values(sold=model.sold - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _shard_where(ticket_type_id, shard):
+    return [TicketTypeShard.ticket_type_id == ticket_type_id, TicketTypeShard.shard == shard]
+
+
+def _shard_count(ticket_type_id):
+    """The shard count as committed now, not as loaded into the session"""
+    return db.session.execute(
+        db.select(TicketType.shard_count).where(TicketType.id == ticket_type_id)
+    ).scalar() or 0
+
+
+def _unsharded_where(ticket_type_id):
+    return [TicketType.id == ticket_type_id, TicketType.shard_count == 0]
+
+
+def sold_total(ticket_type):
+    """Tickets sold as currently committed, merged across shards"""
+    if ticket_type.shard_count:
+        stmt = db.select(db.func.coalesce(db.func.sum(TicketTypeShard.sold), 0)).where(
+            TicketTypeShard.ticket_type_id == ticket_type.id
+        )
+    else:
+        stmt = db.select(TicketType.sold).where(TicketType.id == ticket_type.id)
+    return db.session.execute(stmt).scalar() or 0
+
+
+def reserve_tickets(ticket_type, quantity):
+    """
+    Count ``quantity`` tickets of ``ticket_type`` as sold, all or nothing.
+
+    Returns False when not enough are left. The caller commits, together
+    with the tickets it creates.
+    """
+    if quantity <= 0:
+        return False
+    for _ in range(2):
+        shard_count = _shard_count(ticket_type.id)
+        if _reserve(ticket_type.id, shard_count, quantity):
+            return True
+        # Sold out, unless the inventory was re-split under us
+        if _shard_count(ticket_type.id) == shard_count:
+            return False
+    return False
+
+
+def _reserve(ticket_type_id, shard_count, quantity):
+    if not shard_count:
+        return _take(TicketType, _unsharded_where(ticket_type_id), quantity)
+
+    start = random.randrange(shard_count)
+    for i in range(shard_count):
+        shard = (start + i) % shard_count
+        if _take(TicketTypeShard, _shard_where(ticket_type_id, shard), quantity):
+            return True
+
+    # No single shard has enough left; gather from several, all or nothing
+    free = db.session.execute(
+        db.select(TicketTypeShard.shard, TicketTypeShard.quantity - TicketTypeShard.sold)
+        .where(TicketTypeShard.ticket_type_id == ticket_type_id, TicketTypeShard.sold < TicketTypeShard.quantity)
+    ).all()
+    if sum(left for _, left in free) < quantity:
+        return False
+    try:
+        with db.session.begin_nested():
+            needed = quantity
+            for shard, left in free:
+                take = min(left, needed)
+                if not _take(TicketTypeShard, _shard_where(ticket_type_id, shard), take):
+                    raise _Shortfall()
+                needed -= take
+                if not needed:
+                    break
+    except _Shortfall:
+        return False
+    return True
+
+
+def release_tickets(ticket_type, quantity):
+    """Return ``quantity`` tickets of ``ticket_type`` to sale; the caller commits"""
+    if quantity <= 0:
+        return True
+    if not _shard_count(ticket_type.id):
+        if _give_back(TicketType, _unsharded_where(ticket_type.id), quantity):
+            return True
+        if not _shard_count(ticket_type.id):
+            return False
+
+    needed = quantity
+    for _ in range(3):
+        held = db.session.execute(
+            db.select(TicketTypeShard.shard, TicketTypeShard.sold)
+            .where(TicketTypeShard.ticket_type_id == ticket_type.id, TicketTypeShard.sold > 0)
+        ).all()
+        random.shuffle(held)
+        for shard, sold in held:
+            give = min(sold, needed)
+            if _give_back(TicketTypeShard, _shard_where(ticket_type.id, shard), give):
+                needed -= give
+                if not needed:
+                    return True
+    return False
+
+
+def release_for_tickets(tickets):
+    """Release inventory held by those of ``tickets`` that are still active
+
+    Call before changing the tickets' status to cancelled or refunded.
+    """
+    counts = {}
+    for ticket in tickets:
+        if ticket.ticket_type_id and ticket.status in ACTIVE_STATUSES:
+            counts[ticket.ticket_type_id] = counts.get(ticket.ticket_type_id, 0) + 1
+    for ticket_type_id, quantity in counts.items():
+        release_tickets(db.session.get(TicketType, ticket_type_id), quantity)
+
+
+def cancel_pending_tickets(payment_ids, now=None):
+    """
+    Cancel the still-pending tickets of ``payment_ids`` and return their inventory.
+
+    The status flips in one conditional UPDATE, so only the caller that
+    cancelled a ticket releases it. Returns how many were cancelled; the
+    caller commits.
+    """
+    if not payment_ids:
+        return 0
+    cancelled = db.session.execute(
+        db.update(Ticket)
+        .where(Ticket.payment_id.in_(list(payment_ids)), Ticket.status == Ticket.Status.PENDING)
+        .values(status=Ticket.Status.CANCELLED, updated_at=now or datetime.utcnow())
+        .returning(Ticket.ticket_type_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    counts = {}
+    for ticket_type_id in cancelled:
+        if ticket_type_id:
+            counts[ticket_type_id] = counts.get(ticket_type_id, 0) + 1
+    for ticket_type_id, quantity in counts.items():
+        release_tickets(db.session.get(TicketType, ticket_type_id), quantity)
+    return len(cancelled)
+
+
+def set_shard_count(ticket_type, shard_count, sold=None):
+    """
+    Re-split ``ticket_type``'s inventory over ``shard_count`` shards (0 to merge).
+
+    ``sold`` overrides the sold total carried over, for repairs. The ticket
+    type and its shards are locked for the rest of the transaction; the
+    caller commits.
+    """
+    db.session.execute(
+        db.select(TicketType.id).where(TicketType.id == ticket_type.id).with_for_update()
+    ).all()
+    db.session.execute(
+        db.select(TicketTypeShard.id).where(TicketTypeShard.ticket_type_id == ticket_type.id).with_for_update()
+    ).all()
+    total = sold_total(ticket_type) if sold is None else sold
+
+    db.session.execute(
+        db.delete(TicketTypeShard)
+        .where(TicketTypeShard.ticket_type_id == ticket_type.id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(ticket_type, ['shards'])
+    ticket_type.sold = total
+    ticket_type.shard_count = shard_count
+
+    unassigned = total
+    created = []
+    for shard in range(shard_count):
+        quantity = ticket_type.quantity // shard_count + (1 if shard < ticket_type.quantity % shard_count else 0)
+        sold_here = min(quantity, unassigned)
+        unassigned -= sold_here
+        created.append(TicketTypeShard(ticket_type_id=ticket_type.id, shard=shard, quantity=quantity, sold=sold_here))
+    if created and unassigned:
+        # Already oversold; keep the excess visible to the consistency check
+        created[-1].sold += unassigned
+    db.session.add_all(created)
+    db.session.flush()
+
+
+def check_ticket_type(ticket_type, repair=False):
+    """
+    Compare ``ticket_type``'s counters with the tickets that hold inventory.
+
+    Returns a report whose ``issues`` is empty when everything agrees. With
+    ``repair`` the counters are reset to the ticket count; the caller commits.
+    """
+    tickets = db.session.execute(
+        db.select(db.func.count(Ticket.id))
+        .where(Ticket.ticket_type_id == ticket_type.id, Ticket.status.in_(ACTIVE_STATUSES))
+    ).scalar()
+    sold = sold_total(ticket_type)
+    shards = db.session.execute(
+        db.select(TicketTypeShard.shard, TicketTypeShard.quantity, TicketTypeShard.sold)
+        .where(TicketTypeShard.ticket_type_id == ticket_type.id)
+        .order_by(TicketTypeShard.shard)
+    ).all()
+
+    issues = []
+    if sold != tickets:
+        issues.append(f'counter says {sold} sold but {tickets} tickets hold inventory')
+    if max(sold, tickets) > ticket_type.quantity:
+        issues.append(f'oversold: {max(sold, tickets)} of {ticket_type.quantity}')
+    if ticket_type.shard_count:
+        if len(shards) != ticket_type.shard_count:
+            issues.append(f'{len(shards)} shard rows for shard_count {ticket_type.shard_count}')
+        if sum(s.quantity for s in shards) != ticket_type.quantity:
+            issues.append(f'shard quantities add up to {sum(s.quantity for s in shards)}, not {ticket_type.quantity}')
+        issues.extend(f'shard {s.shard} sold {s.sold} of {s.quantity}' for s in shards if s.sold > s.quantity)
+
+    report = {
+        'ticket_type_id': ticket_type.id,
+        'quantity': ticket_type.quantity,
+        'sold': sold,
+        'tickets': tickets,
+        'shard_count': ticket_type.shard_count,
+        'shards': [{'shard': s.shard, 'quantity': s.quantity, 'sold': s.sold} for s in shards],
+        'issues': issues,
+        'repaired': False,
+    }
+    if repair and issues:
+        set_shard_count(ticket_type, ticket_type.shard_count, sold=tickets)
+        report['repaired'] = True
+    return report
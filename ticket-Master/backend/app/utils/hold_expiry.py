@@ -0,0 +1,271 @@
+"""
+In-process expiry of seat holds.
+Each worker keeps a min-heap of the holds it created, keyed on
+``reserved_until``, and releases them with one conditional UPDATE per batch
+within about a second of expiry. One process across all workers and hosts,
+elected through a database lease, also sweeps for expired holds nobody is
+tracking (for example after a worker restart). Seat map reads release a
+venue's lapsed holds themselves first, so the version (and with it the
+ETag and cached maps) moves on as soon as a hold expires.
+
+The same process fails payments left pending for PENDING_PAYMENT_TTL_SECONDS
+(an abandoned checkout, say), cancelling their tickets so the ticket type
+inventory they claimed goes back on sale.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from app.models import db, Payment, Seat, VenueSection
+from app.utils.ga_inventory import cancel_pending_tickets
+from app.utils.leases import acquire_lease, make_owner_id
+from app.utils.seat_changes import record_seat_changes
+from app.utils.seatmap import drop_default_seats
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'hold-expiry-sweeper'
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAYMENT_TTL_SECONDS = 3 * 3600
+# Stale payments are rare and not urgent; look for them this often
+PAYMENT_SWEEP_SECONDS = 60
+
+
+def release_holds(seat_ids, now=None):
+    """Release those of ``seat_ids`` whose hold has expired; the caller commits"""
+    now = now or datetime.utcnow()
+    released = db.session.execute(
+        db.update(Seat)
+        .where(
+            Seat.id.in_(list(seat_ids)),
+            Seat.status == Seat.Status.RESERVED,
+            Seat.reserved_until.isnot(None),
+            Seat.reserved_until <= now,
+        )
+        .values(status=Seat.Status.AVAILABLE, reserved_by=None, reserved_until=None, updated_at=now)
+        .returning(Seat.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    record_seat_changes(released)
+    drop_default_seats(released)
+    return released
+
+
+def release_expired_holds(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Release one batch of expired holds.
+
+    Returns ``(released_ids, oldest_expiry)`` where ``oldest_expiry`` is the
+    earliest ``reserved_until`` in the batch; the caller commits.
+    """
+    now = now or datetime.utcnow()
+    due = db.session.execute(
+        db.select(Seat.id, Seat.reserved_until)
+        .where(
+            Seat.status == Seat.Status.RESERVED,
+            Seat.reserved_until.isnot(None),
+            Seat.reserved_until <= now,
+        )
+        .order_by(Seat.reserved_until.asc())
+        .limit(batch_size)
+    ).all()
+    if not due:
+        return [], None
+    return release_holds([row.id for row in due], now), due[0].reserved_until
+
+
+def release_venue_holds(venue_id, now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Release the venue's expired holds, committing only if there were any"""
+    now = now or datetime.utcnow()
+    due = db.session.execute(
+        db.select(Seat.id)
+        .join(VenueSection, Seat.section_id == VenueSection.id)
+        .where(
+            VenueSection.venue_id == venue_id,
+            Seat.status == Seat.Status.RESERVED,
+            Seat.reserved_until.isnot(None),
+            Seat.reserved_until <= now,
+        )
+        .limit(batch_size)
+    ).scalars().all()
+    if not due:
+        return []
+    released = release_holds(due, now)
+    db.session.commit()
+    return released
+
+
+def expire_pending_payments(max_age_seconds, now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fail one batch of payments pending for over ``max_age_seconds``.
+
+    Their pending tickets are cancelled and give their inventory back.
+    Returns the expired payment ids; the caller commits.
+    """
+    now = now or datetime.utcnow()
+    due = db.session.execute(
+        db.select(Payment.id)
+        .where(Payment.status == Payment.Status.PENDING, Payment.created_at <= now - timedelta(seconds=max_age_seconds))
+        .order_by(Payment.created_at.asc())
+        .limit(batch_size)
+    ).scalars().all()
+    if not due:
+        return []
+    # A capture finishing meanwhile wins; its payment is no longer pending
+    expired = db.session.execute(
+        db.update(Payment)
+        .where(Payment.id.in_(due), Payment.status == Payment.Status.PENDING)
+        .values(status=Payment.Status.FAILED, updated_at=now)
+        .returning(Payment.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    cancel_pending_tickets(expired, now)
+    return expired
+
+
+class HoldExpiryScheduler:
+    """Background thread that releases seat holds as they expire"""
+
+    def __init__(self):
+        self.app = None
+        self.owner = make_owner_id()
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._last_sweep = 0.0
+        self._last_payment_sweep = 0.0
+        self.payment_ttl_seconds = DEFAULT_PAYMENT_TTL_SECONDS
+        self._metrics = {
+            'released_total': 0,
+            'swept_total': 0,
+            'payments_expired_total': 0,
+            'batches': 0,
+            'last_lag_seconds': None,
+            'max_lag_seconds': 0.0,
+            'errors': 0,
+            'is_leader': False,
+            'last_tick_at': None,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.sweep_seconds = app.config.get('HOLD_EXPIRY_SWEEP_SECONDS', 1.0)
+        self.batch_size = app.config.get('HOLD_EXPIRY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.payment_ttl_seconds = app.config.get('PENDING_PAYMENT_TTL_SECONDS', DEFAULT_PAYMENT_TTL_SECONDS)
+        self.lease_seconds = max(self.sweep_seconds * 5, 5)
+        self.start()
+
+    def start(self):
+        # Threads do not survive a fork, so (re)start in whichever process we are in
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._heap = []
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='hold-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+
+    def schedule(self, seat_ids, reserved_until):
+        """Track holds created by this process so they are released on time"""
+        if self.app is None or not seat_ids:
+            return
+        self.start()
+        with self._cond:
+            heapq.heappush(self._heap, (reserved_until, tuple(seat_ids)))
+            if self._heap[0][0] == reserved_until:
+                self._cond.notify()
+
+    def _wait_seconds(self):
+        wait = self.sweep_seconds - (time.monotonic() - self._last_sweep)
+        if self._heap:
+            wait = min(wait, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+        return max(wait, 0.05)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait(self._wait_seconds())
+            if self._stop.is_set():
+                break
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    logger.error(f"[HOLD EXPIRY ERROR] {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                reserved_until, seat_ids = heapq.heappop(self._heap)
+                due.append((reserved_until, seat_ids))
+        return due
+
+    def _observe(self, released, oldest, now):
+        if not released:
+            return
+        lag = max((now - oldest).total_seconds(), 0.0)
+        self._metrics['batches'] += 1
+        self._metrics['last_lag_seconds'] = lag
+        self._metrics['max_lag_seconds'] = max(self._metrics['max_lag_seconds'], lag)
+
+    def tick(self):
+        """Release this process's due holds, then sweep if we hold the lease"""
+        now = datetime.utcnow()
+        self._metrics['last_tick_at'] = now.isoformat()
+
+        due = self._pop_due(now)
+        if due:
+            seat_ids = [sid for _, ids in due for sid in ids]
+            released = release_holds(seat_ids, now)
+            db.session.commit()
+            self._metrics['released_total'] += len(released)
+            self._observe(released, due[0][0], now)
+
+        if time.monotonic() - self._last_sweep < self.sweep_seconds:
+            return
+        self._last_sweep = time.monotonic()
+
+        self._metrics['is_leader'] = acquire_lease(LEASE_NAME, self.owner, self.lease_seconds, now)
+        if not self._metrics['is_leader']:
+            return
+
+        while True:
+            released, oldest = release_expired_holds(now, self.batch_size)
+            db.session.commit()
+            self._metrics['swept_total'] += len(released)
+            self._observe(released, oldest, now)
+            if len(released) < self.batch_size:
+                break
+
+        if time.monotonic() - self._last_payment_sweep < PAYMENT_SWEEP_SECONDS:
+            return
+        self._last_payment_sweep = time.monotonic()
+        while True:
+            expired = expire_pending_payments(self.payment_ttl_seconds, now, self.batch_size)
+            db.session.commit()
+            self._metrics['payments_expired_total'] += len(expired)
+            if len(expired) < self.batch_size:
+                break
+
+    def metrics(self):
+        with self._cond:
+            backlog = sum(len(ids) for _, ids in self._heap)
+            next_expiry = self._heap[0][0].isoformat() if self._heap else None
+        return dict(self._metrics, backlog=backlog, next_expiry=next_expiry, owner=self.owner)
+
+
+scheduler = HoldExpiryScheduler()
@@ -0,0 +1,236 @@
+"""
+Idempotency keys.
+Clients that retry a purchase after a timeout send the same
+``Idempotency-Key`` header each time. The first request with a key claims it
+in ``idempotency_keys`` and runs; its response is stored and replayed to
+every retry until the key expires, so a retry never creates a second
+payment or sells a second ticket.
+
+A retry that arrives while the first request is still running waits (up to
+IDEMPOTENCY_WAIT_SECONDS) for its result instead of redoing the work. If
+the first request's process died, its claim lapses after
+IDEMPOTENCY_LOCK_SECONDS and the next retry takes it over. Reusing a key
+for a different request body is rejected with 422. Server errors are not
+stored, so a request that failed with a 5xx can be retried.
+
+Keys are scoped to the endpoint and the caller: the JWT identity, or for
+anonymous endpoints the client's address and User-Agent, so two anonymous
+clients that happen to pick the same key never see each other's responses.
+"""
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models import db, IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# First and longest pause between looks at a key another request holds
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 0.5
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _scope():
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        # Endpoint without @jwt_required
+        user_id = None
+    if not user_id:
+        client = f'{request.remote_addr}\n{request.headers.get("User-Agent", "")}'
+        user_id = 'anon-' + hashlib.sha256(client.encode()).hexdigest()[:32]
+    return f'{request.endpoint}:{user_id}'
+
+
+def _insert_key(row):
+    """Insert ``row`` unless the key is taken; returns whether it was new"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(IdempotencyKey.__table__)
+        return db.session.execute(insert.on_conflict_do_nothing(), row).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(IdempotencyKey.__table__), row)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _lookup(scope, key):
+    return db.session.execute(
+        db.select(
+            IdempotencyKey.id,
+            IdempotencyKey.fingerprint,
+            IdempotencyKey.status,
+            IdempotencyKey.locked_until,
+            IdempotencyKey.expires_at,
+            IdempotencyKey.response_status,
+            IdempotencyKey.response_body,
+            IdempotencyKey.response_mimetype,
+        ).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+    ).first()
+
+
+def _claim(scope, key, fingerprint, owner, config, now):
+    """
+    Claim ``key`` for this request and commit.
+
+    Returns ``(key_id, None)`` when the claim is ours, otherwise
+    ``(None, row)`` with the key's current state.
+    """
+    table = IdempotencyKey.__table__
+    locked_until = now + timedelta(seconds=config.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+    for _ in range(2):
+        key_id = str(uuid.uuid4())
+        inserted = _insert_key({
+            'id': key_id,
+            'created_at': now,
+            'updated_at': now,
+            'scope': scope,
+            'key': key,
+            'fingerprint': fingerprint,
+            'status': IdempotencyKey.Status.IN_PROGRESS,
+            'owner': owner,
+            'locked_until': locked_until,
+            'expires_at': now + timedelta(seconds=config.get('IDEMPOTENCY_KEY_TTL_SECONDS', 86400)),
+        })
+        db.session.commit()
+        if inserted:
+            return key_id, None
+        row = _lookup(scope, key)
+        if row is None:
+            continue
+        if row.expires_at <= now:
+            # An expired key is free again; whoever deletes it claims it next
+            db.session.execute(table.delete().where(table.c.id == row.id, table.c.expires_at <= now))
+            db.session.commit()
+            continue
+        if (row.status == IdempotencyKey.Status.IN_PROGRESS and row.fingerprint == fingerprint
+                and row.locked_until <= now):
+            # The first request's process died; take its claim over
+            taken = db.session.execute(
+                table.update()
+                .where(table.c.id == row.id, table.c.status == row.status, table.c.locked_until <= now)
+                .values(owner=owner, locked_until=locked_until, updated_at=now)
+            ).rowcount
+            db.session.commit()
+            if taken:
+                logger.warning(f"[IDEMPOTENCY] Took over key {key!r} in {scope} after its lock lapsed")
+                return row.id, None
+            row = _lookup(scope, key)
+        return None, row
+    return None, _lookup(scope, key)
+
+
+def _wait_for(scope, key, deadline):
+    """Poll a key held by another request until it completes or ``deadline``"""
+    pause = POLL_SECONDS
+    while True:
+        db.session.rollback()
+        row = _lookup(scope, key)
+        if row is None or row.status == IdempotencyKey.Status.COMPLETED:
+            return row
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or row.locked_until <= datetime.utcnow():
+            return row
+        time.sleep(min(pause, remaining))
+        pause = min(pause * 2, MAX_POLL_SECONDS)
+
+
+def _replay(row):
+    response = Response(row.response_body, status=row.response_status, mimetype=row.response_mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _release(key_id, owner):
+    """Drop our claim so the request can be retried from scratch"""
+    table = IdempotencyKey.__table__
+    db.session.rollback()
+    db.session.execute(table.delete().where(table.c.id == key_id, table.c.owner == owner))
+    db.session.commit()
+
+
+def idempotent(fn):
+    """
+    Decorator replaying the stored response for a repeated ``Idempotency-Key``.
+
+    Goes below ``@jwt_required()`` so keys are scoped to the caller; without
+    it they are scoped to the client. Requests without the header run as usual.
+    """
+    @wraps(fn)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        config = current_app.config
+        scope, fingerprint, owner = _scope(), _fingerprint(), str(uuid.uuid4())
+        key_id, row = _claim(scope, key, fingerprint, owner, config, datetime.utcnow())
+        if not key_id:
+            if row is not None and row.fingerprint != fingerprint:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if row is not None and row.status == IdempotencyKey.Status.IN_PROGRESS:
+                row = _wait_for(scope, key, time.monotonic() + config.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+            if row is None or row.status == IdempotencyKey.Status.IN_PROGRESS:
+                response = jsonify({'error': f'A request with this {HEADER} is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            return _replay(row)
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            _release(key_id, owner)
+            raise
+        if response.status_code >= 500:
+            _release(key_id, owner)
+            return response
+
+        # Anything the view left uncommitted was meant to be discarded
+        db.session.rollback()
+        table = IdempotencyKey.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.id == key_id, table.c.owner == owner)
+            .values(
+                status=IdempotencyKey.Status.COMPLETED,
+                locked_until=None,
+                response_status=response.status_code,
+                response_body=response.get_data(as_text=True),
+                response_mimetype=response.mimetype,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        db.session.commit()
+        return response
+    return decorated_function
+
+
+def purge_expired_keys(batch_size=1000, now=None):
+    """Delete up to ``batch_size`` expired keys and commit; returns how many went"""
+    now = now or datetime.utcnow()
+    table = IdempotencyKey.__table__
+    expired = db.session.execute(
+        db.select(table.c.id).where(table.c.expires_at <= now).limit(batch_size)
+    ).scalars().all()
+    if expired:
+        db.session.execute(table.delete().where(table.c.id.in_(expired), table.c.expires_at <= now))
+    db.session.commit()
+    return len(expired)
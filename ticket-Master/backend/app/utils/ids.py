@@ -0,0 +1,157 @@
+"""
+Ticket number and transaction ID allocation.
+IDs come from named counters in ``id_sequences``. Each process reserves a
+block of ID_BLOCK_SIZE values at a time with one conditional UPDATE and then
+hands them out from memory, so no two processes ever issue the same value
+and a bulk order never depends on a unique constraint to catch collisions.
+
+Values are written in Crockford base32 (no I, L, O or U), padded to a fixed
+width so they sort in issue order, followed by a mod-37 check symbol that
+catches a mistyped or transposed character.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from app.models import db, IdSequence
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CHECK_ALPHABET = ALPHABET + '*~$=U'
+WIDTH = 8
+DEFAULT_BLOCK_SIZE = 1000
+
+TICKET_NUMBERS = 'ticket_number'
+TRANSACTION_IDS = 'transaction_id'
+
+_RESERVED_KEY = 'reserved_id_blocks'
+
+
+def encode(value):
+    """``value`` as WIDTH base32 digits plus its check symbol"""
+    digits = []
+    n = value
+    for _ in range(WIDTH):
+        n, digit = divmod(n, 32)
+        digits.append(ALPHABET[digit])
+    if n:
+        raise OverflowError(f'{value} does not fit in {WIDTH} base32 digits')
+    return ''.join(reversed(digits)) + CHECK_ALPHABET[value % 37]
+
+
+def decode(text):
+    """The value encoded in ``text``, or None if it is malformed or fails its check"""
+    text = text.upper().replace('-', '')
+    if len(text) != WIDTH + 1:
+        return None
+    value = 0
+    for char in text[:WIDTH]:
+        # Crockford decoding is lenient about look-alike characters
+        char = {'O': '0', 'I': '1', 'L': '1'}.get(char, char)
+        if char not in ALPHABET:
+            return None
+        value = value * 32 + ALPHABET.index(char)
+    return value if CHECK_ALPHABET[value % 37] == text[WIDTH] else None
+
+
+class IdAllocator:
+    """Hands out values of one sequence from blocks reserved per process"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def _reserve(self, size):
+        """Claim ``size`` values; returns the first one"""
+        table = IdSequence.__table__
+        stmt = (
+            table.update()
+            .where(table.c.name == self.name)
+            .values(next_value=table.c.next_value + size)
+            .returning(table.c.next_value)
+        )
+        if db.engine.dialect.name == 'sqlite':
+            # SQLite has a single writer, so the block is claimed in the
+            # caller's transaction; if that rolls back, so does the claim
+            db.session.info.setdefault(_RESERVED_KEY, set()).add(self)
+            return _reserve_in(db.session, stmt, self.name, size)
+        # Claimed and committed on a connection of its own, so the row is
+        # locked only for the UPDATE and a failed order does not hand the
+        # block out twice
+        with db.engine.begin() as connection:
+            return _reserve_in(connection, stmt, self.name, size)
+
+    def discard(self):
+        with self._lock:
+            self._next = self._end = 0
+
+    def allocate(self, count=1):
+        """Return ``count`` new values in increasing order"""
+        values = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # Never share a block with a forked parent or sibling
+                self._next = self._end = 0
+                self._pid = os.getpid()
+            while len(values) < count:
+                if self._next >= self._end:
+                    size = max(current_app.config.get('ID_BLOCK_SIZE', DEFAULT_BLOCK_SIZE), count - len(values))
+                    self._next = self._reserve(size)
+                    self._end = self._next + size
+                take = min(count - len(values), self._end - self._next)
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+        return values
+
+
+def _reserve_in(connection, stmt, name, size):
+    for _ in range(2):
+        end = connection.execute(stmt).scalar()
+        if end is not None:
+            return end - size
+        try:
+            with connection.begin_nested():
+                connection.execute(IdSequence.__table__.insert().values(name=name, next_value=1))
+        except IntegrityError:
+            # Another process created the counter first; claim from that one
+            continue
+    raise RuntimeError(f'Could not reserve IDs from sequence {name}')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    for allocator in session.info.pop(_RESERVED_KEY, ()):
+        allocator.discard()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _keep_committed(session):
+    session.info.pop(_RESERVED_KEY, None)
+
+
+_allocators = {name: IdAllocator(name) for name in (TICKET_NUMBERS, TRANSACTION_IDS)}
+
+
+def ticket_numbers(count=1):
+    """``count`` new ticket numbers, e.g. TKT-20261016-00000A4KX"""
+    day = datetime.utcnow().strftime('%Y%m%d')
+    return [f'TKT-{day}-{encode(value)}' for value in _allocators[TICKET_NUMBERS].allocate(count)]
+
+
+def transaction_ids(count=1):
+    """``count`` new payment transaction IDs"""
+    stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    return [f'TXN-{stamp}-{encode(value)}' for value in _allocators[TRANSACTION_IDS].allocate(count)]
+
+
+def is_valid_ticket_number(ticket_number):
+    """Whether ``ticket_number``'s check symbol matches; legacy numbers have none"""
+    parts = ticket_number.split('-')
+    return len(parts) == 3 and parts[0] == 'TKT' and decode(parts[2]) is not None
@@ -1,8 +1,26 @@
 from flask import current_app
-import requests
+import threading
 from datetime import datetime
 import json
 import base64
+from app.utils import outbound
+from app.utils.outbound import ProviderUnavailable
+from app.utils.token_cache import SharedTokenCache
+
+_token_lock = threading.Lock()
+_token_caches = {}
+
+
+def _token_cache(base_url, client_id):
+    key = f'{base_url}:{client_id}'
+    with _token_lock:
+        if key not in _token_caches:
+            _token_caches[key] = SharedTokenCache(
+                key,
+                current_app.config.get('PAYPAL_TOKEN_CACHE_DIR'),
+                current_app.config.get('PAYPAL_TOKEN_REFRESH_MARGIN_SECONDS', 300),
+            )
+        return _token_caches[key]
 
 
 class PayPalHandler:
@@ -16,37 +34,60 @@ class PayPalHandler:
             'https://api-m.sandbox.paypal.com' if self.environment == 'sandbox'
             else 'https://api-m.paypal.com'
         )
+        self.http = outbound.client('paypal')
+        self.tokens = _token_cache(self.base_url, self.client_id)
+    
+    def _fetch_token(self):
+        url = f"{self.base_url}/v1/oauth2/token"
+        auth = (self.client_id, self.client_secret)
+        headers = {'Accept': 'application/json', 'Accept-Language': 'en_US'}
+        data = {'grant_type': 'client_credentials'}
+        
+        # Asking for a token twice is harmless, so it may be retried
+        response = self.http.post(url, auth=auth, headers=headers, data=data, idempotent=True)
+        if response.status_code != 200:
+            raise Exception(f"token request returned {response.status_code}")
+        body = response.json()
+        return body['access_token'], body.get('expires_in', 3600)
     
     def get_access_token(self):
-        """Get PayPal access token"""
+        """Get PayPal access token, cached until shortly before it expires"""
         try:
-            url = f"{self.base_url}/v1/oauth2/token"
-            auth = (self.client_id, self.client_secret)
-            headers = {'Accept': 'application/json', 'Accept-Language': 'en_US'}
-            data = {'grant_type': 'client_credentials'}
-            
-            response = requests.post(url, auth=auth, headers=headers, data=data)
-            if response.status_code == 200:
-                return response.json().get('access_token')
-            return None
+            return self.tokens.get(self._fetch_token)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             current_app.logger.error(f"PayPal token error: {str(e)}")
             return None
     
-    def create_order(self, amount, currency, reference, description, return_url):
-        """Create PayPal order"""
-        try:
+    def _request(self, method, path, request_id=None, **kwargs):
+        """
+        Authorized API call; a cached token PayPal rejects is replaced once.
+
+        With ``request_id`` PayPal deduplicates the call, so it is retried on
+        transient failures like a GET.
+        """
+        for attempt in range(2):
             access_token = self.get_access_token()
             if not access_token:
                 raise Exception("Failed to get access token")
             
-            url = f"{self.base_url}/v2/checkout/orders"
-            
             headers = {
                 'Authorization': f'Bearer {access_token}',
                 'Content-Type': 'application/json'
             }
-            
+            if request_id:
+                headers['PayPal-Request-Id'] = request_id
+            response = self.http.request(
+                method, f"{self.base_url}{path}", idempotent=True if request_id else None, headers=headers, **kwargs
+            )
+            if response.status_code != 401 or attempt:
+                return response
+            self.tokens.invalidate(access_token)
+    
+    def create_order(self, amount, currency, reference, description, return_url):
+        """Create PayPal order"""
+        try:
             payload = {
                 'intent': 'CAPTURE',
                 'purchase_units': [
@@ -68,7 +109,7 @@ class PayPalHandler:
                 }
             }
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._request('POST', '/v2/checkout/orders', request_id=f'order-{reference}', json=payload)
             
             if response.status_code == 201:
                 data = response.json()
@@ -81,6 +122,8 @@ class PayPalHandler:
                     'success': False,
                     'error': response.json()
                 }
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             current_app.logger.error(f"Order creation error: {str(e)}")
             return {
@@ -91,18 +134,9 @@ class PayPalHandler:
     def capture_payment(self, order_id):
         """Capture PayPal payment"""
         try:
-            access_token = self.get_access_token()
-            if not access_token:
-                raise Exception("Failed to get access token")
-            
-            url = f"{self.base_url}/v2/checkout/orders/{order_id}/capture"
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.post(url, headers=headers, json={})
+            response = self._request(
+                'POST', f"/v2/checkout/orders/{order_id}/capture", request_id=f'capture-{order_id}', json={}
+            )
             
             if response.status_code == 201:
                 return {
@@ -114,6 +148,8 @@ class PayPalHandler:
                     'success': False,
                     'error': response.json()
                 }
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             current_app.logger.error(f"Payment capture error: {str(e)}")
             return {
@@ -124,17 +160,6 @@ class PayPalHandler:
     def refund_payment(self, capture_id, amount=None, currency='USD'):
         """Refund PayPal payment"""
         try:
-            access_token = self.get_access_token()
-            if not access_token:
-                raise Exception("Failed to get access token")
-            
-            url = f"{self.base_url}/v2/payments/captures/{capture_id}/refund"
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
             payload = {}
             if amount:
                 payload = {
@@ -144,7 +169,7 @@ class PayPalHandler:
                     }
                 }
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._request('POST', f"/v2/payments/captures/{capture_id}/refund", json=payload)
             
             if response.status_code == 201:
                 return {
@@ -156,6 +181,8 @@ class PayPalHandler:
                     'success': False,
                     'error': response.json()
                 }
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             current_app.logger.error(f"Refund error: {str(e)}")
             return {
@@ -166,22 +193,13 @@ class PayPalHandler:
     def get_order_details(self, order_id):
         """Get PayPal order details"""
         try:
-            access_token = self.get_access_token()
-            if not access_token:
-                raise Exception("Failed to get access token")
-            
-            url = f"{self.base_url}/v2/checkout/orders/{order_id}"
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(url, headers=headers)
+            response = self._request('GET', f"/v2/checkout/orders/{order_id}")
             
             if response.status_code == 200:
                 return response.json()
             return None
+        except ProviderUnavailable:
+            raise
         except Exception as e:
             current_app.logger.error(f"Order details error: {str(e)}")
             return None
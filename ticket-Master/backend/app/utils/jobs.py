@@ -0,0 +1,123 @@
+"""
+Background jobs.
+A BackgroundJob row records what a long-running task is, how far it got and
+how it ended, so admins can poll it. The work runs on a daemon thread of the
+worker that accepted the request, with its own session, and reports progress
+through ``report(done)`` which is committed together with the job's work.
+
+Jobs that can pick up where they stopped also pass ``checkpoint=`` to
+``report``; resume_job() then reruns the target with that checkpoint.
+"""
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from app.models import db, BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+
+def start_job(kind, target, params=None, total=0, created_by=None):
+    """
+    Record a job and run ``target(report, **params)`` in the background.
+
+    ``params`` must be JSON-serialisable; they are stored on the job so a
+    failed run can be retried with the same arguments. The target's return
+    value becomes the job result. With BACKGROUND_JOBS_INLINE set the job
+    runs before this returns.
+    """
+    job = BackgroundJob(kind=kind, params=params or {}, progress_total=total, created_by=created_by)
+    db.session.add(job)
+    db.session.commit()
+    return _launch(job, target)
+
+
+def resume_job(job, target, stale_before=None):
+    """
+    Run a failed or interrupted job again from its last checkpoint.
+
+    The job is claimed with one conditional UPDATE: it must have failed, or
+    (with ``stale_before``) be pending or running without having reported
+    since then. Returns None when the job is not resumable or another
+    request claimed it first, so a job is never run twice at once.
+    """
+    resumable = BackgroundJob.status == BackgroundJob.Status.FAILED
+    if stale_before is not None:
+        resumable = db.or_(resumable, db.and_(
+            BackgroundJob.status.in_([BackgroundJob.Status.PENDING, BackgroundJob.Status.RUNNING]),
+            BackgroundJob.updated_at < stale_before,
+        ))
+    claimed = db.session.execute(
+        db.update(BackgroundJob)
+        .where(BackgroundJob.id == job.id, resumable)
+        .values(status=BackgroundJob.Status.PENDING, finished_at=None, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if claimed != 1:
+        return None
+    db.session.refresh(job)
+    return _launch(job, target)
+
+
+def _launch(job, target):
+    app = current_app._get_current_object()
+    if app.config.get('BACKGROUND_JOBS_INLINE'):
+        run_job(job.id, target)
+        db.session.refresh(job)
+        return job
+
+    threading.Thread(target=_run_in_app, args=(app, job.id, target), name=f'job-{job.kind}', daemon=True).start()
+    return job
+
+
+def _run_in_app(app, job_id, target):
+    with app.app_context():
+        try:
+            run_job(job_id, target)
+        finally:
+            db.session.remove()
+
+
+def run_job(job_id, target):
+    """Run ``target`` for an existing job row, recording progress and outcome"""
+    job = db.session.get(BackgroundJob, job_id)
+    job.status = BackgroundJob.Status.RUNNING
+    job.started_at = datetime.utcnow()
+    job.error = None
+    db.session.commit()
+
+    def report(done, total=None, checkpoint=None):
+        values = {'progress_done': done}
+        if total is not None:
+            values['progress_total'] = total
+        if checkpoint is not None:
+            values['checkpoint'] = checkpoint
+        db.session.execute(
+            db.update(BackgroundJob)
+            .where(BackgroundJob.id == job_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    try:
+        kwargs = dict(job.params or {})
+        if job.checkpoint:
+            kwargs['checkpoint'] = job.checkpoint
+        result = target(report, **kwargs)
+        db.session.commit()
+        _finish(job_id, BackgroundJob.Status.SUCCEEDED, result=result)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[JOB ERROR] {job_id}: {e}")
+        _finish(job_id, BackgroundJob.Status.FAILED, error=str(e))
+
+
+def _finish(job_id, status, result=None, error=None):
+    db.session.execute(
+        db.update(BackgroundJob)
+        .where(BackgroundJob.id == job_id)
+        .values(status=status, result=result, error=error, finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
@@ -0,0 +1,62 @@
+"""
+Database-backed leases.
+A lease names a job that only one process across all workers and hosts
+should run at a time. Holders renew it before it expires; if a holder dies
+the lease lapses and another process takes over.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app.models import db, SchedulerLease
+
+
+def make_owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name, owner, ttl_seconds, now=None):
+    """Take or renew lease ``name`` for ``owner``; commits and returns True on success"""
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        db.update(SchedulerLease)
+        .where(
+            SchedulerLease.name == name,
+            db.or_(
+                SchedulerLease.owner == owner,
+                SchedulerLease.owner.is_(None),
+                SchedulerLease.expires_at < now,
+            ),
+        )
+        .values(owner=owner, expires_at=now + timedelta(seconds=ttl_seconds), updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        db.session.commit()
+        return True
+
+    exists = db.session.execute(
+        db.select(SchedulerLease.id).where(SchedulerLease.name == name)
+    ).scalar()
+    if exists:
+        db.session.rollback()
+        return False
+
+    try:
+        db.session.add(SchedulerLease(name=name, owner=owner, expires_at=now + timedelta(seconds=ttl_seconds)))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def release_lease(name, owner):
+    db.session.execute(
+        db.update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.owner == owner)
+        .values(owner=None, expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
@@ -0,0 +1,262 @@
+"""
+Outbound HTTP to third-party providers (PayPal, Google).
+Each provider gets its own client per process: a keep-alive connection pool,
+connect/read timeouts capped by an overall deadline per call, a bulkhead
+limiting how many threads may wait on it at once, and a circuit breaker.
+
+After OUTBOUND_BREAKER_FAILURES consecutive failures (transport errors,
+timeouts, 5xx or 429) the breaker opens and calls fail at once with
+ProviderUnavailable, so a provider brownout ties up no workers and only the
+endpoints that need that provider answer 503. After
+OUTBOUND_BREAKER_RESET_SECONDS one probe call is let through (half-open);
+its outcome closes the breaker or opens it again.
+
+Idempotent calls (GET and friends, or POSTs the caller marks idempotent, for
+example with a PayPal-Request-Id header) are retried with full-jitter
+backoff within the deadline. Other calls are retried only when the
+connection was never made.
+
+Settings are read from ``<PREFIX>_CONNECT_TIMEOUT``, ``_READ_TIMEOUT``,
+``_DEADLINE_SECONDS``, ``_POOL_SIZE``, ``_MAX_CONCURRENCY`` and ``_RETRIES``,
+with PREFIX the provider's name in capitals.
+"""
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from flask import current_app, jsonify
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderUnavailable(Exception):
+    """The provider is failing or saturated; the call was not attempted"""
+
+    def __init__(self, provider, reason, retry_after=1):
+        super().__init__(f'{provider} is unavailable ({reason})')
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one at a time"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """A call ended without telling us anything about the provider"""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 1
+            return max(int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1, 1)
+
+
+class ProviderClient:
+    """Pooled, deadline-bound, circuit-broken HTTP client for one provider"""
+
+    def __init__(self, name, config):
+        prefix = name.upper()
+        self.name = name
+        self.connect_timeout = config.get(f'{prefix}_CONNECT_TIMEOUT', 3.05)
+        self.read_timeout = config.get(f'{prefix}_READ_TIMEOUT', 10)
+        self.deadline_seconds = config.get(f'{prefix}_DEADLINE_SECONDS', 30)
+        self.pool_size = config.get(f'{prefix}_POOL_SIZE', 10)
+        self.retries = config.get(f'{prefix}_RETRIES', 2)
+        self.retry_base_seconds = config.get('OUTBOUND_RETRY_BASE_SECONDS', 0.2)
+        self.bulkhead_wait_seconds = config.get('OUTBOUND_BULKHEAD_WAIT_SECONDS', 0.5)
+        self.breaker = CircuitBreaker(
+            config.get('OUTBOUND_BREAKER_FAILURES', 5),
+            config.get('OUTBOUND_BREAKER_RESET_SECONDS', 30),
+        )
+        self.max_concurrency = config.get(f'{prefix}_MAX_CONCURRENCY', 20)
+        self._bulkhead = threading.BoundedSemaphore(self.max_concurrency)
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._metrics = {
+            'requests': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'short_circuited': 0,
+            'bulkhead_rejected': 0,
+            'latency_seconds_total': 0.0,
+            'last_error': None,
+        }
+
+    def session(self):
+        """Keep-alive session, recreated in a forked child"""
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size))
+                self._session, self._pid = session, os.getpid()
+            return self._session
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def _backoff(self, attempt):
+        return random.uniform(0, self.retry_base_seconds * 2 ** attempt)
+
+    def request(self, method, url, idempotent=None, deadline=None, **kwargs):
+        """
+        Send one request; returns the response, whatever its status.
+
+        Raises ProviderUnavailable when the breaker is open, the bulkhead is
+        full or the provider could not be reached within the deadline.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        expires = time.monotonic() + (deadline or self.deadline_seconds)
+
+        if not self._bulkhead.acquire(timeout=self.bulkhead_wait_seconds):
+            self._count('bulkhead_rejected')
+            raise ProviderUnavailable(self.name, 'too many calls in flight')
+        with self._lock:
+            self._in_flight += 1
+        try:
+            attempt = 0
+            while True:
+                if not self.breaker.allow():
+                    self._count('short_circuited')
+                    raise ProviderUnavailable(self.name, 'circuit open', self.breaker.retry_after())
+                remaining = expires - time.monotonic()
+                timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+                self._count('requests')
+                started = time.monotonic()
+                try:
+                    response = self.session().request(method, url, timeout=timeout, **kwargs)
+                except requests.exceptions.ConnectTimeout as e:
+                    # Never reached the provider, so even a POST is safe to resend
+                    error, retryable = e, True
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error, retryable = e, idempotent
+                except Exception:
+                    # Our bug (a bad URL, say), not the provider's
+                    self.breaker.release()
+                    raise
+                else:
+                    error = None
+                finally:
+                    self._count('latency_seconds_total', time.monotonic() - started)
+
+                if error is None and response.status_code < 500 and response.status_code != 429:
+                    self.breaker.record_success()
+                    self._count('succeeded')
+                    return response
+                if error is None:
+                    error = f'HTTP {response.status_code}'
+                    retryable = idempotent and response.status_code in RETRY_STATUSES
+                self.breaker.record_failure()
+                self._count('failed')
+                with self._lock:
+                    self._metrics['last_error'] = str(error)[:200]
+
+                pause = self._backoff(attempt)
+                if not retryable or attempt >= self.retries or time.monotonic() + pause >= expires:
+                    if isinstance(error, Exception):
+                        raise ProviderUnavailable(self.name, type(error).__name__) from error
+                    return response
+                logger.warning(f"[OUTBOUND] {self.name} {method} failed ({error}); retrying")
+                self._count('retries')
+                attempt += 1
+                time.sleep(pause)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._bulkhead.release()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._metrics, in_flight=self._in_flight, max_concurrency=self.max_concurrency)
+        stats['latency_seconds_total'] = round(stats['latency_seconds_total'], 3)
+        stats['breaker'] = {'state': self.breaker.state, 'failures': self.breaker.failures, 'opens': self.breaker.opens}
+        return stats
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(name):
+    """The process-wide client for provider ``name``"""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = ProviderClient(name, current_app.config)
+        return _clients[name]
+
+
+def unavailable_response(error):
+    """503 for an endpoint whose provider is down; the rest of the API is unaffected"""
+    response = jsonify({'error': f'{error.provider} is temporarily unavailable, please retry shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def metrics():
+    with _clients_lock:
+        clients = dict(_clients)
+    return {name: c.metrics() for name, c in clients.items()}
@@ -0,0 +1,84 @@
+"""
+Payment provider references.
+Captures, webhooks and refunds arrive with the provider's ids (a PayPal order
+or capture id), not ours. Each id is stored as a PaymentReference row under a
+unique (provider, ref_type, ref_value) index, so finding its payment is one
+index lookup. The ids are still copied into Payment.metadata_json for
+display, but nothing searches that column.
+"""
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Payment, PaymentReference
+
+# metadata_json key -> (provider, ref_type), for backfilling older payments
+METADATA_KEYS = {
+    'paypal_order_id': (PaymentReference.Provider.PAYPAL, PaymentReference.Type.ORDER),
+    'paypal_capture_id': (PaymentReference.Provider.PAYPAL, PaymentReference.Type.CAPTURE),
+}
+
+
+def add_reference(payment_id, provider, ref_type, ref_value):
+    """Record ``ref_value`` for ``payment_id``; returns False if it already was. The caller commits"""
+    if not ref_value:
+        return False
+    existing = db.session.execute(
+        db.select(PaymentReference.payment_id).where(
+            PaymentReference.provider == provider,
+            PaymentReference.ref_type == ref_type,
+            PaymentReference.ref_value == ref_value,
+        )
+    ).scalar()
+    if existing == payment_id:
+        return False
+    if existing:
+        raise ValueError(f'{provider} {ref_type} {ref_value} already belongs to another payment')
+    db.session.add(PaymentReference(payment_id=payment_id, provider=provider, ref_type=ref_type, ref_value=ref_value))
+    return True
+
+
+def find_payment(provider, ref_type, ref_value):
+    """The payment the provider knows as ``ref_value``, or None"""
+    if not ref_value:
+        return None
+    return db.session.execute(
+        db.select(Payment)
+        .join(PaymentReference, PaymentReference.payment_id == Payment.id)
+        .where(
+            PaymentReference.provider == provider,
+            PaymentReference.ref_type == ref_type,
+            PaymentReference.ref_value == ref_value,
+        )
+    ).scalar()
+
+
+def backfill_references(batch_size=500):
+    """
+    Add references for payments whose provider ids are only in metadata.
+
+    Payments are read in id order, one keyset page per batch, and each batch
+    is committed. Safe to run repeatedly. Returns the number of rows added.
+    """
+    added = 0
+    last_id = ''
+    while True:
+        rows = db.session.execute(
+            db.select(Payment.id, Payment.metadata_json)
+            .where(Payment.id > last_id, Payment.metadata_json.isnot(None))
+            .order_by(Payment.id.asc())
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return added
+        last_id = rows[-1].id
+        for row in rows:
+            for key, (provider, ref_type) in METADATA_KEYS.items():
+                value = (row.metadata_json or {}).get(key)
+                if not value:
+                    continue
+                try:
+                    with db.session.begin_nested():
+                        new = add_reference(row.id, provider, ref_type, str(value))
+                except (IntegrityError, ValueError):
+                    # Another payment already claims this id; keep the first
+                    continue
+                added += new
+        db.session.commit()
@@ -0,0 +1,274 @@
+"""
+QR code rendering.
+Tickets store only their QR payload. Images are rendered on demand and kept
+in a bounded in-memory LRU backed by a disk cache, both keyed by the content
+hash that also names the image URL, so a URL always maps to the same bytes.
+The content hash can be computed by anyone who knows a ticket number, so
+the URL also carries a keyed signature over the ticket id and hash.
+
+Rendering is CPU-bound, so batches (an order's tickets, or every ticket of
+an event before an on-sale) are spread over a process pool of
+QR_RENDER_WORKERS processes instead of running in the request thread.
+"""
+import hashlib
+import hmac
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+try:
+    import qrcode
+    HAS_QR = True
+except Exception:
+    qrcode = None
+    HAS_QR = False
+
+logger = logging.getLogger(__name__)
+
+# Bump when the rendering parameters change so cached images are not reused
+RENDER_VERSION = 1
+BOX_SIZE = 10
+BORDER = 4
+
+
+def ticket_payload(ticket_number, event_id):
+    """The text encoded in a ticket's QR code"""
+    return f"TICKET:{ticket_number}|EVENT:{event_id}"
+
+
+def content_hash(payload):
+    return hashlib.sha256(f'{RENDER_VERSION}:{payload}'.encode()).hexdigest()[:32]
+
+
+def url_signature(key, ticket_id, digest):
+    """MAC binding an image URL's content hash to its ticket"""
+    message = f'qr-url:{ticket_id}:{digest}'.encode()
+    return hmac.new(key.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def render_png(payload):
+    qr = qrcode.QRCode(version=None, box_size=BOX_SIZE, border=BORDER)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _render_chunk(payloads):
+    """Pool worker entry point: render ``payloads`` and time the work"""
+    started = time.perf_counter()
+    pngs = [render_png(payload) for payload in payloads]
+    return pngs, time.perf_counter() - started
+
+
+class QRImageCache:
+    """PNG bytes by content hash: LRU in memory, files on disk"""
+
+    def __init__(self):
+        self.memory_size = 256
+        self.directory = None
+        self.disk_max_files = 10000
+        self.render_workers = 0
+        self.min_parallel_batch = 8
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self._writes = 0
+        self._pool = None
+        self._pool_pid = None
+        self._stats = {'rendered_total': 0, 'render_seconds_total': 0.0, 'batches': 0, 'last_batch': None}
+
+    def init_app(self, app):
+        self.render_workers = app.config.get('QR_RENDER_WORKERS', 1)
+        self.min_parallel_batch = app.config.get('QR_PARALLEL_MIN_BATCH', self.min_parallel_batch)
+        self.memory_size = app.config.get('QR_CACHE_SIZE', self.memory_size)
+        self.disk_max_files = app.config.get('QR_DISK_CACHE_MAX_FILES', self.disk_max_files)
+        self.directory = app.config.get('QR_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'ticket-master-qr')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"[QR DISK CACHE DISABLED] {e}")
+            self.directory = None
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f'{digest}.png')
+
+    def _remember(self, digest, png):
+        with self._lock:
+            self._memory[digest] = png
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, digest):
+        """Cached PNG for ``digest``, or None"""
+        with self._lock:
+            png = self._memory.get(digest)
+            if png is not None:
+                self._memory.move_to_end(digest)
+                return png
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(digest), 'rb') as f:
+                png = f.read()
+        except OSError:
+            return None
+        self._remember(digest, png)
+        return png
+
+    def _store(self, digest, png, remember=True):
+        if remember:
+            self._remember(digest, png)
+        if not self.directory:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, self._path(digest))
+        except OSError as e:
+            logger.error(f"[QR DISK CACHE ERROR] {e}")
+            return
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Drop the least recently written files beyond ``disk_max_files``"""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.png')]
+            if len(entries) <= self.disk_max_files:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:len(entries) - self.disk_max_files]:
+                os.remove(entry.path)
+        except OSError as e:
+            logger.error(f"[QR DISK CACHE ERROR] {e}")
+
+    def png_for(self, payload):
+        """Return ``(digest, png)`` for ``payload``, rendering on a cache miss"""
+        digest = content_hash(payload)
+        png = self.get(digest)
+        if png is None:
+            png = render_png(payload)
+            self._store(digest, png)
+        return digest, png
+
+    def _executor(self):
+        # Pools do not survive a fork; each gunicorn worker starts its own.
+        # Spawned (not forked) children avoid inheriting held locks.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.render_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _chunks(self, payloads):
+        size = max(len(payloads) // (self.render_workers * 4), 1)
+        return [payloads[i:i + size] for i in range(0, len(payloads), size)]
+
+    def holds(self, count):
+        """Whether the disk cache can keep ``count`` more images at once"""
+        return bool(self.directory) and count <= self.disk_max_files
+
+    def _cached(self, digest):
+        """Whether ``digest`` is cached, without promoting it in memory"""
+        with self._lock:
+            if digest in self._memory:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(digest))
+
+    def render_many(self, payloads, remember=True):
+        """
+        Make sure every payload in ``payloads`` has a cached image.
+
+        Misses are rendered on the process pool (in-process for small
+        batches or when QR_RENDER_WORKERS is 0). Without ``remember`` images
+        only go to disk, so a bulk run does not flush the in-memory LRU.
+        Returns throughput stats.
+        """
+        started = time.perf_counter()
+        misses = []
+        if HAS_QR:
+            misses = list(dict.fromkeys(p for p in payloads if not self._cached(content_hash(p))))
+        parallel = bool(misses) and self.render_workers > 0 and len(misses) >= self.min_parallel_batch
+
+        cpu_seconds = 0.0
+        if parallel:
+            chunks = self._chunks(misses)
+            for chunk, (pngs, seconds) in zip(chunks, self._executor().map(_render_chunk, chunks)):
+                cpu_seconds += seconds
+                for payload, png in zip(chunk, pngs):
+                    self._store(content_hash(payload), png, remember)
+        elif misses:
+            pngs, cpu_seconds = _render_chunk(misses)
+            for payload, png in zip(misses, pngs):
+                self._store(content_hash(payload), png, remember)
+
+        wall = time.perf_counter() - started
+        workers = self.render_workers if parallel else 1
+        stats = {
+            'requested': len(payloads),
+            'cached': len(payloads) - len(misses),
+            'rendered': len(misses),
+            'workers': workers,
+            'wall_seconds': round(wall, 4),
+            'render_seconds': round(cpu_seconds, 4),
+            'pngs_per_second': round(len(misses) / wall, 1) if misses and wall else None,
+            'pngs_per_second_per_core': round(len(misses) / cpu_seconds, 1) if misses and cpu_seconds else None,
+        }
+        with self._lock:
+            self._stats['rendered_total'] += len(misses)
+            self._stats['render_seconds_total'] += cpu_seconds
+            self._stats['batches'] += 1
+            self._stats['last_batch'] = stats
+        return stats
+
+    def prerender(self, payloads):
+        """Render ``payloads`` on the pool in the background; returns immediately"""
+        if self.render_workers <= 0 or not HAS_QR:
+            return None
+        misses = [p for p in dict.fromkeys(payloads) if self.get(content_hash(p)) is None]
+        if not misses:
+            return None
+
+        def store(future):
+            try:
+                pngs, seconds = future.result()
+            except Exception as e:
+                logger.error(f"[QR PRERENDER ERROR] {e}")
+                return
+            for payload, png in zip(misses, pngs):
+                self._store(content_hash(payload), png)
+            with self._lock:
+                self._stats['rendered_total'] += len(pngs)
+                self._stats['render_seconds_total'] += seconds
+
+        try:
+            future = self._executor().submit(_render_chunk, misses)
+        except Exception as e:
+            # Images are still rendered on demand; a broken pool only costs latency
+            logger.error(f"[QR PRERENDER ERROR] {e}")
+            return None
+        future.add_done_callback(store)
+        return future
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats, workers=self.render_workers, memory_entries=len(self._memory))
+        seconds = stats['render_seconds_total']
+        stats['pngs_per_second_per_core'] = round(stats['rendered_total'] / seconds, 1) if seconds else None
+        return stats
+
+
+cache = QRImageCache()
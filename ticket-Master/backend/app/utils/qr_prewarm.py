@@ -0,0 +1,75 @@
+"""
+QR pre-rendering for an event.
+Before an on-sale or door opening, every confirmed ticket of the event gets
+its QR image rendered into the cache on the render pool, so ticket pages and
+emails only ever read cached bytes.
+
+Images go to the disk cache only: an event is far bigger than the in-memory
+LRU and would just flush it. An event with more tickets than the disk cache
+holds (QR_DISK_CACHE_MAX_FILES) is refused, since its first images would be
+pruned before the last were written.
+"""
+import time
+from app.models import db, Ticket
+from app.utils.qr import cache as qr_cache
+
+JOB_KIND = 'prewarm_qr'
+DEFAULT_BATCH_SIZE = 500
+# Pending tickets get a new, signed code when they are confirmed
+PREWARM_STATUSES = (Ticket.Status.CONFIRMED,)
+
+
+def count_prewarm_tickets(event_id):
+    return db.session.execute(
+        db.select(db.func.count(Ticket.id))
+        .where(Ticket.event_id == event_id, Ticket.status.in_(PREWARM_STATUSES))
+    ).scalar()
+
+
+def prewarm_event_qr(event_id, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """
+    Render the QR images of ``event_id``'s confirmed tickets.
+
+    Tickets are read in id order, one keyset page per batch, and each batch
+    is rendered on the pool. Returns totals and throughput.
+    """
+    started = time.perf_counter()
+    totals = {'event_id': event_id, 'tickets': 0, 'rendered': 0, 'cached': 0, 'render_seconds': 0.0}
+    last_id = ''
+    while True:
+        rows = db.session.execute(
+            db.select(Ticket.id, Ticket.qr_code)
+            .where(Ticket.event_id == event_id, Ticket.status.in_(PREWARM_STATUSES), Ticket.id > last_id)
+            .order_by(Ticket.id.asc())
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        stats = qr_cache.render_many([row.qr_code for row in rows if row.qr_code], remember=False)
+        totals['tickets'] += len(rows)
+        totals['rendered'] += stats['rendered']
+        totals['cached'] += stats['cached']
+        totals['render_seconds'] += stats['render_seconds']
+        if on_batch:
+            on_batch(totals['tickets'])
+
+    wall = time.perf_counter() - started
+    totals['workers'] = max(qr_cache.render_workers, 1)
+    totals['wall_seconds'] = round(wall, 3)
+    totals['pngs_per_second'] = round(totals['rendered'] / wall, 1) if totals['rendered'] and wall else None
+    totals['pngs_per_second_per_core'] = (
+        round(totals['rendered'] / totals['render_seconds'], 1) if totals['render_seconds'] else None
+    )
+    totals['render_seconds'] = round(totals['render_seconds'], 3)
+    return totals
+
+
+def prewarm_job(report, event_id, batch_size=DEFAULT_BATCH_SIZE):
+    """Background job target: progress is the number of tickets covered"""
+
+    def on_batch(done):
+        report(done)
+        db.session.commit()
+
+    return prewarm_event_qr(event_id, batch_size, on_batch)
@@ -0,0 +1,252 @@
+"""
+Host-wide seat state cache.
+Each venue's seat states are kept in a memory-mapped file (under /dev/shm
+when available) holding one status byte per seat position, laid out per
+section in row-major order. Every worker on the host maps the same file, so
+a write by one worker is seen by all of them without touching the database.
+
+The file is rebuilt from the database the first time a venue is read after
+the server (re)starts, updated write-through from committed seat changes,
+and at most every SEAT_CACHE_MAX_AGE_SECONDS a reader checks the venue's
+seat map version and applies the change log deltas written by other hosts.
+A new layout version (seats were generated) rebuilds the file.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from app.models import db, VenueSection, SeatMapVersion
+from app.utils.seat_changes import changes_since, current_versions, on_commit
+from app.utils.seat_inventory import STATUS_CODES
+from app.utils.seatmap import status_grids
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    fcntl = None
+    HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TMSC'
+FORMAT_VERSION = 2
+# magic, format, stamp, seat map version, checked_at (epoch seconds), layout length, layout version
+HEADER = struct.Struct('<4sHQQdIQ')
+VERSION_OFFSET = 4 + 2 + 8
+CHECKED_AT_OFFSET = VERSION_OFFSET + 8
+
+
+def default_directory():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'ticket-master-seats')
+
+
+def server_stamp():
+    """Identifies the running server; a file written under another stamp is rebuilt"""
+    # Gunicorn workers share their master's pid as parent, so the file is
+    # rebuilt once per server start rather than once per worker
+    return int(os.getenv('SEAT_CACHE_STAMP') or os.getppid())
+
+
+class VenueGrid:
+    """A mapped venue file; ``sections`` maps section id -> (offset, rows, seats_per_row)"""
+
+    def __init__(self, path):
+        with open(path, 'r+b') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.map = mmap.mmap(f.fileno(), 0)
+        magic, fmt, self.stamp, _, _, layout_length, self.layout_version = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a seat cache file')
+        layout = json.loads(bytes(self.map[HEADER.size:HEADER.size + layout_length]))
+        data_start = HEADER.size + layout_length
+        self.sections = {
+            section_id: (data_start + offset, rows, seats_per_row)
+            for section_id, offset, rows, seats_per_row in layout
+        }
+
+    @property
+    def version(self):
+        return struct.unpack_from('<Q', self.map, VERSION_OFFSET)[0]
+
+    @property
+    def checked_at(self):
+        return struct.unpack_from('<d', self.map, CHECKED_AT_OFFSET)[0]
+
+    def set_version(self, version):
+        struct.pack_into('<Q', self.map, VERSION_OFFSET, version)
+
+    def mark_checked(self, version):
+        struct.pack_into('<Qd', self.map, VERSION_OFFSET, version, time.time())
+
+    def statuses(self, section_id):
+        offset, rows, seats_per_row = self.sections[section_id]
+        return bytes(self.map[offset:offset + rows * seats_per_row])
+
+    def set_status(self, section_id, row, seat_number, code):
+        entry = self.sections.get(section_id)
+        if entry is None:
+            return False
+        offset, rows, seats_per_row = entry
+        if 1 <= row <= rows and 1 <= seat_number <= seats_per_row:
+            self.map[offset + (row - 1) * seats_per_row + (seat_number - 1)] = code
+        return True
+
+    def close(self):
+        self.map.close()
+
+
+class SeatStateCache:
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.max_age_seconds = 2.0
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SEAT_CACHE_ENABLED', True) and HAS_FCNTL
+        if not self.enabled:
+            return
+        self.directory = app.config.get('SEAT_CACHE_DIR') or default_directory()
+        self.max_age_seconds = app.config.get('SEAT_CACHE_MAX_AGE_SECONDS', self.max_age_seconds)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"[SEAT CACHE DISABLED] {e}")
+            self.enabled = False
+
+    def _path(self, venue_id):
+        return os.path.join(self.directory, f'venue-{venue_id}.seats')
+
+    @contextmanager
+    def _locked(self, venue_id):
+        with open(os.path.join(self.directory, f'venue-{venue_id}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _mapped(self, venue_id):
+        """This process's mapping of the venue file, reopened if the file was replaced"""
+        path = self._path(venue_id)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            grid = self._grids.get(venue_id)
+            if grid is None or grid.inode != inode:
+                if grid is not None:
+                    grid.close()
+                try:
+                    grid = self._grids[venue_id] = VenueGrid(path)
+                except (ValueError, struct.error) as e:
+                    logger.error(f"[SEAT CACHE FILE ERROR] {e}")
+                    self._grids.pop(venue_id, None)
+                    return None
+            return grid
+
+    def _rebuild(self, venue_id):
+        """Write a fresh venue file from the database; call with the venue lock held"""
+        sections = VenueSection.query.filter_by(venue_id=venue_id).order_by(VenueSection.name.asc()).all()
+        # Read the version first: a change committed meanwhile is re-applied later
+        version, layout_version = current_versions(venue_id)
+        grids, _ = status_grids(sections, datetime.utcnow())
+
+        layout, offset = [], 0
+        for sec in sections:
+            layout.append((sec.id, offset, sec.rows, sec.seats_per_row))
+            offset += sec.rows * sec.seats_per_row
+        layout_bytes = json.dumps(layout).encode()
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f'venue-{venue_id}.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, server_stamp(), version, time.time(), len(layout_bytes), layout_version))
+            f.write(layout_bytes)
+            for sec in sections:
+                f.write(grids[sec.id])
+        os.replace(tmp_path, self._path(venue_id))
+
+    def _refresh(self, venue_id, grid):
+        """Catch up with changes committed elsewhere; call with the venue lock held"""
+        version, layout_version, section_count = db.session.execute(
+            db.select(
+                db.select(SeatMapVersion.version).where(SeatMapVersion.venue_id == venue_id).scalar_subquery(),
+                db.select(SeatMapVersion.layout_version).where(SeatMapVersion.venue_id == venue_id).scalar_subquery(),
+                db.select(db.func.count(VenueSection.id)).where(VenueSection.venue_id == venue_id).scalar_subquery(),
+            )
+        ).one()
+        version = version or 0
+        if section_count != len(grid.sections) or version < grid.version or (layout_version or 0) != grid.layout_version:
+            return False
+        if version > grid.version:
+            _, changes = changes_since(venue_id, grid.version)
+            if changes is None:
+                return False
+            for change in changes:
+                if not grid.set_status(change['section_id'], change['row'], change['seat_number'], STATUS_CODES[change['status']]):
+                    return False
+        grid.mark_checked(version)
+        return True
+
+    def get(self, venue_id):
+        """The venue's mapped seat states, built or refreshed as needed"""
+        grid = self._mapped(venue_id)
+        if grid is not None and grid.stamp == server_stamp() and time.time() - grid.checked_at < self.max_age_seconds:
+            return grid
+
+        with self._locked(venue_id):
+            # Another worker may have done the work while we waited for the lock
+            grid = self._mapped(venue_id)
+            if grid is not None and grid.stamp == server_stamp():
+                if time.time() - grid.checked_at < self.max_age_seconds or self._refresh(venue_id, grid):
+                    return grid
+            self._rebuild(venue_id)
+            return self._mapped(venue_id)
+
+    def states(self, venue_id):
+        """
+        Return ``(version, layout_version, {section_id: (rows, seats_per_row, statuses)})``.
+
+        Sections come in name order. Served from the shared file when the
+        cache is enabled, otherwise straight from the database.
+        """
+        if self.enabled:
+            grid = self.get(venue_id)
+            return grid.version, grid.layout_version, {
+                section_id: (rows, seats_per_row, grid.statuses(section_id))
+                for section_id, (_, rows, seats_per_row) in grid.sections.items()
+            }
+
+        sections = VenueSection.query.filter_by(venue_id=venue_id).order_by(VenueSection.name.asc()).all()
+        version, layout_version = current_versions(venue_id)
+        grids, _ = status_grids(sections, datetime.utcnow())
+        return version, layout_version, {sec.id: (sec.rows, sec.seats_per_row, bytes(grids[sec.id])) for sec in sections}
+
+    def apply(self, venue_id, version, changes):
+        """Write-through of committed seat changes; registered with ``on_commit``"""
+        if not self.enabled:
+            return
+        grid = self._mapped(venue_id)
+        if grid is None:
+            return
+        with self._locked(venue_id):
+            grid = self._mapped(venue_id)
+            for change in changes:
+                grid.set_status(change['section_id'], change['row'], change['seat_number'], STATUS_CODES[change['status']])
+            # Only advance when no version in between is missing; otherwise the
+            # next refresh fills the gap from the change log
+            if grid.version == version - 1:
+                grid.set_version(version)
+
+
+cache = SeatStateCache()
+on_commit(cache.apply)
@@ -0,0 +1,227 @@
+"""
+Seat change tracking.
+Every seat state change bumps a per-venue version and is appended to a
+bounded change log, so seat map clients can ask for the seats that changed
+since the version they hold instead of downloading the full map again.
+Routes call ``record_seat_changes`` after mutating seats and before commit.
+The venue's version is only bumped as the transaction commits, so the lock
+on its version row is held for the commit alone rather than for the whole
+request, while versions still follow commit order (a client's delta never
+skips a change that committed after a later version). Once committed, the
+changes are handed to every listener registered with ``on_commit`` (for
+example the seat stream).
+"""
+import logging
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Event, Seat, VenueSection, SeatMapVersion, SeatChange
+from app.utils.seat_inventory import flip_seats, mirror_freed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RING_VERSIONS = 1000
+PRUNE_EVERY = 100
+
+STAGED_KEY = 'staged_seat_changes'
+PENDING_KEY = 'pending_seat_changes'
+_commit_listeners = []
+
+
+def on_commit(listener):
+    """Register ``listener(venue_id, version, changes)`` for committed seat changes"""
+    if listener not in _commit_listeners:
+        _commit_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(db.session, 'before_commit')
+def _log_staged(session):
+    staged = session.info.pop(STAGED_KEY, None)
+    if staged:
+        _log_changes(staged)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _dispatch_committed(session):
+    for venue_id, version, changes in session.info.pop(PENDING_KEY, []):
+        for listener in _commit_listeners:
+            try:
+                listener(venue_id, version, changes)
+            except Exception as e:
+                logger.error(f"[SEAT CHANGE LISTENER ERROR] {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(STAGED_KEY, None)
+    session.info.pop(PENDING_KEY, None)
+
+
+def ring_versions():
+    return current_app.config.get('SEAT_CHANGE_RING_VERSIONS', DEFAULT_RING_VERSIONS)
+
+
+def current_version(venue_id):
+    version = db.session.execute(
+        db.select(SeatMapVersion.version).where(SeatMapVersion.venue_id == venue_id)
+    ).scalar()
+    return version or 0
+
+
+def current_versions(venue_id):
+    """``(version, layout_version)`` of the venue's seat map"""
+    row = db.session.execute(
+        db.select(SeatMapVersion.version, SeatMapVersion.layout_version).where(SeatMapVersion.venue_id == venue_id)
+    ).first()
+    return (row.version, row.layout_version) if row else (0, 0)
+
+
+def bump_version(venue_id, layout=False):
+    """Increment and return the venue's seat map version
+
+    With ``layout`` the layout version moves too: seats were added, so
+    caches of seat ids and prices must be rebuilt.
+    """
+    values = {'version': SeatMapVersion.version + 1}
+    if layout:
+        values['layout_version'] = SeatMapVersion.layout_version + 1
+    for _ in range(2):
+        version = db.session.execute(
+            db.update(SeatMapVersion)
+            .where(SeatMapVersion.venue_id == venue_id)
+            .values(**values)
+            .returning(SeatMapVersion.version)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if version is not None:
+            return version
+        try:
+            with db.session.begin_nested():
+                db.session.add(SeatMapVersion(venue_id=venue_id, version=1, layout_version=1 if layout else 0))
+            return 1
+        except IntegrityError:
+            # Another transaction created the row first; bump that one
+            continue
+    raise RuntimeError(f'Could not bump seat map version for venue {venue_id}')
+
+
+def record_seat_changes(seat_ids, event_id=None):
+    """
+    Log ``seat_ids`` as changed by the current transaction.
+
+    When ``event_id`` is given the change is mirrored into that event's seat
+    inventory straight away; seats at another venue are left out. The seats'
+    states are read, and one new version per venue logged, when the
+    transaction commits.
+    """
+    ids = list(dict.fromkeys(sid for sid in seat_ids if sid))
+    if not ids:
+        return
+
+    if event_id:
+        rows = db.session.execute(
+            db.select(Seat.section_id, Seat.row, Seat.seat_number, Seat.status)
+            .join(VenueSection, Seat.section_id == VenueSection.id)
+            .join(Event, Event.venue_id == VenueSection.venue_id)
+            .where(Seat.id.in_(ids), Event.id == event_id)
+        ).all()
+        by_section = {}
+        for row in rows:
+            by_section.setdefault(row.section_id, {})[(row.row, row.seat_number)] = row.status
+        for section_id, changes in by_section.items():
+            flip_seats(event_id, section_id, changes)
+
+    staged = db.session.info.setdefault(STAGED_KEY, {})
+    for sid in ids:
+        staged.setdefault(sid, None)
+
+
+def record_dropped_seats(rows):
+    """
+    Log seats whose rows the current transaction deletes.
+
+    ``rows`` carry id, section_id, row, seat_number and venue_id; each is
+    logged as available, which is what a position without a row is.
+    """
+    staged = db.session.info.setdefault(STAGED_KEY, {})
+    for row in rows:
+        staged[row.id] = SimpleNamespace(
+            id=row.id,
+            section_id=row.section_id,
+            row=row.row,
+            seat_number=row.seat_number,
+            status=Seat.Status.AVAILABLE,
+            venue_id=row.venue_id,
+        )
+
+
+def _log_changes(staged):
+    """Bump each venue's version and log the seats' current states; runs just before commit"""
+    rows = db.session.execute(
+        db.select(Seat.id, Seat.section_id, Seat.row, Seat.seat_number, Seat.status, VenueSection.venue_id)
+        .join(VenueSection, Seat.section_id == VenueSection.id)
+        .where(Seat.id.in_(list(staged)))
+    ).all()
+    found = {row.id for row in rows}
+    rows.extend(dropped for sid, dropped in staged.items() if dropped is not None and sid not in found)
+
+    by_venue = {}
+    freed = {}
+    for row in rows:
+        by_venue.setdefault(row.venue_id, []).append(row)
+        if row.status == Seat.Status.AVAILABLE:
+            freed.setdefault(row.section_id, []).append((row.row, row.seat_number))
+    # Releases and expiries do not know the event they were for
+    mirror_freed(freed)
+
+    # Always lock version rows in the same order so two commits cannot deadlock
+    for venue_id in sorted(by_venue):
+        changed = by_venue[venue_id]
+        version = bump_version(venue_id)
+        entries = [
+            {
+                'venue_id': venue_id,
+                'version': version,
+                'seat_id': row.id,
+                'section_id': row.section_id,
+                'row': row.row,
+                'seat_number': row.seat_number,
+                'status': row.status,
+            }
+            for row in changed
+        ]
+        db.session.execute(db.insert(SeatChange), entries)
+        db.session.info.setdefault(PENDING_KEY, []).append((venue_id, version, entries))
+        if version % PRUNE_EVERY == 0:
+            db.session.execute(
+                db.delete(SeatChange)
+                .where(SeatChange.venue_id == venue_id, SeatChange.version <= version - ring_versions())
+                .execution_options(synchronize_session=False)
+            )
+
+
+def changes_since(venue_id, since):
+    """
+    Return ``(version, changes)`` for seats changed after version ``since``.
+
+    ``changes`` is None when ``since`` has aged out of the change log and the
+    client must refetch the full map. Each seat appears once, in its latest
+    state.
+    """
+    version = current_version(venue_id)
+    if since >= version:
+        return version, []
+    if since < version - ring_versions():
+        return version, None
+
+    latest = {}
+    for change in SeatChange.query.filter(
+        SeatChange.venue_id == venue_id,
+        SeatChange.version > since,
+        SeatChange.version <= version,
+    ).order_by(SeatChange.version.asc()):
+        latest[change.seat_id] = change
+
+    return version, [change.to_dict() for change in latest.values()]
@@ -0,0 +1,250 @@
+"""
+Best-available seat finder.
+Keeps, per venue, an index of the free runs in every row: contiguous
+available seats that share a price. The index is built once from the
+database and then kept current by applying the seat map deltas recorded in
+``seat_changes``, so a search only walks the row run lists. Seat generation
+writes no deltas but moves the layout version, which forces a rebuild.
+
+Indexes are never changed in place: a delta produces a new index sharing
+the untouched rows, so a search always sees one consistent version. Builds
+and updates take a lock per venue, so one venue's rebuild does not hold up
+searches or updates anywhere else.
+"""
+from datetime import datetime
+from threading import Lock
+from app.models import db, Seat, VenueSection
+from app.utils.seat_changes import changes_since, current_versions
+from app.utils.seatmap import seat_address
+
+ROW_PREFERENCES = ('front', 'back')
+MAX_CACHED_VENUES = 32
+
+
+class RowRuns:
+    """Seats of one row and the free runs derived from them"""
+
+    def __init__(self):
+        self.seats = {}  # seat_number -> [seat_id, price, free]
+        self.runs = []   # (first_seat_number, length, price)
+        self.longest = 0
+
+    def rebuild(self):
+        runs = []
+        start = length = price = None
+        for number in sorted(self.seats):
+            seat_id, seat_price, free = self.seats[number]
+            if free and length and number == start + length and seat_price == price:
+                length += 1
+                continue
+            if length:
+                runs.append((start, length, price))
+            start, length, price = (number, 1, seat_price) if free else (None, 0, None)
+        if length:
+            runs.append((start, length, price))
+        self.runs = runs
+        self.longest = max((run[1] for run in runs), default=0)
+
+
+class FreeRunIndex:
+    """Free runs for every row of a venue at one seat map version"""
+
+    def __init__(self, venue_id, version, layout_version=0):
+        self.venue_id = venue_id
+        self.version = version
+        self.layout_version = layout_version
+        self.sections = {}  # section_id -> {'name', 'seats_per_row'}
+        self.rows = {}      # (section_id, row) -> RowRuns
+        self._orders = {}   # search order of row keys per preference
+
+    @classmethod
+    def build(cls, venue_id):
+        index = cls(venue_id, *current_versions(venue_id))
+        for sec in VenueSection.query.filter_by(venue_id=venue_id):
+            index.sections[sec.id] = {'name': sec.name, 'seats_per_row': sec.seats_per_row, 'is_virtual': sec.is_virtual}
+            if sec.is_virtual:
+                # Positions without a Seat row are free, addressed until first held
+                for row in range(1, sec.rows + 1):
+                    index.row(sec.id, row).seats.update(
+                        (n, [seat_address(sec.id, row, n), None, True]) for n in range(1, sec.seats_per_row + 1)
+                    )
+
+        if index.sections:
+            seats = Seat.__table__.c
+            for seat_id, section_id, row, seat_number, price, is_free in _seat_states(seats.section_id.in_(list(index.sections))):
+                index.row(section_id, row).seats[seat_number] = [seat_id, price, is_free]
+
+        for row_runs in index.rows.values():
+            row_runs.rebuild()
+        return index
+
+    def row(self, section_id, row):
+        key = (section_id, row)
+        if key not in self.rows:
+            self.rows[key] = RowRuns()
+            self._orders.clear()
+        return self.rows[key]
+
+    def _order(self, section_rank, row_preference):
+        """Row keys sorted best-first as (rank, row key, section, row)"""
+        cache_key = (tuple(section_rank) if section_rank is not None else None, row_preference)
+        order = self._orders.get(cache_key)
+        if order is None:
+            order = sorted(
+                (
+                    section_rank[section_id] if section_rank is not None else 0,
+                    row if row_preference == 'front' else -row,
+                    section_id,
+                    row,
+                )
+                for section_id, row in self.rows
+                if section_rank is None or section_id in section_rank
+            )
+            self._orders[cache_key] = order
+        return order
+
+    def with_changes(self, version, changes):
+        """
+        Return a new index at ``version`` with ``changes`` applied.
+
+        Changed seats are re-read so they are judged free by the same rules
+        as ``build`` (an expired hold is free). Rows nothing touched are
+        shared with this index, which is left as it was.
+        """
+        index = FreeRunIndex(self.venue_id, version, self.layout_version)
+        index.sections = self.sections
+        index.rows = dict(self.rows)
+        changed = {change['seat_id']: change for change in changes if change['section_id'] in self.sections}
+        touched = set()
+
+        def row_copy(key):
+            if key not in touched:
+                row_runs = RowRuns()
+                if key in self.rows:
+                    row_runs.seats = dict(self.rows[key].seats)
+                index.rows[key] = row_runs
+                touched.add(key)
+            return index.rows[key]
+
+        if changed:
+            for seat_id, section_id, row, seat_number, price, is_free in _seat_states(Seat.__table__.c.id.in_(list(changed))):
+                row_copy((section_id, row)).seats[seat_number] = [seat_id, price, is_free]
+                del changed[seat_id]
+        # Seats deleted since: a virtual position is free again, anything else is gone
+        for change in changed.values():
+            seats = row_copy((change['section_id'], change['row'])).seats
+            if self.sections[change['section_id']]['is_virtual']:
+                seats[change['seat_number']] = [seat_address(change['section_id'], change['row'], change['seat_number']), None, True]
+            else:
+                seats.pop(change['seat_number'], None)
+        for key in touched:
+            index.rows[key].rebuild()
+        if len(index.rows) == len(self.rows):
+            index._orders = dict(self._orders)
+        return index
+
+    def find(self, quantity, price=None, max_price=None, section_ids=None, row_preference='front', limit=5):
+        """
+        Return up to ``limit`` candidate blocks of ``quantity`` adjacent seats.
+
+        Blocks are ranked by the order of ``section_ids`` (when given, only
+        those sections are searched), then by row according to
+        ``row_preference``, then by distance from the middle of the row.
+        """
+        section_rank = {sid: i for i, sid in enumerate(section_ids)} if section_ids else None
+        candidates = []
+        stop_at = None
+        # Rows come best-first, so stop once ``limit`` blocks are found and
+        # every remaining row ranks strictly worse
+        for rank, row_key, section_id, row in self._order(section_rank, row_preference):
+            if stop_at is not None and (rank, row_key) != stop_at:
+                break
+            row_runs = self.rows[(section_id, row)]
+            if row_runs.longest < quantity:
+                continue
+            middle = (self.sections[section_id]['seats_per_row'] + 1) / 2
+            for start, length, run_price in row_runs.runs:
+                if length < quantity:
+                    continue
+                if price is not None and run_price != price:
+                    continue
+                if max_price is not None and (run_price is None or run_price > max_price):
+                    continue
+                # Centre the block on the middle of the row as far as the run allows
+                best = int(round(middle - (quantity - 1) / 2))
+                first = min(max(best, start), start + length - quantity)
+                candidates.append((
+                    rank,
+                    row_key,
+                    abs(first + (quantity - 1) / 2 - middle),
+                    section_id,
+                    row,
+                    first,
+                    run_price,
+                ))
+            if stop_at is None and len(candidates) >= limit:
+                stop_at = (rank, row_key)
+
+        candidates.sort()
+        blocks = []
+        for _, _, _, section_id, row, first, run_price in candidates[:limit]:
+            seats = self.rows[(section_id, row)].seats
+            blocks.append({
+                'section_id': section_id,
+                'section_name': self.sections[section_id]['name'],
+                'row': row,
+                'seat_numbers': list(range(first, first + quantity)),
+                'seat_ids': [seats[n][0] for n in range(first, first + quantity)],
+                'price': run_price,
+            })
+        return blocks
+
+
+def _seat_states(condition):
+    """``(id, section_id, row, seat_number, price, free)`` for seats matching ``condition``"""
+    seats = Seat.__table__.c
+    free = db.or_(
+        seats.status == Seat.Status.AVAILABLE,
+        db.and_(seats.status == Seat.Status.RESERVED, seats.reserved_until < datetime.utcnow()),
+    )
+    rows = db.session.connection().execute(
+        db.select(seats.id, seats.section_id, seats.row, seats.seat_number, seats.price, free).where(condition)
+    )
+    return [(seat_id, section_id, row, number, price, bool(is_free)) for seat_id, section_id, row, number, price, is_free in rows]
+
+
+_indexes = {}
+_venue_locks = {}
+_lock = Lock()
+
+
+def _venue_lock(venue_id):
+    with _lock:
+        return _venue_locks.setdefault(venue_id, Lock())
+
+
+def get_index(venue_id):
+    """Return the venue's FreeRunIndex, brought up to the current version"""
+    index = _indexes.get(venue_id)
+    if index is not None and (index.version, index.layout_version) == current_versions(venue_id):
+        return index
+
+    with _venue_lock(venue_id):
+        # Another request may have brought it up to date while we waited
+        index = _indexes.get(venue_id)
+        version, layout_version = current_versions(venue_id)
+        if index is not None and (index.version, index.layout_version) == (version, layout_version):
+            return index
+        if index is not None and index.layout_version != layout_version:
+            # Sections or seats were added without deltas; start over
+            index = None
+        if index is not None:
+            latest, changes = changes_since(venue_id, index.version)
+            index = index.with_changes(latest, changes) if changes is not None else None
+        if index is None:
+            index = FreeRunIndex.build(venue_id)
+        with _lock:
+            _indexes[venue_id] = index
+            while len(_indexes) > MAX_CACHED_VENUES:
+                _indexes.pop(next(iter(_indexes)))
+        return index
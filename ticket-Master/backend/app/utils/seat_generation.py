@@ -0,0 +1,114 @@
+"""
+Bulk seat generation.
+Seats for new sections are written with set-based statements instead of one
+ORM object per seat: INSERT ... SELECT over generate_series on PostgreSQL,
+chunked executemany elsewhere. Work is split into chunks of whole rows, so a
+run that commits per chunk can resume from the last row written.
+"""
+import uuid
+from datetime import datetime
+from sqlalchemy import text
+from app.models import db, Event, Seat, VenueSection
+from app.utils.seat_inventory import create_event_inventory
+from app.utils.seat_changes import bump_version
+
+DEFAULT_CHUNK_SEATS = 5000
+JOB_KIND = 'generate_seats'
+
+_PG_INSERT = text("""
+    INSERT INTO seats (id, created_at, updated_at, section_id, row, seat_number, status)
+    SELECT gen_random_uuid()::text, :now, :now, :section_id, r, s, :status
+    FROM generate_series(:first_row, :last_row) AS r, generate_series(1, :seats_per_row) AS s
+""")
+
+
+def _insert_rows(section, first_row, last_row, now):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(_PG_INSERT, {
+            'now': now,
+            'section_id': section.id,
+            'status': Seat.Status.AVAILABLE,
+            'first_row': first_row,
+            'last_row': last_row,
+            'seats_per_row': section.seats_per_row,
+        })
+        return
+    db.session.execute(db.insert(Seat), [
+        {
+            'id': str(uuid.uuid4()),
+            'created_at': now,
+            'updated_at': now,
+            'section_id': section.id,
+            'row': row,
+            'seat_number': seat_number,
+            'status': Seat.Status.AVAILABLE,
+        }
+        for row in range(first_row, last_row + 1)
+        for seat_number in range(1, section.seats_per_row + 1)
+    ])
+
+
+def generate_section_seats(section, chunk_seats=DEFAULT_CHUNK_SEATS, on_chunk=None):
+    """
+    Create the missing rows of ``section``'s seats; returns the number created.
+
+    Rows already present are skipped, so this is safe to rerun after a
+    partial run. Virtual sections get no rows up front. ``on_chunk(seats)`` is called after each chunk is written.
+    """
+    if section.is_virtual or section.rows <= 0 or section.seats_per_row <= 0:
+        return 0
+    last_written = db.session.execute(
+        db.select(db.func.max(Seat.row)).where(Seat.section_id == section.id)
+    ).scalar() or 0
+
+    rows_per_chunk = max(chunk_seats // section.seats_per_row, 1)
+    now = datetime.utcnow()
+    created = 0
+    for first_row in range(last_written + 1, section.rows + 1, rows_per_chunk):
+        last_row = min(first_row + rows_per_chunk - 1, section.rows)
+        _insert_rows(section, first_row, last_row, now)
+        seats = (last_row - first_row + 1) * section.seats_per_row
+        created += seats
+        if on_chunk:
+            on_chunk(seats)
+    return created
+
+
+def build_event_seating(event_id, section_ids, publish=False, on_chunk=None):
+    """
+    Generate seats for ``section_ids`` and set up the event's seat inventory.
+
+    With ``publish`` the event is moved from draft to published once every
+    seat exists. The caller commits.
+    """
+    sections = VenueSection.query.filter(VenueSection.id.in_(section_ids)).all()
+    created = sum(generate_section_seats(section, on_chunk=on_chunk) for section in sections)
+
+    event = db.session.get(Event, event_id)
+    create_event_inventory(event.id, VenueSection.query.filter_by(venue_id=event.venue_id).all())
+    # New sections change the venue's seat map and its layout
+    bump_version(event.venue_id, layout=True)
+    if publish and event.status == Event.Status.DRAFT:
+        event.status = Event.Status.PUBLISHED
+    return {'event_id': event.id, 'seats_created': created}
+
+
+def seat_generation_job(report, event_id, section_ids, publish=False):
+    """
+    Background job target: commit each chunk so progress and partial work persist.
+
+    A rerun of a failed job counts the seats its earlier run already wrote.
+    """
+    done = db.session.execute(
+        db.select(db.func.count()).select_from(Seat).where(Seat.section_id.in_(section_ids))
+    ).scalar()
+
+    def on_chunk(seats):
+        nonlocal done
+        done += seats
+        report(done)
+        db.session.commit()
+
+    result = build_event_seating(event_id, section_ids, publish, on_chunk)
+    report(done)
+    return result
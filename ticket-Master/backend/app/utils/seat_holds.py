@@ -0,0 +1,81 @@
+"""
+Seat hold helpers.
+Holds are claimed with a single conditional UPDATE so two buyers racing for
+the same seat can never both win it, and a group hold costs one round trip
+regardless of how many seats it covers.
+"""
+from datetime import datetime, timedelta
+from app.models import db, Seat
+
+
+def holdable_clause(user_id, now):
+    """SQL condition matching seats that ``user_id`` may hold right now"""
+    return db.or_(
+        Seat.status == Seat.Status.AVAILABLE,
+        db.and_(
+            Seat.status == Seat.Status.RESERVED,
+            db.or_(
+                Seat.reserved_until.is_(None),
+                Seat.reserved_until < now,
+                Seat.reserved_by == user_id,
+            ),
+        ),
+    )
+
+
+def claim_seats(seat_ids, user_id, hold_seconds, now=None):
+    """
+    Hold every seat in ``seat_ids`` for ``user_id`` or none of them.
+
+    Returns ``(True, [])`` when the full set was claimed; the caller commits.
+    Returns ``(False, conflicts)`` otherwise, after rolling the session back
+    so no partial hold survives.
+    """
+    now = now or datetime.utcnow()
+    ids = list(dict.fromkeys(seat_ids))
+    if not ids:
+        return False, []
+
+    stmt = (
+        db.update(Seat)
+        .where(Seat.id.in_(ids), holdable_clause(user_id, now))
+        .values(
+            status=Seat.Status.RESERVED,
+            reserved_by=user_id,
+            reserved_until=now + timedelta(seconds=hold_seconds),
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = db.session.execute(stmt)
+
+    if result.rowcount == len(ids):
+        return True, []
+
+    db.session.rollback()
+    return False, find_conflicts(ids, user_id, now)
+
+
+def find_conflicts(seat_ids, user_id, now=None):
+    """Describe why each seat in ``seat_ids`` cannot be held by ``user_id``"""
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        db.select(Seat.id, Seat.status, Seat.reserved_by, Seat.reserved_until)
+        .where(Seat.id.in_(seat_ids))
+    ).all()
+    found = {row.id: row for row in rows}
+
+    conflicts = []
+    for sid in seat_ids:
+        row = found.get(sid)
+        if row is None:
+            conflicts.append({'seat_id': sid, 'reason': 'not_found'})
+            continue
+        if row.status == Seat.Status.AVAILABLE:
+            continue
+        if row.status == Seat.Status.RESERVED and (
+            row.reserved_until is None or row.reserved_until < now or row.reserved_by == user_id
+        ):
+            continue
+        conflicts.append({'seat_id': sid, 'reason': f'unavailable ({row.status})'})
+    return conflicts
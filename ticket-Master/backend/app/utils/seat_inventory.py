@@ -0,0 +1,202 @@
+"""
+Event-scoped seat inventory.
+Seat states for an event are kept as one packed status array per
+(event, VenueSection): byte ``(row - 1) * seats_per_row + (seat_number - 1)``
+holds the status code of that seat. Setting up a new event at an existing
+venue is one row insert per section, and reading a section is one blob fetch.
+
+These arrays are a mirror, not the authority: holds and sales are still
+arbitrated on the venue-level ``Seat`` rows, so two events at one venue
+still share seat states, and clients must not treat an event's array as
+proof that a seat can be held. Routes mirror a hold or sale into the event
+they are given, after checking the seats are at that event's venue. A seat
+freed at the venue (released, expired or dropped) is shown available again
+in every event array still holding it.
+"""
+from app.models import db, Event, Seat, EventSeatInventory, VenueSection
+
+STATUS_CODES = {
+    Seat.Status.AVAILABLE: 0,
+    Seat.Status.RESERVED: 1,
+    Seat.Status.SOLD: 2,
+    Seat.Status.BLOCKED: 3,
+}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+MAX_FLIP_ATTEMPTS = 5
+
+
+class InventoryConflict(Exception):
+    """Raised when a section keeps changing underneath a flip"""
+
+
+class SectionInventory:
+    """In-memory view of one packed section status array"""
+
+    def __init__(self, event_id, section_id, rows, seats_per_row, statuses, version=0):
+        self.event_id = event_id
+        self.section_id = section_id
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        self.statuses = bytearray(statuses)
+        self.version = version
+
+    @classmethod
+    def from_model(cls, inv):
+        return cls(inv.event_id, inv.section_id, inv.rows, inv.seats_per_row, inv.statuses, inv.version)
+
+    def offset(self, row, seat_number):
+        if not (1 <= row <= self.rows and 1 <= seat_number <= self.seats_per_row):
+            raise ValueError(f'Seat {row}-{seat_number} is outside section {self.section_id}')
+        return (row - 1) * self.seats_per_row + (seat_number - 1)
+
+    def get(self, row, seat_number):
+        return STATUS_NAMES[self.statuses[self.offset(row, seat_number)]]
+
+    def set(self, row, seat_number, status):
+        self.statuses[self.offset(row, seat_number)] = STATUS_CODES[status]
+
+    def counts(self):
+        return {status: self.statuses.count(code) for status, code in STATUS_CODES.items()}
+
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'section_id': self.section_id,
+            'rows': self.rows,
+            'seats_per_row': self.seats_per_row,
+            'version': self.version,
+            'counts': self.counts(),
+        }
+
+
+def create_event_inventory(event_id, sections):
+    """Add an all-available status array for each section; the caller commits"""
+    existing = set(db.session.execute(
+        db.select(EventSeatInventory.section_id).where(EventSeatInventory.event_id == event_id)
+    ).scalars())
+
+    created = 0
+    for section in sections:
+        if section.id in existing:
+            continue
+        db.session.add(EventSeatInventory(
+            event_id=event_id,
+            section_id=section.id,
+            rows=section.rows,
+            seats_per_row=section.seats_per_row,
+            statuses=bytes(section.rows * section.seats_per_row),
+            version=0,
+        ))
+        created += 1
+    return created
+
+
+def load_section(event_id, section_id):
+    """Return the SectionInventory for (event, section), or None"""
+    inv = db.session.execute(
+        db.select(EventSeatInventory).where(
+            EventSeatInventory.event_id == event_id,
+            EventSeatInventory.section_id == section_id,
+        ).execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+    return SectionInventory.from_model(inv) if inv else None
+
+
+def load_event(event_id):
+    """Return {section_id: SectionInventory} for every section of an event"""
+    rows = db.session.execute(
+        db.select(EventSeatInventory).where(EventSeatInventory.event_id == event_id)
+    ).scalars()
+    return {inv.section_id: SectionInventory.from_model(inv) for inv in rows}
+
+
+def flip_seats(event_id, section_id, changes, allowed_from=None):
+    """
+    Apply ``changes`` ({(row, seat_number): status}) to one section.
+
+    The write is a compare-and-swap on ``version`` so concurrent flips of the
+    same section never lose each other's updates. When ``allowed_from`` is
+    given, seats whose current status is not in it are left alone and
+    reported back. Returns ``(section, conflicts)``; the caller commits.
+    """
+    for _ in range(MAX_FLIP_ATTEMPTS):
+        section = load_section(event_id, section_id)
+        if section is None:
+            return None, []
+
+        conflicts = []
+        before = bytes(section.statuses)
+        for (row, seat_number), status in changes.items():
+            if allowed_from is not None and section.get(row, seat_number) not in allowed_from:
+                conflicts.append((row, seat_number))
+                continue
+            section.set(row, seat_number, status)
+        if section.statuses == before:
+            return section, conflicts
+
+        result = db.session.execute(
+            db.update(EventSeatInventory)
+            .where(
+                EventSeatInventory.event_id == event_id,
+                EventSeatInventory.section_id == section_id,
+                EventSeatInventory.version == section.version,
+            )
+            .values(statuses=bytes(section.statuses), version=section.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            section.version += 1
+            return section, conflicts
+
+    raise InventoryConflict(f'Section {section_id} of event {event_id} is too contended')
+
+
+def seats_outside_event(event_id, seat_ids):
+    """Those of ``seat_ids`` that are not seats at ``event_id``'s venue"""
+    ids = list(dict.fromkeys(sid for sid in seat_ids if sid))
+    if not ids:
+        return []
+    inside = set(db.session.execute(
+        db.select(Seat.id)
+        .join(VenueSection, Seat.section_id == VenueSection.id)
+        .join(Event, Event.venue_id == VenueSection.venue_id)
+        .where(Event.id == event_id, Seat.id.in_(ids))
+    ).scalars())
+    return [sid for sid in ids if sid not in inside]
+
+
+def mirror_freed(freed):
+    """
+    Show seats freed at the venue as available in every event array holding them.
+
+    ``freed`` is ``{section_id: [(row, seat_number), ...]}``. Sold seats are
+    left alone; the caller commits.
+    """
+    if not freed:
+        return
+    arrays = db.session.execute(
+        db.select(EventSeatInventory.event_id, EventSeatInventory.section_id)
+        .where(EventSeatInventory.section_id.in_(list(freed)))
+    ).all()
+    for event_id, section_id in arrays:
+        changes = {position: Seat.Status.AVAILABLE for position in freed[section_id]}
+        flip_seats(event_id, section_id, changes, allowed_from={Seat.Status.RESERVED})
+
+
+def diff_states(before, after, seats_per_row):
+    """List the seats whose status differs between two packed arrays"""
+    if len(before) != len(after):
+        raise ValueError('Status arrays describe different section layouts')
+    changes = []
+    for offset, (old, new) in enumerate(zip(before, after)):
+        if old != new:
+            row, seat_index = divmod(offset, seats_per_row)
+            changes.append({
+                'row': row + 1,
+                'seat_number': seat_index + 1,
+                'from': STATUS_NAMES[old],
+                'to': STATUS_NAMES[new],
+            })
+    return changes
+
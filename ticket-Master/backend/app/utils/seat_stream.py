@@ -0,0 +1,221 @@
+"""
+Server-sent event stream of seat status changes.
+Committed seat changes are published to a backplane channel per venue.
+Each stream subscriber coalesces what arrives within one tick into a single
+event carrying the latest state of every changed seat.
+
+The in-memory backplane reaches subscribers in the same process only. With
+several workers or hosts, set SEAT_STREAM_BACKPLANE=redis and point
+SEAT_STREAM_REDIS_URL at a Redis-compatible server; docker-compose.yml runs
+one for local development, and the tests use fakeredis.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from app.utils.seat_changes import on_commit
+try:
+    import redis
+    HAS_REDIS = True
+except Exception:
+    redis = None
+    HAS_REDIS = False
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'seat-changes:'
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def channel_for(venue_id):
+    return f'{CHANNEL_PREFIX}{venue_id}'
+
+
+class InMemoryBackplane:
+    """Fan-out between threads of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.offer(message)
+
+    def subscribe(self, channel):
+        subscription = InMemorySubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class InMemorySubscription:
+    def __init__(self, backplane, channel):
+        self.channel = channel
+        self._backplane = backplane
+        self._queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._overflowed = False
+
+    def offer(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # A stalled client must not block publishers; it is told to refetch instead
+            self._overflowed = True
+
+    def get(self, timeout, window):
+        """Wait up to ``timeout`` for a message, then collect for ``window`` more seconds"""
+        messages = []
+        try:
+            messages.append(self._queue.get(timeout=timeout))
+            deadline = time.monotonic() + window
+            while True:
+                messages.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            pass
+        overflowed, self._overflowed = self._overflowed, False
+        return messages, overflowed
+
+    def close(self):
+        self._backplane.unsubscribe(self)
+
+
+class RedisBackplane:
+    """Fan-out across processes and hosts through Redis pub/sub"""
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            if not HAS_REDIS:
+                raise RuntimeError('SEAT_STREAM_BACKPLANE=redis requires the redis package')
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout, window):
+        messages = []
+        # get_message() also returns None after swallowing a subscribe
+        # confirmation, so wait against a deadline rather than one call
+        deadline = time.monotonic() + timeout
+        collecting = False
+        while True:
+            raw = self._pubsub.get_message(timeout=max(deadline - time.monotonic(), 0))
+            if raw is not None:
+                messages.append(json.loads(raw['data']))
+                if not collecting:
+                    collecting, deadline = True, time.monotonic() + window
+            if time.monotonic() >= deadline:
+                break
+        return messages, False
+
+    def close(self):
+        self._pubsub.close()
+
+
+class SeatStreamHub:
+    """Publishes committed seat changes and turns subscriptions into SSE"""
+
+    def __init__(self):
+        self.backplane = InMemoryBackplane()
+        self.tick_seconds = 0.25
+        self.heartbeat_seconds = 15
+        self.max_stream_seconds = 300
+
+    def init_app(self, app):
+        if app.config.get('SEAT_STREAM_BACKPLANE') == 'redis':
+            self.backplane = RedisBackplane(app.config.get('SEAT_STREAM_REDIS_URL'))
+        self.tick_seconds = app.config.get('SEAT_STREAM_TICK_SECONDS', self.tick_seconds)
+        self.heartbeat_seconds = app.config.get('SEAT_STREAM_HEARTBEAT_SECONDS', self.heartbeat_seconds)
+        self.max_stream_seconds = app.config.get('SEAT_STREAM_MAX_SECONDS', self.max_stream_seconds)
+
+    def publish(self, venue_id, version, changes):
+        message = {
+            'venue_id': venue_id,
+            'version': version,
+            'changes': [
+                {key: change[key] for key in ('seat_id', 'section_id', 'row', 'seat_number', 'status', 'version')}
+                for change in changes
+            ],
+        }
+        try:
+            self.backplane.publish(channel_for(venue_id), message)
+        except Exception as e:
+            logger.error(f"[SEAT STREAM PUBLISH ERROR] {e}")
+
+    def stream(self, venue_id, backlog=None):
+        """
+        Yield SSE frames for ``venue_id`` until ``max_stream_seconds`` pass.
+
+        ``backlog`` is an optional (version, changes) pair sent first so a
+        reconnecting client catches up on what it missed.
+        """
+        subscription = self.backplane.subscribe(channel_for(venue_id))
+        try:
+            yield 'retry: 2000\n\n'
+            if backlog is not None:
+                version, changes = backlog
+                if changes is None:
+                    yield format_event('refetch', version, {'venue_id': venue_id, 'version': version})
+                elif changes:
+                    yield format_event('seats', version, {'venue_id': venue_id, 'version': version, 'changes': changes})
+
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < self.max_stream_seconds:
+                messages, overflowed = subscription.get(self.heartbeat_seconds, self.tick_seconds)
+                if overflowed:
+                    yield format_event('refetch', None, {'venue_id': venue_id})
+                    last_sent = time.monotonic()
+                    continue
+                if messages:
+                    version, changes = coalesce(messages)
+                    yield format_event('seats', version, {'venue_id': venue_id, 'version': version, 'changes': changes})
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= self.heartbeat_seconds:
+                    yield ': keep-alive\n\n'
+                    last_sent = time.monotonic()
+        finally:
+            subscription.close()
+
+
+def coalesce(messages):
+    """Merge published batches, keeping only the latest state per seat"""
+    latest = {}
+    version = 0
+    for message in sorted(messages, key=lambda m: m['version']):
+        version = max(version, message['version'])
+        for change in message['changes']:
+            latest[change['seat_id']] = change
+    return version, list(latest.values())
+
+
+def format_event(name, version, data):
+    frame = f'event: {name}\n'
+    if version is not None:
+        frame += f'id: {version}\n'
+    return frame + f'data: {json.dumps(data)}\n\n'
+
+
+hub = SeatStreamHub()
+on_commit(hub.publish)
@@ -0,0 +1,426 @@
+"""
+Seat map serialization.
+The compact format sends, per section, the grid dimensions plus
+run-length-encoded status and price-tier runs over the row-major grid.
+Clients address a seat as ``<section_id>:<row>:<seat_number>``.
+
+Seats of virtual sections exist only as grid positions until they are
+touched; reads fill the positions without a Seat row with available seats,
+``resolve_seat_ids`` creates the row when a seat is first held or sold and
+``drop_default_seats`` deletes it again once the seat is released.
+
+Both map formats take seat states from the seat state cache and the static
+seat attributes (ids, prices) from a layout read once per layout version.
+"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from itertools import groupby
+from threading import Lock
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Seat, Ticket, VenueSection
+from app.utils.seat_changes import record_dropped_seats
+from app.utils.seat_inventory import STATUS_CODES, STATUS_NAMES
+
+# Grid positions that have no Seat row
+NO_SEAT = 255
+
+COMPACT_FORMAT_VERSION = 1
+
+# Encoded compact maps keyed by (venue_id, seat map version)
+COMPACT_CACHE_SIZE = 64
+_compact_cache = OrderedDict()
+_compact_cache_lock = Lock()
+
+# Static seat attributes keyed by (venue_id, layout version, section ids)
+LAYOUT_CACHE_SIZE = 16
+_layout_cache = OrderedDict()
+_layout_cache_lock = Lock()
+
+
+def run_length_encode(values):
+    """Flatten ``values`` into [value, count, value, count, ...]"""
+    runs = []
+    for value, group in groupby(values):
+        runs.append(value)
+        runs.append(sum(1 for _ in group))
+    return runs
+
+
+def run_length_decode(runs):
+    values = []
+    for i in range(0, len(runs), 2):
+        values.extend([runs[i]] * runs[i + 1])
+    return values
+
+
+def seat_address(section_id, row, seat_number):
+    return f'{section_id}:{row}:{seat_number}'
+
+
+def virtual_seat(section_id, row, seat_number):
+    """Seat dict for a virtual-section position that has no Seat row"""
+    return {
+        'id': seat_address(section_id, row, seat_number),
+        'created_at': None,
+        'updated_at': None,
+        'section_id': section_id,
+        'row': row,
+        'seat_number': seat_number,
+        'status': Seat.Status.AVAILABLE,
+        'price': None,
+        'accessibility': None,
+        'reserved_by': None,
+        'reserved_until': None,
+        'virtual': True,
+    }
+
+
+def _insert_ignoring_duplicates(rows):
+    """Insert Seat rows, skipping positions another transaction just created"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(Seat.__table__)
+        db.session.execute(insert.on_conflict_do_nothing(), rows)
+        return
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Seat.__table__), row)
+        except IntegrityError:
+            pass
+
+
+def materialize_seats(section, positions):
+    """Create Seat rows for virtual ``positions`` [(row, seat_number)] that lack one"""
+    now = datetime.utcnow()
+    rows = [
+        {
+            'id': str(uuid.uuid4()),
+            'created_at': now,
+            'updated_at': now,
+            'section_id': section.id,
+            'row': row,
+            'seat_number': seat_number,
+            'status': Seat.Status.AVAILABLE,
+        }
+        for row, seat_number in positions
+        if 1 <= row <= section.rows and 1 <= seat_number <= section.seats_per_row
+    ]
+    if rows:
+        _insert_ignoring_duplicates(rows)
+    return len(rows)
+
+
+def resolve_seat_ids(refs, create=True):
+    """Replace ``section:row:seat`` addresses in ``refs`` with Seat ids
+
+    Plain seat ids pass through untouched, as do addresses that match no
+    seat, so callers report those as not found. With ``create``, addresses
+    inside a virtual section get their Seat row created (in the caller's
+    transaction); pass False where the seat is not about to be taken.
+    """
+    wanted = {}
+    for ref in refs:
+        parts = str(ref).split(':')
+        if len(parts) != 3:
+            continue
+        try:
+            wanted.setdefault(parts[0], {})[(int(parts[1]), int(parts[2]))] = ref
+        except ValueError:
+            continue
+
+    def lookup(section_id, positions):
+        return db.session.execute(
+            db.select(Seat.id, Seat.row, Seat.seat_number).where(
+                Seat.section_id == section_id,
+                db.tuple_(Seat.row, Seat.seat_number).in_(list(positions)),
+            )
+        ).all()
+
+    virtual = {}
+    if wanted:
+        virtual = {
+            sec.id: sec for sec in VenueSection.query.filter(
+                VenueSection.id.in_(list(wanted)), VenueSection.is_virtual.is_(True)
+            )
+        }
+
+    resolved = {}
+    for section_id, positions in wanted.items():
+        rows = lookup(section_id, positions)
+        if create and section_id in virtual and len(rows) < len(positions):
+            found = {(row, seat_number) for _, row, seat_number in rows}
+            if materialize_seats(virtual[section_id], [p for p in positions if p not in found]):
+                rows = lookup(section_id, positions)
+        for seat_id, row, seat_number in rows:
+            resolved[positions[(row, seat_number)]] = seat_id
+
+    return [resolved.get(ref, ref) for ref in refs]
+
+
+def status_grids(sections, now):
+    """
+    Row-major status codes and prices of every position in ``sections``.
+
+    Returns ``(grids, prices)`` keyed by section id, from a single seat
+    query; holds that expired before ``now`` count as available.
+    """
+    grids = {}
+    prices = {}
+    for sec in sections:
+        size = sec.rows * sec.seats_per_row
+        empty = STATUS_CODES[Seat.Status.AVAILABLE] if sec.is_virtual else NO_SEAT
+        grids[sec.id] = bytearray([empty]) * size
+        prices[sec.id] = [None] * size
+
+    if grids:
+        seats = Seat.__table__.c
+        status = db.case(
+            (db.and_(seats.status == Seat.Status.RESERVED, seats.reserved_until < now), Seat.Status.AVAILABLE),
+            else_=seats.status,
+        )
+        # Core rows skip ORM row processing, which dominates on large venues
+        rows = db.session.connection().execute(
+            db.select(seats.section_id, seats.row, seats.seat_number, status, seats.price)
+            .where(seats.section_id.in_(list(grids)))
+        )
+        spr = {sec.id: sec.seats_per_row for sec in sections}
+        nrows = {sec.id: sec.rows for sec in sections}
+        for section_id, row, seat_number, seat_status, price in rows:
+            if not (1 <= row <= nrows[section_id] and 1 <= seat_number <= spr[section_id]):
+                continue
+            offset = (row - 1) * spr[section_id] + (seat_number - 1)
+            grids[section_id][offset] = STATUS_CODES[seat_status]
+            prices[section_id][offset] = price
+    return grids, prices
+
+
+def drop_default_seats(seat_ids):
+    """
+    Delete the rows of those virtual-section ``seat_ids`` that are back to
+    the section default: available, no price or accessibility override and
+    no ticket. The change log still records them as available. Returns the
+    ids deleted; the caller commits.
+    """
+    ids = [sid for sid in dict.fromkeys(seat_ids) if sid]
+    if not ids:
+        return []
+    has_ticket = db.select(Ticket.id).where(Ticket.seat_id == Seat.id).exists()
+    rows = db.session.execute(
+        db.select(Seat.id, Seat.section_id, Seat.row, Seat.seat_number, VenueSection.venue_id)
+        .join(VenueSection, Seat.section_id == VenueSection.id)
+        .where(
+            Seat.id.in_(ids),
+            VenueSection.is_virtual.is_(True),
+            Seat.status == Seat.Status.AVAILABLE,
+            Seat.price.is_(None),
+            Seat.accessibility.is_(None),
+            ~has_ticket,
+        )
+    ).all()
+    if not rows:
+        return []
+    dropped = [row.id for row in rows]
+    record_dropped_seats(rows)
+    db.session.execute(
+        db.delete(Seat)
+        .where(Seat.id.in_(dropped), Seat.status == Seat.Status.AVAILABLE)
+        .execution_options(synchronize_session=False)
+    )
+    return dropped
+
+
+def venue_layout(venue_id, layout_version, section_ids):
+    """
+    The venue's sections and the static attributes of their seats.
+
+    Returns ``{section_id: (section dict, seats)}`` where ``seats`` holds a
+    ``(id, price, accessibility, created_at, updated_at)`` tuple or None per
+    row-major position. Read with one seat query per layout version and set
+    of sections; seats of virtual sections come and go without a layout
+    change, so they are left out.
+    """
+    key = (venue_id, layout_version, tuple(section_ids))
+    with _layout_cache_lock:
+        cached = _layout_cache.get(key)
+        if cached is not None:
+            _layout_cache.move_to_end(key)
+            return cached
+
+    layout = {}
+    for sec in VenueSection.query.filter(VenueSection.id.in_(list(section_ids))):
+        section = {
+            'id': sec.id,
+            'name': sec.name,
+            'color': sec.color,
+            'rows': sec.rows,
+            'seats_per_row': sec.seats_per_row,
+            'is_virtual': sec.is_virtual,
+        }
+        layout[sec.id] = (section, [None] * (sec.rows * sec.seats_per_row))
+
+    stored = [section_id for section_id, (section, _) in layout.items() if not section['is_virtual']]
+    if stored:
+        seats = Seat.__table__.c
+        rows = db.session.connection().execute(
+            db.select(seats.id, seats.section_id, seats.row, seats.seat_number, seats.price,
+                      seats.accessibility, seats.created_at, seats.updated_at)
+            .where(seats.section_id.in_(stored))
+        )
+        for seat_id, section_id, row, seat_number, price, accessibility, created_at, updated_at in rows:
+            section, positions = layout[section_id]
+            if 1 <= row <= section['rows'] and 1 <= seat_number <= section['seats_per_row']:
+                positions[(row - 1) * section['seats_per_row'] + (seat_number - 1)] = (
+                    seat_id, price, accessibility, created_at, updated_at,
+                )
+
+    with _layout_cache_lock:
+        _layout_cache[key] = layout
+        while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+    return layout
+
+
+def encode_compact(sections, grids, prices):
+    """Build the compact seat map from section dicts, status grids and prices"""
+    payload = []
+    for sec in sections:
+        palette = []
+        index = {}
+        tiers = []
+        for price in prices[sec['id']]:
+            if price not in index:
+                index[price] = len(palette)
+                palette.append(price)
+            tiers.append(index[price])
+
+        payload.append({
+            'id': sec['id'],
+            'name': sec['name'],
+            'color': sec['color'],
+            'rows': sec['rows'],
+            'seats_per_row': sec['seats_per_row'],
+            'status_runs': run_length_encode(grids[sec['id']]),
+            'price_palette': palette,
+            'price_runs': run_length_encode(tiers),
+        })
+
+    return {
+        'format': 'compact',
+        'format_version': COMPACT_FORMAT_VERSION,
+        'status_codes': dict(STATUS_CODES, none=NO_SEAT),
+        'seat_address': '<section_id>:<row>:<seat_number>',
+        'sections': payload,
+    }
+
+
+def compact_seatmap(venue, version, layout_version, states):
+    """
+    Compact map for ``venue`` at ``version``, encoded once per version.
+
+    ``states`` are the seat states from the seat state cache; prices come
+    from the cached layout. Only the price overrides of materialized
+    virtual-section seats, which the layout leaves out, are read.
+    """
+    key = (venue.id, version)
+    with _compact_cache_lock:
+        cached = _compact_cache.get(key)
+        if cached is not None:
+            _compact_cache.move_to_end(key)
+            return cached
+
+    layout = venue_layout(venue.id, layout_version, list(states))
+    sections = [layout[section_id][0] for section_id in states]
+    grids = {section_id: statuses for section_id, (_, _, statuses) in states.items()}
+    prices = {
+        section_id: [seat[1] if seat else None for seat in layout[section_id][1]]
+        for section_id in states
+    }
+    virtual = {section['id']: section for section in sections if section['is_virtual']}
+    if virtual:
+        seats = Seat.__table__.c
+        overrides = db.session.connection().execute(
+            db.select(seats.section_id, seats.row, seats.seat_number, seats.price)
+            .where(seats.section_id.in_(list(virtual)), seats.price.isnot(None))
+        )
+        for section_id, row, seat_number, price in overrides:
+            section = virtual[section_id]
+            if 1 <= row <= section['rows'] and 1 <= seat_number <= section['seats_per_row']:
+                prices[section_id][(row - 1) * section['seats_per_row'] + (seat_number - 1)] = price
+    payload = encode_compact(sections, grids, prices)
+    payload['venue'] = {'id': venue.id, 'name': venue.name}
+    payload['version'] = version
+
+    with _compact_cache_lock:
+        _compact_cache[key] = payload
+        while len(_compact_cache) > COMPACT_CACHE_SIZE:
+            _compact_cache.popitem(last=False)
+    return payload
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def full_seatmap_sections(venue_id, layout_version, states):
+    """
+    Sections with every seat as a dict, statuses taken from ``states``.
+
+    Only seats that are not available, and the seats of virtual sections,
+    are read from the database; everything else comes from the cached
+    layout (an available seat's ``updated_at`` is as of the layout).
+    """
+    layout = venue_layout(venue_id, layout_version, list(states))
+    taken = [
+        seat[0]
+        for section_id, (_, _, statuses) in states.items()
+        for seat, code in zip(layout[section_id][1], statuses)
+        if seat and code not in (STATUS_CODES[Seat.Status.AVAILABLE], NO_SEAT)
+    ]
+    virtual = [section_id for section_id in states if layout[section_id][0]['is_virtual']]
+    dynamic = {}
+    virtual_rows = {}
+    for i in range(0, len(taken), 1000):
+        for seat in Seat.query.filter(Seat.id.in_(taken[i:i + 1000])):
+            dynamic[seat.id] = seat
+    if virtual:
+        for seat in Seat.query.filter(Seat.section_id.in_(virtual)):
+            virtual_rows[(seat.section_id, seat.row, seat.seat_number)] = seat
+
+    payload = []
+    for section_id, (rows, seats_per_row, statuses) in states.items():
+        section, positions = layout[section_id]
+        seats = []
+        for offset, code in enumerate(statuses):
+            row, seat_index = divmod(offset, seats_per_row)
+            row, seat_number = row + 1, seat_index + 1
+            if section['is_virtual']:
+                stored = virtual_rows.get((section_id, row, seat_number))
+                seat = stored.to_dict() if stored else virtual_seat(section_id, row, seat_number)
+            elif positions[offset] is None or code == NO_SEAT:
+                continue
+            else:
+                seat_id, price, accessibility, created_at, updated_at = positions[offset]
+                stored = dynamic.get(seat_id)
+                seat = {
+                    'id': seat_id,
+                    'created_at': _isoformat(created_at),
+                    'updated_at': _isoformat(stored.updated_at if stored else updated_at),
+                    'section_id': section_id,
+                    'row': row,
+                    'seat_number': seat_number,
+                    'price': price,
+                    'accessibility': accessibility,
+                    'reserved_by': stored.reserved_by if stored else None,
+                    'reserved_until': _isoformat(stored.reserved_until) if stored else None,
+                }
+            if code != NO_SEAT:
+                seat['status'] = STATUS_NAMES[code]
+            seats.append(seat)
+        payload.append({
+            'section': {key: section[key] for key in ('id', 'name', 'rows', 'seats_per_row', 'is_virtual')},
+            'seats': seats,
+        })
+    return payload
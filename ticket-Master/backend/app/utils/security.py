@@ -5,7 +5,6 @@ from datetime import datetime, timedelta
 import jwt
 import bcrypt
 import re
-import uuid
 
 
 
@@ -52,12 +51,20 @@ class ValidationHandler:
     @staticmethod
     def generate_ticket_number():
         """Generate unique ticket number"""
-        return f"TKT-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+        from app.utils.ids import ticket_numbers
+        return ticket_numbers()[0]
+    
+    @staticmethod
+    def generate_ticket_numbers(count):
+        """Generate ``count`` unique ticket numbers at once, for bulk orders"""
+        from app.utils.ids import ticket_numbers
+        return ticket_numbers(count)
     
     @staticmethod
     def generate_transaction_id():
         """Generate unique transaction ID"""
-        return f"TXN-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8].upper()}"
+        from app.utils.ids import transaction_ids
+        return transaction_ids()[0]
 
 
 def token_required(fn):
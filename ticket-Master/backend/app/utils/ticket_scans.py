@@ -0,0 +1,371 @@
+"""
+Gate scan log.
+Scans are appended to ``ticket_scans`` as they happen; the tickets
+themselves are marked used afterwards by a background applier. The applier
+takes scans in the order they were made, so the first scan of a ticket
+marks it used and every later one is recorded as a duplicate.
+
+Scanners that were offline upload their buffered scans in one batch, which
+is logged and applied on the spot with set-based statements.
+
+One process across all workers and hosts, elected through a database
+lease, applies the log.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Event, Ticket, TicketScan
+from app.utils.leases import acquire_lease, make_owner_id
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'ticket-scan-applier'
+DEFAULT_BATCH_SIZE = 500
+ORGANIZER_CACHE_SECONDS = 300
+RECENT_SCANS = 100000
+MAX_BATCH_SCANS = 10000
+CHUNK_SIZE = 1000
+
+
+def parse_scan_time(text):
+    """
+    A device's ISO 8601 scan time as a naive UTC datetime.
+
+    Offsets are converted, not dropped; a time without one is taken as UTC.
+    Raises ValueError when ``text`` is not a timestamp.
+    """
+    if not isinstance(text, str):
+        raise ValueError(f'scanned_at must be an ISO 8601 string, not {text!r}')
+    scanned_at = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return scanned_at
+
+
+def _scan_row(ticket_number, event_id, device_id, scanned_at, gate=None, scanned_by=None, now=None):
+    now = now or datetime.utcnow()
+    return {
+        'id': str(uuid.uuid4()),
+        'created_at': now,
+        'updated_at': now,
+        'ticket_number': ticket_number,
+        'event_id': event_id,
+        'device_id': device_id,
+        'gate': gate,
+        'scanned_by': scanned_by,
+        'scanned_at': scanned_at,
+        'status': TicketScan.Status.PENDING,
+    }
+
+
+def _insert_scans(rows):
+    """Insert scan rows, skipping ones already logged; returns how many were new"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(TicketScan.__table__)
+        if len(rows) == 1:
+            return db.session.execute(insert.on_conflict_do_nothing(), rows[0]).rowcount
+        db.session.execute(insert.on_conflict_do_nothing(), rows)
+        return None
+    inserted = 0
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(TicketScan.__table__), row)
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def record_scan(ticket_number, event_id, device_id, scanned_at, gate=None, scanned_by=None):
+    """Append a scan to the log and commit; False when the device already sent it"""
+    inserted = _insert_scans([_scan_row(ticket_number, event_id, device_id, scanned_at, gate, scanned_by)])
+    db.session.commit()
+    return inserted == 1
+
+
+_UPDATE_SCAN = (
+    TicketScan.__table__.update()
+    .where(TicketScan.__table__.c.id == db.bindparam('scan_id'))
+    .values(
+        status=db.bindparam('status'),
+        result=db.bindparam('result'),
+        ticket_id=db.bindparam('ticket_id'),
+        applied_at=db.bindparam('applied_at'),
+        updated_at=db.bindparam('updated_at'),
+    )
+)
+
+
+_SET_USED_AT = (
+    Ticket.__table__.update()
+    .where(Ticket.__table__.c.id == db.bindparam('ticket_id'))
+    .values(used_at=db.bindparam('used_at'))
+)
+
+
+def apply_scans(scans, now=None):
+    """
+    Apply pending ``scans`` (rows with id, ticket_number, event_id and
+    scanned_at) to their tickets with set-based statements.
+
+    Within each ticket the earliest scan marks it used and the others are
+    duplicates. Returns {scan_id: (status, result)}; the caller commits.
+    """
+    now = now or datetime.utcnow()
+    scans = sorted(scans, key=lambda scan: (scan.scanned_at, scan.id))
+    if not scans:
+        return {}
+
+    tickets = {}
+    numbers = list({scan.ticket_number for scan in scans})
+    for i in range(0, len(numbers), CHUNK_SIZE):
+        for row in db.session.connection().execute(
+            db.select(Ticket.id, Ticket.ticket_number, Ticket.event_id, Ticket.status)
+            .where(Ticket.ticket_number.in_(numbers[i:i + CHUNK_SIZE]))
+        ):
+            tickets[row.ticket_number] = row
+
+    # The first scan of each confirmed ticket is the one that may use it
+    first_scans = {}
+    for scan in scans:
+        ticket = tickets.get(scan.ticket_number)
+        if ticket is not None and ticket.event_id == scan.event_id and ticket.status == Ticket.Status.CONFIRMED:
+            first_scans.setdefault(ticket.id, scan)
+
+    used = set()
+    ticket_ids = list(first_scans)
+    for i in range(0, len(ticket_ids), CHUNK_SIZE):
+        # Conditional, so a ticket used or cancelled meanwhile is left alone
+        used.update(db.session.execute(
+            db.update(Ticket)
+            .where(Ticket.id.in_(ticket_ids[i:i + CHUNK_SIZE]), Ticket.status == Ticket.Status.CONFIRMED)
+            .values(status=Ticket.Status.USED, used_at=now, updated_at=now)
+            .returning(Ticket.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    if used:
+        # Then stamp each with the time of its scan, in one executemany
+        db.session.connection().execute(
+            _SET_USED_AT, [{'ticket_id': tid, 'used_at': first_scans[tid].scanned_at} for tid in used]
+        )
+
+    outcomes, updates = {}, []
+    for scan in scans:
+        ticket = tickets.get(scan.ticket_number)
+        ticket_id = None
+        if ticket is None or ticket.event_id != scan.event_id:
+            status, result = TicketScan.Status.REJECTED, 'unknown_ticket'
+        else:
+            ticket_id = ticket.id
+            if ticket.id in used and first_scans[ticket.id] is scan:
+                status, result = TicketScan.Status.APPLIED, None
+            elif ticket.status in (Ticket.Status.CONFIRMED, Ticket.Status.USED):
+                status, result = TicketScan.Status.DUPLICATE, 'already_used'
+            else:
+                status, result = TicketScan.Status.REJECTED, f'ticket_{ticket.status}'
+        outcomes[scan.id] = (status, result)
+        updates.append({'scan_id': scan.id, 'status': status, 'result': result, 'ticket_id': ticket_id,
+                        'applied_at': now, 'updated_at': now})
+
+    db.session.connection().execute(_UPDATE_SCAN, updates)
+    return outcomes
+
+
+def _pending_scans():
+    return db.select(TicketScan.id, TicketScan.ticket_number, TicketScan.event_id, TicketScan.scanned_at).where(
+        TicketScan.status == TicketScan.Status.PENDING
+    )
+
+
+def _count(outcomes):
+    counts = {}
+    for status, _ in outcomes.values():
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def apply_pending_scans(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """
+    Apply one batch of pending scans to their tickets.
+
+    Returns {status: count} for the batch; the caller commits.
+    """
+    scans = db.session.execute(
+        _pending_scans()
+        .order_by(TicketScan.scanned_at.asc(), TicketScan.id.asc())
+        .limit(batch_size)
+        # Scans a batch upload is applying right now are left to it
+        .with_for_update(skip_locked=True)
+    ).all()
+    return _count(apply_scans(scans, now))
+
+
+def ingest_scans(event_id, items, scanned_by=None, now=None):
+    """
+    Log and apply a batch of scans uploaded by a scanner.
+
+    ``items`` are dicts with ticket_number, device_id, scanned_at (naive UTC
+    datetime) and optionally gate. Items the device already uploaded are
+    not logged again and report their recorded outcome, so a retried upload
+    returns the same results. Returns one result dict per item; the caller
+    commits.
+    """
+    now = now or datetime.utcnow()
+    rows = [
+        _scan_row(item['ticket_number'], event_id, item['device_id'], item['scanned_at'], item.get('gate'), scanned_by, now)
+        for item in items
+    ]
+    for i in range(0, len(rows), CHUNK_SIZE):
+        _insert_scans(rows[i:i + CHUNK_SIZE])
+
+    # Every scan of these tickets: this batch, retries of earlier uploads and
+    # pending single scans, so the earliest scan wins whoever sent it
+    numbers = list({item['ticket_number'] for item in items})
+    logged = []
+    for i in range(0, len(numbers), CHUNK_SIZE):
+        logged.extend(db.session.connection().execute(
+            db.select(
+                TicketScan.id, TicketScan.ticket_number, TicketScan.event_id, TicketScan.device_id,
+                TicketScan.scanned_at, TicketScan.status, TicketScan.result,
+            )
+            .where(TicketScan.ticket_number.in_(numbers[i:i + CHUNK_SIZE]))
+            .with_for_update()
+        ).all())
+
+    outcomes = apply_scans([scan for scan in logged if scan.status == TicketScan.Status.PENDING], now)
+    by_key = {}
+    for scan in logged:
+        by_key[(scan.ticket_number, scan.device_id, scan.scanned_at)] = outcomes.get(scan.id, (scan.status, scan.result))
+
+    results = []
+    for item in items:
+        status, result = by_key.get((item['ticket_number'], item['device_id'], item['scanned_at']), (None, None))
+        results.append({
+            'ticket_number': item['ticket_number'],
+            'device_id': item['device_id'],
+            'scanned_at': item['scanned_at'].isoformat(),
+            'status': status,
+            'result': result,
+        })
+    return results
+
+
+class GateMemory:
+    """Per-process caches that spare the database on the scan path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._organizers = {}
+        self._recent = OrderedDict()
+
+    def event_organizer(self, event_id):
+        """Organizer of ``event_id``, read at most every few minutes"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._organizers.get(event_id)
+        if cached and now - cached[1] < ORGANIZER_CACHE_SECONDS:
+            return cached[0]
+        organizer_id = db.session.execute(
+            db.select(Event.organizer_id).where(Event.id == event_id)
+        ).scalar()
+        with self._lock:
+            self._organizers[event_id] = (organizer_id, now)
+        return organizer_id
+
+    def seen_before(self, ticket_number):
+        """Whether this process already scanned ``ticket_number``; records it"""
+        with self._lock:
+            seen = ticket_number in self._recent
+            self._recent[ticket_number] = True
+            self._recent.move_to_end(ticket_number)
+            while len(self._recent) > RECENT_SCANS:
+                self._recent.popitem(last=False)
+        return seen
+
+
+gate_memory = GateMemory()
+
+
+class ScanApplier:
+    """Background thread that applies the scan log to tickets"""
+
+    def __init__(self):
+        self.app = None
+        self.owner = make_owner_id()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._metrics = {
+            'applied_total': 0,
+            'duplicate_total': 0,
+            'rejected_total': 0,
+            'batches': 0,
+            'errors': 0,
+            'is_leader': False,
+            'last_tick_at': None,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.interval_seconds = app.config.get('SCAN_APPLY_INTERVAL_SECONDS', 1.0)
+        self.batch_size = app.config.get('SCAN_APPLY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.lease_seconds = max(self.interval_seconds * 5, 5)
+        self.start()
+
+    def start(self):
+        # Threads do not survive a fork, so (re)start in whichever process we are in
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='scan-applier', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    logger.error(f"[SCAN APPLIER ERROR] {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def tick(self):
+        """Apply pending scans in batches if we hold the lease"""
+        now = datetime.utcnow()
+        self._metrics['last_tick_at'] = now.isoformat()
+        self._metrics['is_leader'] = acquire_lease(LEASE_NAME, self.owner, self.lease_seconds, now)
+        if not self._metrics['is_leader']:
+            return
+
+        while True:
+            counts = apply_pending_scans(self.batch_size, now)
+            db.session.commit()
+            if not counts:
+                break
+            self._metrics['batches'] += 1
+            self._metrics['applied_total'] += counts.get(TicketScan.Status.APPLIED, 0)
+            self._metrics['duplicate_total'] += counts.get(TicketScan.Status.DUPLICATE, 0)
+            self._metrics['rejected_total'] += counts.get(TicketScan.Status.REJECTED, 0)
+            if sum(counts.values()) < self.batch_size:
+                break
+
+    def metrics(self):
+        return dict(self._metrics, owner=self.owner)
+
+
+applier = ScanApplier()
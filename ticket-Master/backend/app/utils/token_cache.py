@@ -0,0 +1,102 @@
+"""
+Shared OAuth token cache.
+Client-credential tokens (PayPal's last about nine hours) are fetched once
+and reused until shortly before they expire, instead of costing a round trip
+per API call. Tokens live in memory and in a small file per credential, so
+every gunicorn worker on the host shares one token. A file lock makes the
+refresh single-flight: one process fetches while the others wait and then
+read its result.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight within the process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SharedTokenCache:
+    """Tokens for one credential, shared through ``directory``"""
+
+    def __init__(self, key, directory=None, refresh_margin=300):
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'ticket-master-tokens')
+        self.refresh_margin = refresh_margin
+        self.path = os.path.join(self.directory, f'{digest}.json')
+        self.lock_path = os.path.join(self.directory, f'{digest}.lock')
+        self.fetches = 0
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self, expires_at):
+        return expires_at - self.refresh_margin > time.time()
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data['access_token'], float(data['expires_at'])
+        except (OSError, ValueError, KeyError):
+            return None, 0.0
+
+    def _write_file(self, token, expires_at):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'access_token': token, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"[TOKEN CACHE] Could not share token: {e}")
+
+    def get(self, fetch):
+        """
+        A valid token, calling ``fetch()`` only when none is cached.
+
+        ``fetch`` returns ``(token, expires_in_seconds)`` or raises.
+        """
+        if self._token and self._fresh(self._expires_at):
+            return self._token
+        with self._lock:
+            if self._token and self._fresh(self._expires_at):
+                return self._token
+            try:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                lock_file = open(self.lock_path, 'a')
+            except OSError as e:
+                logger.error(f"[TOKEN CACHE] Not shared across processes: {e}")
+                lock_file = None
+            try:
+                if lock_file and fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                token, expires_at = self._read_file() if lock_file else (None, 0.0)
+                if not (token and self._fresh(expires_at)):
+                    token, expires_in = fetch()
+                    expires_at = time.time() + float(expires_in)
+                    self.fetches += 1
+                    if lock_file:
+                        self._write_file(token, expires_at)
+                self._token, self._expires_at = token, expires_at
+                return token
+            finally:
+                if lock_file:
+                    lock_file.close()
+
+    def invalidate(self, token=None):
+        """Forget ``token`` (or whatever is cached) after the server rejected it"""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token, self._expires_at = None, 0.0
+            file_token, _ = self._read_file()
+            if file_token and (token is None or file_token == token):
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
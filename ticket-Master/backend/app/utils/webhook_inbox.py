@@ -0,0 +1,303 @@
+"""
+Payment webhook inbox.
+The PayPal callback only stores the event in ``webhook_events`` and answers
+200; PayPal's event id is unique there, so a redelivered event is dropped by
+the insert and costs nothing more. Everything the event implies (finding
+the payment, confirming or refunding its tickets) happens afterwards in a
+background processor.
+
+The processor takes due events in arrival order, a batch per transaction,
+each event in a savepoint of its own. A failed event is retried with
+backoff up to WEBHOOK_MAX_ATTEMPTS, and later events for the same payment
+wait behind it, so a payment always sees its events in order. An event whose
+payment cannot be found yet is retried the same way and then ignored. One process
+across all workers and hosts, elected through a database lease, processes
+the inbox.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Payment, PaymentReference, Ticket, WebhookEvent
+from app.utils.email_outbox import retry_delay
+from app.utils.ga_inventory import release_for_tickets
+from app.utils.leases import acquire_lease, make_owner_id
+from app.utils.payment_refs import add_reference, find_payment
+from app.utils.qr import cache as qr_cache
+from app.utils.ticket_tokens import issue_ticket_token
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'webhook-processor'
+DEFAULT_BATCH_SIZE = 100
+RETRY = 'retry'
+DEFERRED = 'deferred'
+
+PAYPAL = PaymentReference.Provider.PAYPAL
+CAPTURE_COMPLETED = 'PAYMENT.CAPTURE.COMPLETED'
+CAPTURE_REFUNDED = 'PAYMENT.CAPTURE.REFUNDED'
+
+
+def _capture_completed(payment, resource):
+    """Mark the payment paid and confirm its tickets; returns QR payloads to prerender"""
+    if payment.status != Payment.Status.REFUNDED:
+        payment.status = Payment.Status.COMPLETED
+    # The capture id is what a later refund webhook refers to
+    if resource.get('id'):
+        payment.metadata_json = dict(payment.metadata_json or {}, paypal_capture_id=resource['id'])
+        add_reference(payment.id, PAYPAL, PaymentReference.Type.CAPTURE, resource['id'])
+
+    # Tickets the capture endpoint already confirmed keep their tokens
+    tickets = Ticket.query.filter_by(payment_id=payment.id, status=Ticket.Status.PENDING).all()
+    for ticket in tickets:
+        ticket.status = Ticket.Status.CONFIRMED
+        issue_ticket_token(ticket)
+    return [t.qr_code for t in tickets]
+
+
+def _capture_refunded(payment, resource):
+    if payment.status == Payment.Status.REFUNDED:
+        return []
+    payment.status = Payment.Status.REFUNDED
+    tickets = Ticket.query.filter_by(payment_id=payment.id).all()
+    release_for_tickets(tickets)
+    for ticket in tickets:
+        ticket.status = Ticket.Status.REFUNDED
+    return []
+
+
+# event type: (reference type of resource_ref, how to read it from the resource, handler)
+PAYPAL_HANDLERS = {
+    CAPTURE_COMPLETED: (
+        PaymentReference.Type.ORDER,
+        lambda resource: resource.get('supplementary_data', {}).get('related_ids', {}).get('order_id'),
+        _capture_completed,
+    ),
+    CAPTURE_REFUNDED: (
+        PaymentReference.Type.CAPTURE,
+        lambda resource: resource.get('id'),
+        _capture_refunded,
+    ),
+}
+
+
+def _insert_event(row):
+    """Insert ``row`` unless its event is already stored; returns whether it was new"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(WebhookEvent.__table__)
+        return db.session.execute(insert.on_conflict_do_nothing(), row).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(WebhookEvent.__table__), row)
+        return True
+    except IntegrityError:
+        return False
+
+
+def record_paypal_event(webhook_data):
+    """
+    Store a PayPal webhook and commit; returns False for a redelivery.
+
+    Event types nothing handles are acknowledged without being stored.
+    """
+    event_type = webhook_data.get('event_type')
+    if event_type not in PAYPAL_HANDLERS:
+        return False
+    _, ref_of, _ = PAYPAL_HANDLERS[event_type]
+    # PayPal reuses an event's id for every delivery of it
+    event_id = webhook_data.get('id') or hashlib.sha256(
+        json.dumps(webhook_data, sort_keys=True).encode()
+    ).hexdigest()
+    now = datetime.utcnow()
+    inserted = _insert_event({
+        'id': str(uuid.uuid4()),
+        'created_at': now,
+        'updated_at': now,
+        'provider': PAYPAL,
+        'event_id': event_id,
+        'event_type': event_type,
+        'resource_ref': ref_of(webhook_data.get('resource') or {}),
+        'payload': webhook_data,
+        'status': WebhookEvent.Status.PENDING,
+        'attempts': 0,
+        'next_attempt_at': now,
+    })
+    db.session.commit()
+    return inserted
+
+
+def _waiting_payments(now):
+    """``{payment_id: retry time}`` for payments whose earlier events are backing off"""
+    rows = db.session.execute(
+        db.select(WebhookEvent.payment_id, db.func.max(WebhookEvent.next_attempt_at))
+        .where(
+            WebhookEvent.status == WebhookEvent.Status.PENDING,
+            WebhookEvent.payment_id.is_not(None),
+            WebhookEvent.next_attempt_at > now,
+        )
+        .group_by(WebhookEvent.payment_id)
+    ).all()
+    return dict(rows)
+
+
+def _retry_later(event, config, error, now):
+    """Back off after a failed attempt, or give up on it; returns the outcome"""
+    event.last_error = str(error)[:1000]
+    if event.attempts >= config.get('WEBHOOK_MAX_ATTEMPTS', 10):
+        logger.error(f"[WEBHOOK FAILED] {event.event_type} {event.event_id} after {event.attempts} attempts: {error}")
+        return None
+    event.next_attempt_at = now + timedelta(seconds=retry_delay(
+        event.attempts,
+        config.get('WEBHOOK_RETRY_BASE_SECONDS', 10),
+        config.get('WEBHOOK_RETRY_MAX_SECONDS', 1800),
+    ))
+    logger.warning(f"[WEBHOOK RETRY] {event.event_type} {event.event_id} (attempt {event.attempts}): {error}")
+    return RETRY
+
+
+def _process(event, config, waiting, now):
+    """Apply one event inside a savepoint; returns ``(outcome, qr payloads)``"""
+    ref_type, _, handler = PAYPAL_HANDLERS.get(event.event_type, (None, None, None))
+    if not handler:
+        event.status = WebhookEvent.Status.IGNORED
+        return event.status, []
+    payment = find_payment(event.provider, ref_type, event.resource_ref)
+    if not payment:
+        # A refund can arrive before the capture that records its id
+        event.attempts += 1
+        if _retry_later(event, config, 'no payment with this reference', now):
+            return RETRY, []
+        event.status = WebhookEvent.Status.IGNORED
+        return event.status, []
+    event.payment_id = payment.id
+    if payment.id in waiting:
+        # An earlier event for this payment is backing off; go after it
+        event.next_attempt_at = waiting[payment.id]
+        return DEFERRED, []
+
+    event.attempts += 1
+    try:
+        with db.session.begin_nested():
+            payloads = handler(payment, event.payload.get('resource') or {})
+    except Exception as e:
+        if _retry_later(event, config, e, now):
+            waiting[payment.id] = event.next_attempt_at
+            return RETRY, []
+        event.status = WebhookEvent.Status.FAILED
+        return event.status, []
+
+    event.status = WebhookEvent.Status.PROCESSED
+    event.processed_at = datetime.utcnow()
+    event.last_error = None
+    return event.status, payloads
+
+
+def process_pending_webhooks(config, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Process one batch of due events and commit; returns ``{outcome: count}``"""
+    now = now or datetime.utcnow()
+    events = (
+        WebhookEvent.query
+        .filter(WebhookEvent.status == WebhookEvent.Status.PENDING, WebhookEvent.next_attempt_at <= now)
+        .order_by(WebhookEvent.created_at, WebhookEvent.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not events:
+        return {}
+    waiting = _waiting_payments(now)
+    counts = {}
+    payloads = []
+    for event in events:
+        outcome, rendered = _process(event, config, waiting, now)
+        counts[outcome] = counts.get(outcome, 0) + 1
+        payloads.extend(rendered)
+    db.session.commit()
+    if payloads:
+        qr_cache.prerender(payloads)
+    return counts
+
+
+class WebhookProcessor:
+    """Background thread that processes the webhook inbox"""
+
+    def __init__(self):
+        self.app = None
+        self.owner = make_owner_id()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._metrics = {
+            'processed_total': 0,
+            'ignored_total': 0,
+            'retried_total': 0,
+            'failed_total': 0,
+            'deferred_total': 0,
+            'batches': 0,
+            'errors': 0,
+            'is_leader': False,
+            'last_tick_at': None,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        self.interval_seconds = app.config.get('WEBHOOK_PROCESS_INTERVAL_SECONDS', 1.0)
+        self.batch_size = app.config.get('WEBHOOK_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.lease_seconds = max(self.interval_seconds * 5, 5)
+        self.start()
+
+    def start(self):
+        # Threads do not survive a fork, so (re)start in whichever process we are in
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='webhook-processor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except Exception as e:
+                    self._metrics['errors'] += 1
+                    logger.error(f"[WEBHOOK PROCESSOR ERROR] {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def tick(self):
+        """Process due events in batches if we hold the lease"""
+        now = datetime.utcnow()
+        self._metrics['last_tick_at'] = now.isoformat()
+        self._metrics['is_leader'] = acquire_lease(LEASE_NAME, self.owner, self.lease_seconds, now)
+        if not self._metrics['is_leader']:
+            return
+
+        while True:
+            counts = process_pending_webhooks(self.app.config, self.batch_size, now)
+            if not counts:
+                break
+            self._metrics['batches'] += 1
+            self._metrics['processed_total'] += counts.get(WebhookEvent.Status.PROCESSED, 0)
+            self._metrics['ignored_total'] += counts.get(WebhookEvent.Status.IGNORED, 0)
+            self._metrics['retried_total'] += counts.get(RETRY, 0)
+            self._metrics['failed_total'] += counts.get(WebhookEvent.Status.FAILED, 0)
+            self._metrics['deferred_total'] += counts.get(DEFERRED, 0)
+            if sum(counts.values()) < self.batch_size:
+                break
+
+    def metrics(self):
+        return dict(self._metrics, owner=self.owner)
+
+
+processor = WebhookProcessor()
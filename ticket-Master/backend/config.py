@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -36,6 +37,103 @@ class Config:
     PAYPAL_CLIENT_ID = os.getenv('PAYPAL_CLIENT_ID')
     PAYPAL_CLIENT_SECRET = os.getenv('PAYPAL_CLIENT_SECRET')
     PAYPAL_ENVIRONMENT = os.getenv('PAYPAL_ENVIRONMENT', 'sandbox')
+    # PayPal calls share a keep-alive pool and an OAuth token cached per host (defaults to the temp directory)
+    PAYPAL_CONNECT_TIMEOUT = float(os.getenv('PAYPAL_CONNECT_TIMEOUT', 3.05))
+    PAYPAL_READ_TIMEOUT = float(os.getenv('PAYPAL_READ_TIMEOUT', 20))
+    PAYPAL_POOL_SIZE = int(os.getenv('PAYPAL_POOL_SIZE', 10))
+    PAYPAL_DEADLINE_SECONDS = float(os.getenv('PAYPAL_DEADLINE_SECONDS', 30))
+    PAYPAL_MAX_CONCURRENCY = int(os.getenv('PAYPAL_MAX_CONCURRENCY', 20))
+    PAYPAL_RETRIES = int(os.getenv('PAYPAL_RETRIES', 2))
+    PAYPAL_TOKEN_CACHE_DIR = os.getenv('PAYPAL_TOKEN_CACHE_DIR')
+    PAYPAL_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('PAYPAL_TOKEN_REFRESH_MARGIN_SECONDS', 300))
+    
+    # Outbound provider calls: Google sign-in limits, and the circuit breaker and retries every provider shares
+    GOOGLE_CONNECT_TIMEOUT = float(os.getenv('GOOGLE_CONNECT_TIMEOUT', 3.05))
+    GOOGLE_READ_TIMEOUT = float(os.getenv('GOOGLE_READ_TIMEOUT', 5))
+    GOOGLE_DEADLINE_SECONDS = float(os.getenv('GOOGLE_DEADLINE_SECONDS', 10))
+    GOOGLE_POOL_SIZE = int(os.getenv('GOOGLE_POOL_SIZE', 10))
+    GOOGLE_MAX_CONCURRENCY = int(os.getenv('GOOGLE_MAX_CONCURRENCY', 20))
+    GOOGLE_RETRIES = int(os.getenv('GOOGLE_RETRIES', 2))
+    OUTBOUND_BREAKER_FAILURES = int(os.getenv('OUTBOUND_BREAKER_FAILURES', 5))
+    OUTBOUND_BREAKER_RESET_SECONDS = float(os.getenv('OUTBOUND_BREAKER_RESET_SECONDS', 30))
+    OUTBOUND_BULKHEAD_WAIT_SECONDS = float(os.getenv('OUTBOUND_BULKHEAD_WAIT_SECONDS', 0.5))
+    OUTBOUND_RETRY_BASE_SECONDS = float(os.getenv('OUTBOUND_RETRY_BASE_SECONDS', 0.2))
+    
+    # Seat map change log: how many versions of deltas to keep per venue
+    SEAT_CHANGE_RING_VERSIONS = int(os.getenv('SEAT_CHANGE_RING_VERSIONS', 1000))
+    
+    # Seat hold expiry: released in-process instead of by a cron job
+    HOLD_EXPIRY_ENABLED = os.getenv('HOLD_EXPIRY_ENABLED', 'True') == 'True'
+    HOLD_EXPIRY_SWEEP_SECONDS = float(os.getenv('HOLD_EXPIRY_SWEEP_SECONDS', 1.0))
+    HOLD_EXPIRY_BATCH_SIZE = int(os.getenv('HOLD_EXPIRY_BATCH_SIZE', 500))
+    # Pending payments older than this are failed and their GA inventory released
+    PENDING_PAYMENT_TTL_SECONDS = int(os.getenv('PENDING_PAYMENT_TTL_SECONDS', 3 * 3600))
+    
+    # Live seat stream: 'memory' reaches one process only, 'redis' fans out across workers
+    SEAT_STREAM_BACKPLANE = os.getenv('SEAT_STREAM_BACKPLANE', 'memory')
+    SEAT_STREAM_REDIS_URL = os.getenv('SEAT_STREAM_REDIS_URL', 'redis://localhost:6379/0')
+    SEAT_STREAM_TICK_SECONDS = float(os.getenv('SEAT_STREAM_TICK_SECONDS', 0.25))
+    SEAT_STREAM_HEARTBEAT_SECONDS = float(os.getenv('SEAT_STREAM_HEARTBEAT_SECONDS', 15))
+    SEAT_STREAM_MAX_SECONDS = float(os.getenv('SEAT_STREAM_MAX_SECONDS', 300))
+    
+    # Host-wide seat state cache shared by the workers through mmap
+    SEAT_CACHE_ENABLED = os.getenv('SEAT_CACHE_ENABLED', 'True') == 'True'
+    SEAT_CACHE_DIR = os.getenv('SEAT_CACHE_DIR')  # default: /dev/shm/ticket-master-seats
+    SEAT_CACHE_MAX_AGE_SECONDS = float(os.getenv('SEAT_CACHE_MAX_AGE_SECONDS', 2.0))
+    
+    # Ticket QR images: rendered on demand, cached by content hash. Pre-warming
+    # writes to disk only and refuses events with more tickets than the disk holds
+    QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', 256))
+    QR_CACHE_DIR = os.getenv('QR_CACHE_DIR')  # default: <tmp>/ticket-master-qr
+    QR_DISK_CACHE_MAX_FILES = int(os.getenv('QR_DISK_CACHE_MAX_FILES', 10000))
+    # Render pool processes per web worker (0 renders in the calling thread); the
+    # default splits the CPUs between the WEB_CONCURRENCY gunicorn workers.
+    # Smaller batches skip the pool
+    QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', max((os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY', 1)), 1)))
+    QR_PARALLEL_MIN_BATCH = int(os.getenv('QR_PARALLEL_MIN_BATCH', 8))
+    
+    # Gate scanning: signed ticket tokens and the scan log applier
+    TICKET_SIGNING_KEY = os.getenv('TICKET_SIGNING_KEY') or JWT_SECRET_KEY
+    TICKET_SIGNING_PREVIOUS_KEYS = [k for k in os.getenv('TICKET_SIGNING_PREVIOUS_KEYS', '').split(',') if k]
+    TICKET_TOKEN_EARLY_HOURS = float(os.getenv('TICKET_TOKEN_EARLY_HOURS', 12))
+    TICKET_TOKEN_LATE_HOURS = float(os.getenv('TICKET_TOKEN_LATE_HOURS', 6))
+    SCAN_APPLIER_ENABLED = os.getenv('SCAN_APPLIER_ENABLED', 'True') == 'True'
+    SCAN_APPLY_INTERVAL_SECONDS = float(os.getenv('SCAN_APPLY_INTERVAL_SECONDS', 1.0))
+    SCAN_APPLY_BATCH_SIZE = int(os.getenv('SCAN_APPLY_BATCH_SIZE', 500))
+    
+    # Email outbox: handlers enqueue, worker threads send over persistent SMTP connections
+    EMAIL_WORKER_ENABLED = os.getenv('EMAIL_WORKER_ENABLED', 'True') == 'True'
+    EMAIL_WORKER_CONNECTIONS = int(os.getenv('EMAIL_WORKER_CONNECTIONS', 2))
+    EMAIL_POLL_INTERVAL_SECONDS = float(os.getenv('EMAIL_POLL_INTERVAL_SECONDS', 1.0))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 8))
+    EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+    EMAIL_RETRY_MAX_SECONDS = float(os.getenv('EMAIL_RETRY_MAX_SECONDS', 3600))
+    SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', 60))
+    
+    # Idempotency keys: how long a purchase response is replayed, and how long a retry waits for the first attempt
+    IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', 86400))
+    IDEMPOTENCY_LOCK_SECONDS = float(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))
+    
+    # Payment webhooks: callbacks are stored and acknowledged, a background processor applies them
+    WEBHOOK_PROCESSOR_ENABLED = os.getenv('WEBHOOK_PROCESSOR_ENABLED', 'True') == 'True'
+    WEBHOOK_PROCESS_INTERVAL_SECONDS = float(os.getenv('WEBHOOK_PROCESS_INTERVAL_SECONDS', 1.0))
+    WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 100))
+    WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 10))
+    WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv('WEBHOOK_RETRY_BASE_SECONDS', 10))
+    WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv('WEBHOOK_RETRY_MAX_SECONDS', 1800))
+    
+    # Event broadcasts: organizer emails to every ticket holder
+    BROADCAST_CONNECTIONS = int(os.getenv('BROADCAST_CONNECTIONS', 4))
+    BROADCAST_RATE_PER_SECOND = float(os.getenv('BROADCAST_RATE_PER_SECOND', 50))
+    BROADCAST_PAGE_SIZE = int(os.getenv('BROADCAST_PAGE_SIZE', 1000))
+    
+    # Ticket numbers and transaction IDs: values each process reserves per round trip
+    ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 1000))
+    
+    # Event creation: layouts this large generate their seats in a background job
+    SEAT_GENERATION_ASYNC_THRESHOLD = int(os.getenv('SEAT_GENERATION_ASYNC_THRESHOLD', 20000))
+    BACKGROUND_JOBS_INLINE = os.getenv('BACKGROUND_JOBS_INLINE', 'False') == 'True'
     
     # API URLs
     API_URL = os.getenv('API_URL', 'http://localhost:5000')
@@ -59,6 +157,15 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
     WTF_CSRF_ENABLED = False
+    HOLD_EXPIRY_ENABLED = False
+    SCAN_APPLIER_ENABLED = False
+    EMAIL_WORKER_ENABLED = False
+    WEBHOOK_PROCESSOR_ENABLED = False
+    BROADCAST_RATE_PER_SECOND = 0
+    BACKGROUND_JOBS_INLINE = True
+    SEAT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ticket-master-seats-test')
+    QR_RENDER_WORKERS = 0
+    PAYPAL_TOKEN_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ticket-master-tokens-test')
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,34 @@
+"""Add event_seat_inventory table
+
+Revision ID: 0002_add_event_seat_inventory
+Revises: 0001_add_seat_reserved_fields
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002_add_event_seat_inventory'
+down_revision = '0001_add_seat_reserved_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'event_seat_inventory',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('event_id', sa.String(length=36), sa.ForeignKey('events.id'), nullable=False),
+        sa.Column('section_id', sa.String(length=36), sa.ForeignKey('venue_sections.id'), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('seats_per_row', sa.Integer(), nullable=False),
+        sa.Column('statuses', sa.LargeBinary(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.UniqueConstraint('event_id', 'section_id', name='uq_event_seat_inventory_event_section'),
+    )
+
+
+def downgrade():
+    op.drop_table('event_seat_inventory')
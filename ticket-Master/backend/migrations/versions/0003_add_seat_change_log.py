@@ -0,0 +1,45 @@
+"""Add seat_map_versions and seat_changes tables
+
+Revision ID: 0003_add_seat_change_log
+Revises: 0002_add_event_seat_inventory
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_add_seat_change_log'
+down_revision = '0002_add_event_seat_inventory'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'seat_map_versions',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.String(length=36), sa.ForeignKey('venues.id'), nullable=False, unique=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'seat_changes',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.String(length=36), sa.ForeignKey('venues.id'), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('seat_id', sa.String(length=36), sa.ForeignKey('seats.id'), nullable=False),
+        sa.Column('section_id', sa.String(length=36), sa.ForeignKey('venue_sections.id'), nullable=False),
+        sa.Column('row', sa.Integer(), nullable=False),
+        sa.Column('seat_number', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+    )
+    op.create_index('idx_seat_changes_venue_version', 'seat_changes', ['venue_id', 'version'])
+
+
+def downgrade():
+    op.drop_index('idx_seat_changes_venue_version', table_name='seat_changes')
+    op.drop_table('seat_changes')
+    op.drop_table('seat_map_versions')
@@ -0,0 +1,30 @@
+"""Add scheduler_leases table
+
+Revision ID: 0004_add_scheduler_leases
+Revises: 0003_add_seat_change_log
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004_add_scheduler_leases'
+down_revision = '0003_add_seat_change_log'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'scheduler_leases',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False, unique=True),
+        sa.Column('owner', sa.String(length=255), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_leases')
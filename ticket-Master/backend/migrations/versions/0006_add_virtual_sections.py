@@ -0,0 +1,28 @@
+"""Add virtual venue sections and make seat positions unique
+
+Revision ID: 0006_add_virtual_sections
+Revises: 0005_add_background_jobs
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_add_virtual_sections'
+down_revision = '0005_add_background_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue_sections', sa.Column('is_virtual', sa.Boolean(), nullable=False, server_default=sa.false()))
+    # Seats of virtual sections are created on first touch, possibly by two
+    # requests at once; the unique index lets the loser's insert be ignored
+    op.drop_index('idx_section_row_seat', table_name='seats')
+    op.create_index('idx_section_row_seat', 'seats', ['section_id', 'row', 'seat_number'], unique=True)
+
+
+def downgrade():
+    op.drop_index('idx_section_row_seat', table_name='seats')
+    op.create_index('idx_section_row_seat', 'seats', ['section_id', 'row', 'seat_number'], unique=False)
+    op.drop_column('venue_sections', 'is_virtual')
@@ -0,0 +1,34 @@
+"""Add ticket type counter shards
+
+Revision ID: 0007_add_ticket_type_shards
+Revises: 0006_add_virtual_sections
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_add_ticket_type_shards'
+down_revision = '0006_add_virtual_sections'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ticket_types', sa.Column('shard_count', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'ticket_type_shards',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('ticket_type_id', sa.String(length=36), sa.ForeignKey('ticket_types.id'), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('sold', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('ticket_type_id', 'shard', name='uq_ticket_type_shard'),
+    )
+
+
+def downgrade():
+    op.drop_table('ticket_type_shards')
+    op.drop_column('ticket_types', 'shard_count')
@@ -0,0 +1,26 @@
+"""Store QR payloads instead of base64 PNGs in tickets.qr_code
+
+Revision ID: 0008_store_ticket_qr_payloads
+Revises: 0007_add_ticket_type_shards
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0008_store_ticket_qr_payloads'
+down_revision = '0007_add_ticket_type_shards'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Images are now rendered on demand from the payload
+    op.execute(
+        "UPDATE tickets SET qr_code = 'TICKET:' || ticket_number || '|EVENT:' || event_id "
+        "WHERE qr_code IS NULL OR qr_code NOT LIKE 'TICKET:%'"
+    )
+
+
+def downgrade():
+    # The previous download endpoint renders images for empty values
+    op.execute("UPDATE tickets SET qr_code = NULL WHERE qr_code LIKE 'TICKET:%'")
@@ -0,0 +1,41 @@
+"""Add ticket scan log
+
+Revision ID: 0009_add_ticket_scans
+Revises: 0008_store_ticket_qr_payloads
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009_add_ticket_scans'
+down_revision = '0008_store_ticket_qr_payloads'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ticket_scans',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('ticket_number', sa.String(length=50), nullable=False),
+        sa.Column('event_id', sa.String(length=36), nullable=False),
+        sa.Column('device_id', sa.String(length=100), nullable=False),
+        sa.Column('gate', sa.String(length=50), nullable=True),
+        sa.Column('scanned_by', sa.String(length=36), nullable=True),
+        sa.Column('scanned_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('result', sa.String(length=50), nullable=True),
+        sa.Column('ticket_id', sa.String(length=36), sa.ForeignKey('tickets.id'), nullable=True),
+        sa.Column('applied_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('ticket_number', 'device_id', 'scanned_at', name='uq_ticket_scan'),
+    )
+    op.create_index('ix_ticket_scans_ticket_number', 'ticket_scans', ['ticket_number'])
+    op.create_index('idx_ticket_scans_status_scanned', 'ticket_scans', ['status', 'scanned_at'])
+    op.create_index('idx_ticket_scans_event', 'ticket_scans', ['event_id', 'scanned_at'])
+
+
+def downgrade():
+    op.drop_table('ticket_scans')
@@ -0,0 +1,21 @@
+"""Index tickets by event and last update
+
+Revision ID: 0010_add_ticket_event_updated_index
+Revises: 0009_add_ticket_scans
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_ticket_event_updated_index'
+down_revision = '0009_add_ticket_scans'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_tickets_event_updated', 'tickets', ['event_id', 'updated_at'])
+
+
+def downgrade():
+    op.drop_index('idx_tickets_event_updated', table_name='tickets')
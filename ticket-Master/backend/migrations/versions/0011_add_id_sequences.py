@@ -0,0 +1,29 @@
+"""Add ID sequences
+
+Revision ID: 0011_add_id_sequences
+Revises: 0010_add_ticket_event_updated_index
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011_add_id_sequences'
+down_revision = '0010_add_ticket_event_updated_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'id_sequences',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False, unique=True),
+        sa.Column('next_value', sa.BigInteger(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequences')
@@ -0,0 +1,36 @@
+"""Add email outbox
+
+Revision ID: 0012_add_email_outbox
+Revises: 0011_add_id_sequences
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0012_add_email_outbox'
+down_revision = '0011_add_id_sequences'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('recipient', sa.String(length=120), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('idx_email_outbox_status_due', 'email_outbox', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_table('email_outbox')
@@ -0,0 +1,22 @@
+"""Add background job checkpoints
+
+Revision ID: 0013_add_background_job_checkpoint
+Revises: 0012_add_email_outbox
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0013_add_background_job_checkpoint'
+down_revision = '0012_add_email_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('background_jobs', sa.Column('checkpoint', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('background_jobs', 'checkpoint')
@@ -0,0 +1,71 @@
+"""Add payment provider references
+
+Revision ID: 0014_add_payment_references
+Revises: 0013_add_background_job_checkpoint
+Create Date: 2026-10-16 00:00:00.000000
+"""
+import json
+import uuid
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+# revision identifiers, used by Alembic.
+revision = '0014_add_payment_references'
+down_revision = '0013_add_background_job_checkpoint'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+METADATA_KEYS = {'paypal_order_id': 'order', 'paypal_capture_id': 'capture'}
+
+
+def upgrade():
+    references = op.create_table(
+        'payment_references',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('payment_id', sa.String(length=36), sa.ForeignKey('payments.id'), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('ref_type', sa.String(length=20), nullable=False),
+        sa.Column('ref_value', sa.String(length=255), nullable=False),
+        sa.UniqueConstraint('provider', 'ref_type', 'ref_value', name='uq_payment_reference'),
+    )
+    op.create_index('ix_payment_references_payment_id', 'payment_references', ['payment_id'])
+
+    # Backfill from payments.metadata, one keyset page at a time
+    payments = sa.table('payments', sa.column('id', sa.String), sa.column('metadata', sa.JSON))
+    bind = op.get_bind()
+    # The first payment to claim a provider id keeps it
+    insert = (postgresql if bind.dialect.name == 'postgresql' else sqlite).insert(references).on_conflict_do_nothing()
+    last_id = ''
+    while True:
+        rows = bind.execute(
+            sa.select(payments.c.id, payments.c.metadata)
+            .where(payments.c.id > last_id, payments.c.metadata.isnot(None))
+            .order_by(payments.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        now = datetime.utcnow()
+        batch = []
+        for payment_id, metadata in rows:
+            if isinstance(metadata, str):
+                metadata = json.loads(metadata)
+            for key, ref_type in METADATA_KEYS.items():
+                value = (metadata or {}).get(key)
+                if value:
+                    batch.append({
+                        'id': str(uuid.uuid4()), 'created_at': now, 'updated_at': now,
+                        'payment_id': payment_id, 'provider': 'paypal', 'ref_type': ref_type, 'ref_value': str(value),
+                    })
+        if batch:
+            bind.execute(insert, batch)
+
+
+def downgrade():
+    op.drop_table('payment_references')
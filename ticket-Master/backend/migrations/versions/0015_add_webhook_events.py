@@ -0,0 +1,41 @@
+"""Add webhook event inbox
+
+Revision ID: 0015_add_webhook_events
+Revises: 0014_add_payment_references
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015_add_webhook_events'
+down_revision = '0014_add_payment_references'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'webhook_events',
+        sa.Column('id', sa.String(length=36), primary_key=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('event_id', sa.String(length=255), nullable=False),
+        sa.Column('event_type', sa.String(length=100), nullable=False),
+        sa.Column('resource_ref', sa.String(length=255), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('payment_id', sa.String(length=36), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('provider', 'event_id', name='uq_webhook_event'),
+    )
+    op.create_index('idx_webhook_events_status_due', 'webhook_events', ['status', 'next_attempt_at'])
+    op.create_index('ix_webhook_events_payment_id', 'webhook_events', ['payment_id'])
+
+
+def downgrade():
+    op.drop_table('webhook_events')
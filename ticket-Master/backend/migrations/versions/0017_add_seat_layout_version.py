@@ -0,0 +1,22 @@
+"""Add seat layout version
+
+Revision ID: 0017_add_seat_layout_version
+Revises: 0016_add_idempotency_keys
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0017_add_seat_layout_version'
+down_revision = '0016_add_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('seat_map_versions', sa.Column('layout_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('seat_map_versions', 'layout_version')
@@ -0,0 +1,24 @@
+"""Drop the seat foreign key from seat_changes
+
+Revision ID: 0018_drop_seat_change_seat_fk
+Revises: 0017_add_seat_layout_version
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0018_drop_seat_change_seat_fk'
+down_revision = '0017_add_seat_layout_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite leaves foreign keys unenforced, and cannot drop an unnamed one in place
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('seat_changes_seat_id_fkey', 'seat_changes', type_='foreignkey')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_foreign_key('seat_changes_seat_id_fkey', 'seat_changes', 'seats', ['seat_id'], ['id'])
@@ -0,0 +1,122 @@
+import email
+from datetime import datetime, timedelta
+from email.header import decode_header
+from app.models import db, User, Event, TicketType, Ticket, BackgroundJob
+from app.utils import broadcast
+from flask_jwt_extended import create_access_token
+
+
+class RecordingConnection:
+    sent = []
+
+    def __init__(self, idle_seconds=60):
+        pass
+
+    def send_raw(self, recipient_email, data):
+        RecordingConnection.sent.append((recipient_email, data))
+
+    def close(self):
+        pass
+
+
+def make_event_with_holders():
+    organizer = User(email='bcast-org@example.com', password_hash='x', first_name='B', last_name='O', role=User.Role.ORGANIZER)
+    holders = [User(email=f'bcast-{i}@example.com', password_hash='x', first_name='H', last_name=str(i)) for i in range(4)]
+    db.session.add_all([organizer] + holders)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=5)
+    event = Event(title='Broadcast Fest', description='x', category='music', location='Park',
+                  start_date=start, end_date=start + timedelta(hours=4), organizer_id=organizer.id)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=30.0, quantity=50, sold=0)
+    db.session.add(ticket_type)
+    db.session.commit()
+    # holder 0 has two tickets, holder 2 only an unpaid one
+    statuses = [(0, Ticket.Status.CONFIRMED), (0, Ticket.Status.CONFIRMED), (1, Ticket.Status.USED),
+                (2, Ticket.Status.PENDING), (3, Ticket.Status.CONFIRMED)]
+    db.session.add_all([
+        Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=holders[h].id,
+               ticket_number=f'TKT-BCAST-{i}', price=30.0, status=status)
+        for i, (h, status) in enumerate(statuses)
+    ])
+    db.session.commit()
+    headers = {'Authorization': f"Bearer {create_access_token(identity=organizer.id, additional_claims={'role': organizer.role})}"}
+    return event, holders, headers
+
+
+def test_broadcast_reaches_each_holder_once_and_resumes(client, app, monkeypatch):
+    monkeypatch.setattr(broadcast, 'SMTPConnection', RecordingConnection)
+    RecordingConnection.sent = []
+    with app.app_context():
+        app.config['BROADCAST_PAGE_SIZE'] = 2
+        try:
+            event, holders, headers = make_event_with_holders()
+            expected = sorted(h.email for h in holders if h is not holders[2])
+            assert broadcast.count_recipients(event.id) == 3
+
+            resp = client.post(f'/api/events/{event.id}/broadcasts', headers=headers, json={
+                'variant': 'time_change', 'subject': 'Doors now open at 19:30', 'message': 'New time.\nSee you there!'})
+            assert resp.status_code == 202
+            job = resp.get_json()['job']
+            assert job['status'] == BackgroundJob.Status.SUCCEEDED
+            assert job['result']['sent'] == 3 and job['result']['failed'] == 0
+            assert job['progress_done'] == 3 and job['progress_total'] == 3
+            assert job['checkpoint']['after'] == max(h.id for h in holders if h is not holders[2])
+            assert sorted(to for to, _ in RecordingConnection.sent) == expected
+            msg = email.message_from_string(RecordingConnection.sent[0][1])
+            assert msg['To'] in expected
+            assert decode_header(msg['Subject'])[0][0].decode() == 'Doors now open at 19:30'
+            assert 'Schedule change' in msg.get_payload(decode=True).decode()
+
+            resp = client.post(f"/api/events/{event.id}/broadcasts/{job['id']}/resume", headers=headers)
+            assert resp.status_code == 409
+
+            # A run that died after its first page picks up from the checkpoint
+            by_id = sorted((h for h in holders if h is not holders[2]), key=lambda h: h.id)
+            first_page = [h.id for h in by_id[:2]]
+            stored = db.session.get(BackgroundJob, job['id'])
+            stored.status = BackgroundJob.Status.FAILED
+            stored.checkpoint = {'after': first_page[-1], 'sent': 2, 'failed': 0, 'skipped': 0}
+            db.session.commit()
+            RecordingConnection.sent = []
+            resp = client.post(f"/api/events/{event.id}/broadcasts/{job['id']}/resume", headers=headers)
+            assert resp.status_code == 202
+            assert resp.get_json()['job']['result']['sent'] == 3
+            assert [to for to, _ in RecordingConnection.sent] == [by_id[2].email]
+
+            # A run still checkpointing is not stalled; one that stopped is claimed once
+            stored = db.session.get(BackgroundJob, job['id'])
+            stored.status = BackgroundJob.Status.RUNNING
+            stored.updated_at = datetime.utcnow()
+            db.session.commit()
+            resp = client.post(f"/api/events/{event.id}/broadcasts/{job['id']}/resume", headers=headers)
+            assert resp.status_code == 409
+            stored.updated_at = datetime.utcnow() - timedelta(seconds=broadcast.STALE_SECONDS + 60)
+            db.session.commit()
+            assert client.post(f"/api/events/{event.id}/broadcasts/{job['id']}/resume", headers=headers).status_code == 202
+            assert client.post(f"/api/events/{event.id}/broadcasts/{job['id']}/resume", headers=headers).status_code == 409
+
+            outsider = User(email='bcast-outsider@example.com', password_hash='x', first_name='O', last_name='U', role=User.Role.ORGANIZER)
+            db.session.add(outsider)
+            db.session.commit()
+            token = create_access_token(identity=outsider.id, additional_claims={'role': outsider.role})
+            resp = client.post(f'/api/events/{event.id}/broadcasts', headers={'Authorization': f'Bearer {token}'},
+                               json={'subject': 'x', 'message': 'y'})
+            assert resp.status_code == 403
+        finally:
+            app.config['BROADCAST_PAGE_SIZE'] = 1000
+
+
+def test_stall_threshold_allows_for_slow_sending():
+    assert broadcast.stale_seconds({'BROADCAST_PAGE_SIZE': 1000, 'BROADCAST_RATE_PER_SECOND': 50}) == broadcast.STALE_SECONDS
+    assert broadcast.stale_seconds({'BROADCAST_PAGE_SIZE': 1000, 'BROADCAST_RATE_PER_SECOND': 1}) == 3000
+    assert broadcast.stale_seconds({'BROADCAST_PAGE_SIZE': 1000, 'BROADCAST_RATE_PER_SECOND': 0}) == broadcast.STALE_SECONDS
+
+
+def test_token_bucket_limits_rate():
+    bucket = broadcast.TokenBucket(rate=50, burst=1)
+    started = datetime.utcnow()
+    for _ in range(6):
+        bucket.acquire()
+    assert (datetime.utcnow() - started).total_seconds() >= 0.09
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket, EmailOutbox
+from app.utils.email_outbox import RETRY, deliver_due, enqueue_ticket_email
+from app.utils.qr import HAS_QR
+from flask_jwt_extended import create_access_token
+
+
+class RecordingConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def send(self, msg):
+        if self.error:
+            raise self.error
+        self.sent.append(msg)
+
+
+def make_order(email, count):
+    user = User(email=email, password_hash='x', first_name='Out', last_name='Box')
+    db.session.add(user)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=2)
+    event = Event(title='Outbox Live', description='x', category='music', location='Hall',
+                  start_date=start, end_date=start + timedelta(hours=2), organizer_id=user.id)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=15.0, quantity=10, sold=0)
+    db.session.add(ticket_type)
+    db.session.commit()
+    tickets = [Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=user.id,
+                      ticket_number=f"TKT-{email.split('@')[0].upper()}-{i}", price=15.0, status=Ticket.Status.CONFIRMED)
+               for i in range(count)]
+    db.session.add_all(tickets)
+    db.session.commit()
+    return user, tickets
+
+
+def test_order_is_queued_and_sent_as_one_message(client, app):
+    with app.app_context():
+        user, tickets = make_order('outbox-one@example.com', 3)
+        enqueue_ticket_email(user.email, tickets)
+        db.session.commit()
+
+        connection = RecordingConnection()
+        counts = deliver_due(connection, app.config)
+        assert counts == {EmailOutbox.Status.SENT: 1}
+        assert len(connection.sent) == 1
+        msg = connection.sent[0]
+        assert msg['To'] == user.email and msg['Subject'] == 'Your 3 Tickets - Outbox Live'
+        images = [part for part in msg.walk() if part.get_content_type() == 'image/png']
+        assert len(images) == (3 if HAS_QR else 0)
+        entry = EmailOutbox.query.filter_by(recipient=user.email).one()
+        assert entry.status == EmailOutbox.Status.SENT and entry.attempts == 1 and entry.sent_at
+
+        # The email endpoint only queues
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        resp = client.post(f'/api/tickets/{tickets[0].id}/email', headers=headers)
+        assert resp.status_code == 202
+        assert EmailOutbox.query.filter_by(recipient=user.email, status=EmailOutbox.Status.PENDING).count() == 1
+        deliver_due(connection, app.config)
+        assert connection.sent[-1]['Subject'] == f'Your Ticket - Outbox Live | #{tickets[0].ticket_number}'
+
+
+def test_failed_sends_back_off_then_give_up(app):
+    with app.app_context():
+        user, tickets = make_order('outbox-fail@example.com', 1)
+        enqueue_ticket_email(user.email, tickets)
+        db.session.commit()
+
+        connection = RecordingConnection(error=OSError('connection refused'))
+        now = datetime.utcnow()
+        assert deliver_due(connection, app.config, now=now) == {RETRY: 1}
+        entry = EmailOutbox.query.filter_by(recipient=user.email).one()
+        assert entry.status == EmailOutbox.Status.PENDING and entry.attempts == 1
+        assert entry.last_error == 'connection refused'
+        first_delay = (entry.next_attempt_at - now).total_seconds()
+        assert 0.8 * app.config['EMAIL_RETRY_BASE_SECONDS'] <= first_delay <= 1.2 * app.config['EMAIL_RETRY_BASE_SECONDS']
+        # Not due again until the backoff has passed
+        assert deliver_due(connection, app.config, now=now) == {}
+
+        for _ in range(app.config['EMAIL_MAX_ATTEMPTS'] - 1):
+            now = entry.next_attempt_at
+            deliver_due(connection, app.config, now=now)
+            db.session.refresh(entry)
+        assert entry.status == EmailOutbox.Status.FAILED
+        assert entry.attempts == app.config['EMAIL_MAX_ATTEMPTS']
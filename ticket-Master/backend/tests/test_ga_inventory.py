@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, TicketTypeShard, Payment, PaymentReference, Ticket
+from app.routes import payments as payment_routes
+from app.utils.ga_inventory import check_ticket_type, reserve_tickets, set_shard_count, sold_total
+from app.utils.hold_expiry import expire_pending_payments
+from app.utils.payment_refs import add_reference
+from flask_jwt_extended import create_access_token
+
+
+def create_ticket_type(title, quantity):
+    organizer = User(email=f'{title.lower()}@example.com', password_hash='x', first_name='Or', last_name='Ganizer')
+    db.session.add(organizer)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=30)
+    event = Event(title=title, description='GA', category='music', location='City',
+                  start_date=start, end_date=start + timedelta(hours=4), organizer_id=organizer.id)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=20.0, quantity=quantity, sold=0)
+    db.session.add(ticket_type)
+    db.session.commit()
+    return organizer, ticket_type
+
+
+def test_purchase_and_cancel_move_counter_atomically(client, app):
+    with app.app_context():
+        user, ticket_type = create_ticket_type('Counter Fest', 3)
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        resp = client.post('/api/tickets', json={'ticket_type_id': ticket_type.id, 'quantity': 2}, headers=headers)
+        assert resp.status_code == 201
+        tickets = resp.get_json()['tickets']
+
+        resp = client.post('/api/tickets', json={'ticket_type_id': ticket_type.id, 'quantity': 2}, headers=headers)
+        assert resp.status_code == 400
+        assert resp.get_json()['error'] == 'Only 1 tickets available'
+
+        assert client.post(f"/api/tickets/{tickets[0]['id']}/cancel", headers=headers).status_code == 200
+        # Cancelling twice must not release the inventory twice
+        assert client.post(f"/api/tickets/{tickets[0]['id']}/cancel", headers=headers).status_code == 400
+        assert sold_total(ticket_type) == 1
+        assert check_ticket_type(ticket_type)['issues'] == []
+
+
+def test_sharded_counter_never_oversells(app):
+    with app.app_context():
+        _, ticket_type = create_ticket_type('Shard Fest', 10)
+        set_shard_count(ticket_type, 4)
+        db.session.commit()
+        quantities = [s.quantity for s in TicketTypeShard.query.filter_by(ticket_type_id=ticket_type.id).order_by(TicketTypeShard.shard)]
+        assert quantities == [3, 3, 2, 2]
+
+        # Threes fit in shards only while they last, then are gathered across shards
+        assert [reserve_tickets(ticket_type, 3) for _ in range(4)] == [True, True, True, False]
+        assert reserve_tickets(ticket_type, 1)
+        assert not reserve_tickets(ticket_type, 1)
+        db.session.commit()
+        assert sold_total(ticket_type) == 10
+        assert ticket_type.to_dict()['available'] == 0
+
+        # No tickets back these counters, so the checker flags and repairs them
+        report = check_ticket_type(ticket_type, repair=True)
+        db.session.commit()
+        assert report['repaired'] and report['sold'] == 10 and report['tickets'] == 0
+        assert sold_total(ticket_type) == 0
+        assert check_ticket_type(ticket_type)['issues'] == []
+
+        set_shard_count(ticket_type, 0)
+        db.session.commit()
+        assert TicketTypeShard.query.filter_by(ticket_type_id=ticket_type.id).count() == 0
+        assert reserve_tickets(ticket_type, 10) and not reserve_tickets(ticket_type, 1)
+
+
+def test_claim_reads_the_current_shard_count(app):
+    with app.app_context():
+        _, ticket_type = create_ticket_type('Reshard Fest', 4)
+        set_shard_count(ticket_type, 2)
+        db.session.commit()
+        assert ticket_type.shard_count == 2
+
+        # Another transaction merges the shards; this session still sees 2
+        db.session.execute(db.delete(TicketTypeShard).where(TicketTypeShard.ticket_type_id == ticket_type.id))
+        db.session.execute(
+            db.update(TicketType).where(TicketType.id == ticket_type.id).values(shard_count=0, sold=0)
+            .execution_options(synchronize_session=False)
+        )
+        assert ticket_type.shard_count == 2
+        assert reserve_tickets(ticket_type, 3)
+        db.session.commit()
+        assert (ticket_type.shard_count, ticket_type.sold) == (0, 3)
+
+
+class DecliningPayPal:
+    def capture_payment(self, order_id):
+        return {'success': False, 'error': {'name': 'UNPROCESSABLE_ENTITY'}}
+
+
+def test_failed_and_abandoned_payments_release_inventory(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', DecliningPayPal)
+    with app.app_context():
+        user, ticket_type = create_ticket_type('Abandon Fest', 5)
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        def checkout(quantity):
+            body = {'event_id': ticket_type.event_id, 'ticket_type_id': ticket_type.id, 'quantity': quantity}
+            resp = client.post('/api/payments/create', json=body, headers=headers)
+            assert resp.status_code == 201
+            return resp.get_json()['payment_id']
+
+        declined, abandoned = checkout(2), checkout(2)
+        assert sold_total(ticket_type) == 4
+
+        # The capture is declined: the tickets go back on sale
+        add_reference(declined, PaymentReference.Provider.PAYPAL, PaymentReference.Type.ORDER, 'ORDER-DECLINED')
+        db.session.commit()
+        resp = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-DECLINED'}, headers=headers)
+        assert resp.status_code == 400
+        assert sold_total(ticket_type) == 2
+        assert {t.status for t in Ticket.query.filter_by(payment_id=declined)} == {Ticket.Status.CANCELLED}
+
+        # The other checkout is never completed and expires
+        assert expire_pending_payments(3600, now=datetime.utcnow() + timedelta(minutes=30)) == []
+        assert abandoned in expire_pending_payments(3600, now=datetime.utcnow() + timedelta(hours=2))
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(Payment, abandoned).status == Payment.Status.FAILED
+        assert sold_total(ticket_type) == 0
+        assert check_ticket_type(ticket_type)['issues'] == []
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket
+from app.utils.gate_bundle import HEADER, REVOKED, USED, VALID, lookup, read_bundle, ticket_hash
+from flask_jwt_extended import create_access_token
+
+
+def test_gate_bundle_and_deltas(client, app):
+    with app.app_context():
+        organizer = User(email='bundle@example.com', password_hash='x', first_name='B', last_name='O', role=User.Role.ORGANIZER)
+        db.session.add(organizer)
+        db.session.commit()
+        start = datetime.utcnow() + timedelta(days=1)
+        event = Event(title='Bundle Night', description='Gate', category='music', location='City',
+                      start_date=start, end_date=start + timedelta(hours=3), organizer_id=organizer.id)
+        db.session.add(event)
+        db.session.commit()
+        ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=20.0, quantity=100, sold=0)
+        db.session.add(ticket_type)
+        db.session.commit()
+
+        statuses = [Ticket.Status.CONFIRMED] * 20 + [Ticket.Status.USED] * 3 + [Ticket.Status.PENDING, Ticket.Status.CANCELLED]
+        tickets = [
+            Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=organizer.id,
+                   ticket_number=f'TKT-BUNDLE-{i:03d}', price=20.0, status=status)
+            for i, status in enumerate(statuses)
+        ]
+        db.session.add_all(tickets)
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=organizer.id, additional_claims={'role': organizer.role})}"}
+
+        resp = client.get(f'/api/tickets/gate-bundle/{event.id}', headers=headers)
+        assert resp.status_code == 200
+        bundle = resp.data
+        header, entries = read_bundle(bundle)
+        assert header['count'] == 23 and header['flags'] == 0
+        assert len(bundle) == HEADER.size + 23 * 5 + 6
+        assert lookup(bundle, event.id, 'TKT-BUNDLE-000') == VALID
+        assert lookup(bundle, event.id, 'TKT-BUNDLE-021') == USED
+        assert lookup(bundle, event.id, 'TKT-BUNDLE-023') is None  # pending
+        assert lookup(bundle, event.id, 'TKT-UNKNOWN') is None
+        # Hashes are per event, so a bundle says nothing about other events
+        assert ticket_hash('another-event', 'TKT-BUNDLE-000') not in entries
+
+        version = int(resp.headers['X-Gate-Bundle-Version'])
+        tickets[0].status = Ticket.Status.CANCELLED
+        tickets[23].status = Ticket.Status.CONFIRMED
+        db.session.commit()
+
+        resp = client.get(f'/api/tickets/gate-bundle/{event.id}?since={version}', headers=headers)
+        header, delta = read_bundle(resp.data)
+        assert header['flags'] == 1 and header['since'] == version
+        assert delta[ticket_hash(event.id, 'TKT-BUNDLE-000')] == REVOKED
+        assert delta[ticket_hash(event.id, 'TKT-BUNDLE-023')] == VALID
+
+        other = User(email='bundle-other@example.com', password_hash='x', first_name='B', last_name='X', role=User.Role.ORGANIZER)
+        db.session.add(other)
+        db.session.commit()
+        token = create_access_token(identity=other.id, additional_claims={'role': other.role})
+        resp = client.get(f'/api/tickets/gate-bundle/{event.id}', headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 403
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from app.models import db, Venue, VenueSection, Seat
+from app.utils.hold_expiry import HoldExpiryScheduler
+
+
+def test_scheduler_releases_due_and_orphaned_holds(app):
+    with app.app_context():
+        venue = Venue(name='Expiry Hall', address='1 Rd', city='City', country='Country', capacity=3)
+        db.session.add(venue)
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=3, rows=1, seats_per_row=3)
+        db.session.add(section)
+        db.session.commit()
+
+        past = datetime.utcnow() - timedelta(seconds=1)
+        future = datetime.utcnow() + timedelta(minutes=10)
+        tracked = Seat(section_id=section.id, row=1, seat_number=1, status=Seat.Status.RESERVED, reserved_until=past)
+        orphan = Seat(section_id=section.id, row=1, seat_number=2, status=Seat.Status.RESERVED, reserved_until=past)
+        live = Seat(section_id=section.id, row=1, seat_number=3, status=Seat.Status.RESERVED, reserved_until=future)
+        db.session.add_all([tracked, orphan, live])
+        db.session.commit()
+
+        scheduler = HoldExpiryScheduler()
+        scheduler.app = app
+        scheduler.sweep_seconds = 1.0
+        scheduler.batch_size = 500
+        scheduler.lease_seconds = 5
+        # Queue without starting the background thread
+        scheduler._heap = [(past, (tracked.id,))]
+
+        scheduler.tick()
+
+        db.session.expire_all()
+        assert db.session.get(Seat, tracked.id).status == Seat.Status.AVAILABLE
+        assert db.session.get(Seat, orphan.id).status == Seat.Status.AVAILABLE
+        assert db.session.get(Seat, live.id).status == Seat.Status.RESERVED
+
+        metrics = scheduler.metrics()
+        assert metrics['released_total'] == 1
+        assert metrics['swept_total'] >= 1
+        assert metrics['is_leader'] is True
+        assert metrics['backlog'] == 0
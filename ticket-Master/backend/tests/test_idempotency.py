@@ -0,0 +1,131 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Payment, IdempotencyKey
+from app.routes import tickets as ticket_routes
+from app.utils.ga_inventory import sold_total
+from app.utils.idempotency import purge_expired_keys
+from flask_jwt_extended import create_access_token
+
+
+def setup_sale(tag):
+    user = User(email=f'idem-{tag}@example.com', password_hash='x', first_name='I', last_name='D')
+    db.session.add(user)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=10)
+    event = Event(title=f'Idem {tag}', description='x', category='music', location='City',
+                  start_date=start, end_date=start + timedelta(hours=3), organizer_id=user.id)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=10.0, quantity=50, sold=0)
+    db.session.add(ticket_type)
+    db.session.commit()
+    return user, ticket_type
+
+
+def purchase(client, user, ticket_type, key, quantity=2):
+    body = json.dumps({'ticket_type_id': ticket_type.id, 'quantity': quantity})
+    headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}', 'Idempotency-Key': key}
+    return client.post('/api/tickets', data=body, content_type='application/json', headers=headers)
+
+
+def hold_key(user, ticket_type, key, locked_until):
+    """A claim on ``key`` as a request still running (or one that died) would leave it"""
+    body = json.dumps({'ticket_type_id': ticket_type.id, 'quantity': 2})
+    now = datetime.utcnow()
+    db.session.add(IdempotencyKey(
+        scope=f'tickets.purchase_ticket:{user.id}', key=key,
+        fingerprint=hashlib.sha256(f'POST /api/tickets\n{body}'.encode()).hexdigest(),
+        owner='other-request', locked_until=locked_until, expires_at=now + timedelta(days=1),
+    ))
+    db.session.commit()
+
+
+def test_retry_replays_first_response_without_selling_again(client, app):
+    with app.app_context():
+        user, ticket_type = setup_sale('replay')
+
+        first = purchase(client, user, ticket_type, 'key-replay')
+        assert first.status_code == 201
+        retry = purchase(client, user, ticket_type, 'key-replay')
+        assert retry.status_code == 201
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert retry.get_json() == first.get_json()
+        assert Payment.query.filter_by(user_id=user.id).count() == 1
+        assert sold_total(ticket_type) == 2
+
+        # Same key, different request
+        resp = purchase(client, user, ticket_type, 'key-replay', quantity=3)
+        assert resp.status_code == 422
+        # Keys belong to their user
+        other, _ = setup_sale('replay-other')
+        assert purchase(client, other, ticket_type, 'key-replay').headers.get('Idempotent-Replayed') is None
+        # No key, no deduplication
+        client.post('/api/tickets', json={'ticket_type_id': ticket_type.id, 'quantity': 1},
+                    headers={'Authorization': f'Bearer {create_access_token(identity=user.id)}'})
+        assert Payment.query.filter_by(user_id=user.id).count() == 2
+
+
+def test_duplicate_of_running_request_waits_then_gets_409(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IDEMPOTENCY_WAIT_SECONDS', 0.2)
+    with app.app_context():
+        user, ticket_type = setup_sale('inflight')
+        hold_key(user, ticket_type, 'key-inflight', datetime.utcnow() + timedelta(minutes=1))
+
+        resp = purchase(client, user, ticket_type, 'key-inflight')
+        assert resp.status_code == 409
+        assert resp.headers['Retry-After'] == '1'
+        assert Payment.query.filter_by(user_id=user.id).count() == 0
+
+
+def test_claim_of_dead_request_is_taken_over(client, app):
+    with app.app_context():
+        user, ticket_type = setup_sale('lapsed')
+        hold_key(user, ticket_type, 'key-lapsed', datetime.utcnow() - timedelta(seconds=1))
+
+        assert purchase(client, user, ticket_type, 'key-lapsed').status_code == 201
+        assert purchase(client, user, ticket_type, 'key-lapsed').headers['Idempotent-Replayed'] == 'true'
+        assert Payment.query.filter_by(user_id=user.id).count() == 1
+
+
+def test_server_error_is_not_stored(client, app, monkeypatch):
+    with app.app_context():
+        user, ticket_type = setup_sale('error')
+
+        def unavailable(ticket_type, quantity):
+            raise RuntimeError('database unavailable')
+
+        real_reserve = ticket_routes.reserve_tickets
+        monkeypatch.setattr(ticket_routes, 'reserve_tickets', unavailable)
+        assert purchase(client, user, ticket_type, 'key-error').status_code == 500
+        monkeypatch.setattr(ticket_routes, 'reserve_tickets', real_reserve)
+        resp = purchase(client, user, ticket_type, 'key-error')
+        assert resp.status_code == 201
+        assert resp.headers.get('Idempotent-Replayed') is None
+
+
+def test_purge_expired_keys(app):
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.add_all([
+            IdempotencyKey(scope='purge', key='old', fingerprint='x', status=IdempotencyKey.Status.COMPLETED,
+                           expires_at=now - timedelta(seconds=1)),
+            IdempotencyKey(scope='purge', key='new', fingerprint='x', status=IdempotencyKey.Status.COMPLETED,
+                           expires_at=now + timedelta(hours=1)),
+        ])
+        db.session.commit()
+        assert purge_expired_keys(now=now) >= 1
+        assert [k.key for k in IdempotencyKey.query.filter_by(scope='purge')] == ['new']
+
+
+def test_anonymous_keys_are_scoped_to_the_client(client, app):
+    with app.app_context():
+        def quick_purchase(user_agent):
+            return client.post('/api/tickets/quick-purchase', json={'email': 'anon@example.com'},
+                               headers={'Idempotency-Key': 'key-anon', 'User-Agent': user_agent})
+
+        first = quick_purchase('client-a')
+        assert first.status_code == 400
+        assert quick_purchase('client-a').headers['Idempotent-Replayed'] == 'true'
+        # Another anonymous client picking the same key gets its own response
+        assert quick_purchase('client-b').headers.get('Idempotent-Replayed') is None
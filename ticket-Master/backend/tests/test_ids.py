@@ -0,0 +1,50 @@
+from app.models import db
+from app.utils import ids
+
+
+def test_encode_round_trip_and_check_symbol():
+    for value in (0, 1, 31, 32, 1000, 37 * 1234, 32 ** 8 - 1):
+        text = ids.encode(value)
+        assert len(text) == ids.WIDTH + 1
+        assert ids.decode(text) == value
+        assert ids.decode(text.lower()) == value
+    text = ids.encode(123456)
+    typo = text[:3] + ('1' if text[3] != '1' else '2') + text[4:]
+    assert ids.decode(typo) is None
+    swapped = text[:6] + text[7] + text[6] + text[8:]
+    assert swapped == text or ids.decode(swapped) is None
+    assert ids.decode('TOO-SHORT') is None
+
+
+def test_allocations_are_unique_and_ordered_across_blocks(app):
+    with app.app_context():
+        app.config['ID_BLOCK_SIZE'] = 5
+        try:
+            numbers = ids.ticket_numbers(3) + ids.ticket_numbers(12) + ids.ticket_numbers()
+            db.session.commit()
+        finally:
+            app.config['ID_BLOCK_SIZE'] = 1000
+        assert len(set(numbers)) == 16
+        suffixes = [n.split('-')[2] for n in numbers]
+        assert suffixes == sorted(suffixes)
+        assert all(ids.is_valid_ticket_number(n) for n in numbers)
+        assert not ids.is_valid_ticket_number('TKT-20240101-1A2B3C4D')
+        assert ids.transaction_ids()[0].startswith('TXN-')
+
+
+def test_rolled_back_claim_is_released(app):
+    with app.app_context():
+        app.config['ID_BLOCK_SIZE'] = 4
+        try:
+            ids.ticket_numbers()
+            db.session.commit()
+            allocator = ids._allocators[ids.TICKET_NUMBERS]
+            allocator.discard()
+            rolled_back = ids.ticket_numbers(2)
+            db.session.rollback()
+            # The claim was undone with the transaction, so the values come back
+            again = ids.ticket_numbers(2)
+            db.session.commit()
+        finally:
+            app.config['ID_BLOCK_SIZE'] = 1000
+        assert again == rolled_back
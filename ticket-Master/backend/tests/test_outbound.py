@@ -0,0 +1,161 @@
+import threading
+import time
+import pytest
+import requests
+from app.models import db, User, Payment, PaymentReference
+from app.utils import outbound
+from app.utils.outbound import CLOSED, HALF_OPEN, OPEN, ProviderClient, ProviderUnavailable
+from app.utils.payment_refs import add_reference
+from flask_jwt_extended import create_access_token
+
+CONFIG = {
+    'TEST_RETRIES': 2,
+    'TEST_MAX_CONCURRENCY': 1,
+    'OUTBOUND_RETRY_BASE_SECONDS': 0,
+    'OUTBOUND_BULKHEAD_WAIT_SECONDS': 0.05,
+    'OUTBOUND_BREAKER_FAILURES': 3,
+    'OUTBOUND_BREAKER_RESET_SECONDS': 0.1,
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class ScriptedSession:
+    """Plays back a status code or exception per request"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        assert timeout[0] > 0 and timeout[1] > 0
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+def make_client(session):
+    http = ProviderClient('test', CONFIG)
+    http.session = lambda: session
+    return http
+
+
+@pytest.fixture()
+def clean_clients():
+    outbound._clients.clear()
+    yield
+    outbound._clients.clear()
+
+
+def test_idempotent_calls_are_retried_and_others_are_not():
+    session = ScriptedSession(503, requests.exceptions.ReadTimeout(), 200)
+    http = make_client(session)
+    assert http.get('https://provider.test/thing').status_code == 200
+    assert session.calls == 3
+    assert http.metrics()['retries'] == 2
+
+    # The provider may have acted on a POST it timed out on, so it is not resent
+    session = ScriptedSession(requests.exceptions.ReadTimeout(), 200)
+    with pytest.raises(ProviderUnavailable):
+        make_client(session).post('https://provider.test/orders')
+    assert session.calls == 1
+
+    # ...unless the connection was never made, or the caller vouches for it
+    session = ScriptedSession(requests.exceptions.ConnectTimeout(), 201)
+    assert make_client(session).post('https://provider.test/orders').status_code == 201
+    session = ScriptedSession(502, 201)
+    assert make_client(session).post('https://provider.test/orders', idempotent=True).status_code == 201
+
+    # Client errors are answers, not failures
+    session = ScriptedSession(404)
+    http = make_client(session)
+    assert http.get('https://provider.test/missing').status_code == 404
+    assert session.calls == 1
+    assert http.breaker.state == CLOSED
+
+
+def test_breaker_opens_short_circuits_and_probes():
+    session = ScriptedSession(500, 500, 500)
+    http = make_client(session)
+    response = http.get('https://provider.test/thing', idempotent=False)
+    assert response.status_code == 500
+    http.get('https://provider.test/thing', idempotent=False)
+    http.get('https://provider.test/thing', idempotent=False)
+    assert http.breaker.state == OPEN
+
+    with pytest.raises(ProviderUnavailable) as error:
+        http.get('https://provider.test/thing')
+    assert error.value.reason == 'circuit open'
+    assert session.calls == 3
+    assert http.metrics()['short_circuited'] == 1
+
+    # After the reset interval one probe goes out; others still fail fast
+    time.sleep(0.12)
+    assert http.breaker.allow()
+    assert http.breaker.state == HALF_OPEN
+    assert not http.breaker.allow()
+    http.breaker.record_failure()
+    assert http.breaker.state == OPEN
+
+    time.sleep(0.12)
+    assert http.get('https://provider.test/thing').status_code == 200
+    assert http.breaker.state == CLOSED
+    assert http.metrics()['breaker']['opens'] == 2
+
+
+def test_bulkhead_rejects_calls_beyond_the_limit():
+    release = threading.Event()
+
+    class SlowSession(ScriptedSession):
+        def request(self, *args, **kwargs):
+            release.wait(1)
+            return super().request(*args, **kwargs)
+
+    http = make_client(SlowSession())
+    first = threading.Thread(target=http.get, args=('https://provider.test/slow',))
+    first.start()
+    time.sleep(0.02)
+    assert http.metrics()['in_flight'] == 1
+    with pytest.raises(ProviderUnavailable) as error:
+        http.get('https://provider.test/slow')
+    assert error.value.reason == 'too many calls in flight'
+    release.set()
+    first.join()
+    assert http.metrics()['bulkhead_rejected'] == 1
+    assert http.metrics()['in_flight'] == 0
+
+
+def test_provider_outage_only_degrades_its_endpoints(client, app, clean_clients):
+    with app.app_context():
+        google = outbound.client('google')
+        for _ in range(app.config['OUTBOUND_BREAKER_FAILURES']):
+            google.breaker.record_failure()
+
+        resp = client.post('/api/auth/google', json={'credential': 'token'})
+        assert resp.status_code == 503
+        assert int(resp.headers['Retry-After']) >= 1
+        assert client.get('/api/health').status_code == 200
+
+        # A PayPal outage leaves an unpaid order pending rather than failed
+        user = User(email='outbound@example.com', password_hash='x', first_name='O', last_name='B')
+        db.session.add(user)
+        db.session.commit()
+        payment = Payment(user_id=user.id, amount=10.0, method=Payment.Method.CARD, transaction_id='TXN-OUTBOUND')
+        db.session.add(payment)
+        db.session.commit()
+        add_reference(payment.id, PaymentReference.Provider.PAYPAL, PaymentReference.Type.ORDER, 'ORDER-OUTBOUND')
+        db.session.commit()
+        paypal = outbound.client('paypal')
+        for _ in range(app.config['OUTBOUND_BREAKER_FAILURES']):
+            paypal.breaker.record_failure()
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        resp = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-OUTBOUND'}, headers=headers)
+        assert resp.status_code == 503
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.PENDING
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket, Payment, PaymentReference, EmailOutbox
+from app.routes import payments as payment_routes
+from app.utils.payment_refs import add_reference, backfill_references, find_payment
+from app.utils.webhook_inbox import process_pending_webhooks
+from flask_jwt_extended import create_access_token
+
+PAYPAL = PaymentReference.Provider.PAYPAL
+
+
+class FakePayPal:
+    def capture_payment(self, order_id):
+        return {'success': True, 'data': {
+            'id': order_id, 'status': 'COMPLETED',
+            'purchase_units': [{'payments': {'captures': [{'id': f'CAP-{order_id}'}]}}],
+        }}
+
+    def verify_webhook(self, webhook_data):
+        return True
+
+
+def make_payment(user, tag, metadata=None):
+    start = datetime.utcnow() + timedelta(days=1)
+    event = Event(title=f'Refs {tag}', description='x', category='music', location='City',
+                  start_date=start, end_date=start + timedelta(hours=2), organizer_id=user.id, total_attendees=0)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=25.0, quantity=10, sold=1)
+    payment = Payment(user_id=user.id, amount=25.0, method=Payment.Method.CARD,
+                      transaction_id=f'TXN-REFS-{tag}', metadata_json=metadata)
+    db.session.add_all([ticket_type, payment])
+    db.session.commit()
+    ticket = Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=user.id, payment_id=payment.id,
+                    ticket_number=f'TKT-REFS-{tag}', price=25.0, status=Ticket.Status.PENDING)
+    db.session.add(ticket)
+    db.session.commit()
+    return payment, ticket
+
+
+def test_capture_and_refund_webhook_find_payment_by_reference(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        user = User(email='refs@example.com', password_hash='x', first_name='R', last_name='F')
+        db.session.add(user)
+        db.session.commit()
+        payment, ticket = make_payment(user, 'A', {'paypal_order_id': 'ORDER-A'})
+        add_reference(payment.id, PAYPAL, PaymentReference.Type.ORDER, 'ORDER-A')
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        resp = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-A'}, headers=headers)
+        assert resp.status_code == 200
+        db.session.expire_all()
+        assert find_payment(PAYPAL, PaymentReference.Type.CAPTURE, 'CAP-ORDER-A').id == payment.id
+        assert db.session.get(Payment, payment.id).metadata_json['paypal_capture_id'] == 'CAP-ORDER-A'
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.CONFIRMED
+
+        resp = client.post('/api/payments/paypal/callback', json={
+            'event_type': 'PAYMENT.CAPTURE.REFUNDED', 'resource': {'id': 'CAP-ORDER-A'}})
+        assert resp.status_code == 200
+        process_pending_webhooks(app.config)
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.REFUNDED
+
+        resp = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-UNKNOWN'}, headers=headers)
+        assert resp.status_code == 404
+
+
+def capture_setup(tag):
+    user = User(email=f'capture-{tag}@example.com', password_hash='x', first_name='C', last_name='P')
+    db.session.add(user)
+    db.session.commit()
+    payment, ticket = make_payment(user, tag)
+    add_reference(payment.id, PAYPAL, PaymentReference.Type.ORDER, f'ORDER-{tag}')
+    db.session.commit()
+    return payment, ticket, {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+
+def test_repeated_capture_confirms_tickets_once(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        payment, ticket, headers = capture_setup('TWICE')
+
+        first = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-TWICE'}, headers=headers)
+        assert first.status_code == 200
+        token = db.session.get(Ticket, ticket.id).qr_code
+        retry = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-TWICE'}, headers=headers)
+        assert retry.status_code == 200
+        assert retry.get_json()['tickets'] == first.get_json()['tickets']
+
+        db.session.expire_all()
+        assert db.session.get(Ticket, ticket.id).qr_code == token
+        assert db.session.get(Event, ticket.event_id).total_attendees == 1
+        assert EmailOutbox.query.filter_by(recipient='capture-TWICE@example.com').count() == 1
+
+
+def test_capture_after_refund_is_rejected(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        payment, ticket, headers = capture_setup('REFUNDED')
+        payment.status = Payment.Status.REFUNDED
+        ticket.status = Ticket.Status.REFUNDED
+        db.session.commit()
+
+        resp = client.post('/api/payments/paypal/capture-order', json={'order_id': 'ORDER-REFUNDED'}, headers=headers)
+        assert resp.status_code == 409
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.REFUNDED
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.REFUNDED
+
+
+def test_backfill_and_indexed_lookup(app):
+    with app.app_context():
+        user = User(email='refs-backfill@example.com', password_hash='x', first_name='R', last_name='B')
+        db.session.add(user)
+        db.session.commit()
+        payment, _ = make_payment(user, 'B', {'paypal_order_id': 'ORDER-B', 'paypal_capture_id': 'CAP-B'})
+        other, _ = make_payment(user, 'C', {'paypal_order_id': 'ORDER-B'})
+
+        assert backfill_references() == 2
+        assert backfill_references() == 0
+        # Two payments claiming one order id: the first in id order keeps it
+        assert find_payment(PAYPAL, PaymentReference.Type.ORDER, 'ORDER-B').id == min(payment.id, other.id)
+        assert find_payment(PAYPAL, PaymentReference.Type.CAPTURE, 'CAP-B').id == payment.id
+        assert find_payment(PAYPAL, PaymentReference.Type.ORDER, 'ORDER-MISSING') is None
+
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT payment_id FROM payment_references "
+            "WHERE provider = 'paypal' AND ref_type = 'order' AND ref_value = 'ORDER-B'"
+        )).all()
+        assert any('USING INDEX' in row[-1] for row in plan)
@@ -0,0 +1,92 @@
+import shutil
+import threading
+import time
+import pytest
+from app.utils import integrations, outbound
+from app.utils.integrations import PayPalHandler
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    def __init__(self, token_delay=0):
+        self.token_delay = token_delay
+        self.token_requests = 0
+        self.calls = []
+        self.reject = set()
+
+    def request(self, method, url, headers=None, timeout=None, **kwargs):
+        assert timeout
+        if url.endswith('/v1/oauth2/token'):
+            time.sleep(self.token_delay)
+            self.token_requests += 1
+            return FakeResponse(200, {'access_token': f'token-{self.token_requests}', 'expires_in': 32400})
+        token = headers['Authorization'].split()[1]
+        self.calls.append((method, url, token))
+        if token in self.reject:
+            return FakeResponse(401, {'error': 'invalid_token'})
+        return FakeResponse(201 if method == 'POST' else 200, {'id': 'ORDER-1', 'status': 'COMPLETED'})
+
+
+@pytest.fixture()
+def paypal(app, monkeypatch):
+    session = FakeSession()
+    integrations._token_caches.clear()
+    outbound._clients.clear()
+    shutil.rmtree(app.config['PAYPAL_TOKEN_CACHE_DIR'], ignore_errors=True)
+    with app.app_context():
+        monkeypatch.setattr(outbound.client('paypal'), 'session', lambda: session)
+        yield session
+    integrations._token_caches.clear()
+    outbound._clients.clear()
+
+
+def test_token_is_fetched_once_and_shared_between_processes(paypal):
+    handler = PayPalHandler()
+    assert handler.create_order(10, 'USD', 'ref', 'Tickets', 'http://x/return')['success']
+    assert handler.capture_payment('ORDER-1')['success']
+    assert PayPalHandler().get_order_details('ORDER-1')['status'] == 'COMPLETED'
+    assert paypal.token_requests == 1
+    assert [call[2] for call in paypal.calls] == ['token-1'] * 3
+
+    # Another worker process starts with an empty memory cache and reads the shared file
+    integrations._token_caches.clear()
+    assert PayPalHandler().get_access_token() == 'token-1'
+    assert paypal.token_requests == 1
+
+
+def test_rejected_token_is_replaced_once(paypal):
+    handler = PayPalHandler()
+    handler.get_access_token()
+    paypal.reject.add('token-1')
+    assert handler.capture_payment('ORDER-1')['success']
+    assert paypal.token_requests == 2
+    assert [call[2] for call in paypal.calls] == ['token-1', 'token-2']
+
+
+def test_token_near_expiry_is_refreshed(paypal):
+    handler = PayPalHandler()
+    handler.get_access_token()
+    handler.tokens._expires_at = time.time() + handler.tokens.refresh_margin - 1
+    shutil.rmtree(handler.tokens.directory, ignore_errors=True)
+    assert handler.get_access_token() == 'token-2'
+
+
+def test_concurrent_refresh_is_single_flight(paypal):
+    paypal.token_delay = 0.1
+    handler = PayPalHandler()
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(handler.get_access_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['token-1'] * 8
+    assert paypal.token_requests == 1
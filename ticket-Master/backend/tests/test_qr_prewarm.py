@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket
+from app.utils.qr import cache as qr_cache, content_hash, ticket_payload
+from flask_jwt_extended import create_access_token
+
+
+def test_prewarm_job_renders_confirmed_tickets(client, app):
+    with app.app_context():
+        admin = User(email='qr-admin@example.com', password_hash='x', first_name='Q', last_name='A', role=User.Role.ADMIN)
+        db.session.add(admin)
+        db.session.commit()
+        start = datetime.utcnow() + timedelta(days=7)
+        event = Event(title='Prewarm Night', description='QR', category='music', location='City',
+                      start_date=start, end_date=start + timedelta(hours=3), organizer_id=admin.id)
+        db.session.add(event)
+        db.session.commit()
+        ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=10.0, quantity=10, sold=0)
+        db.session.add(ticket_type)
+        db.session.commit()
+
+        statuses = [Ticket.Status.PENDING] + [Ticket.Status.CONFIRMED] * 4 + [Ticket.Status.CANCELLED]
+        tickets = []
+        for i, status in enumerate(statuses):
+            number = f'TKT-PREWARM-{event.id[:8]}-{i}'
+            tickets.append(Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=admin.id, ticket_number=number, price=10,
+                                  status=status, qr_code=ticket_payload(number, event.id)))
+        db.session.add_all(tickets)
+        db.session.commit()
+        payloads = {t.status: t.qr_code for t in tickets}
+
+        token = create_access_token(identity=admin.id, additional_claims={'role': admin.role})
+        resp = client.post(f'/api/admin/events/{event.id}/qr-prewarm', json={'batch_size': 2},
+                           headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 202
+        job = resp.get_json()['job']
+        assert job['status'] == 'succeeded'
+        assert job['progress_total'] == 4 and job['progress_done'] == 4
+        assert job['result']['tickets'] == 4
+        assert job['result']['rendered'] + job['result']['cached'] == 4
+        # Pre-warmed images go to disk without flushing the in-memory LRU
+        assert content_hash(payloads[Ticket.Status.CONFIRMED]) not in qr_cache._memory
+        assert qr_cache.get(content_hash(payloads[Ticket.Status.CONFIRMED])) is not None
+
+        # A second run finds everything cached
+        resp = client.post(f'/api/admin/events/{event.id}/qr-prewarm', headers={'Authorization': f'Bearer {token}'})
+        assert resp.get_json()['job']['result']['rendered'] == 0
+
+        # An event the disk cache cannot hold is refused
+        max_files = qr_cache.disk_max_files
+        qr_cache.disk_max_files = 3
+        try:
+            resp = client.post(f'/api/admin/events/{event.id}/qr-prewarm', headers={'Authorization': f'Bearer {token}'})
+            assert resp.status_code == 400
+            assert 'QR_DISK_CACHE_MAX_FILES' in resp.get_json()['error']
+        finally:
+            qr_cache.disk_max_files = max_files
+
+
+def test_render_many_uses_the_process_pool(app):
+    with app.app_context():
+        workers = qr_cache.render_workers
+        qr_cache.render_workers = 2
+        try:
+            payloads = [f'TICKET:POOL-{i}-{datetime.utcnow().timestamp()}|EVENT:pool' for i in range(qr_cache.min_parallel_batch)]
+            stats = qr_cache.render_many(payloads + payloads[:2])
+            assert stats['workers'] == 2
+            assert stats['rendered'] == len(payloads) and stats['cached'] == 2
+            assert stats['pngs_per_second'] and stats['pngs_per_second_per_core']
+            assert all(qr_cache.get(content_hash(p)).startswith(b'\x89PNG') for p in payloads)
+        finally:
+            qr_cache.render_workers = workers
@@ -0,0 +1,79 @@
+from app.models import db, User, Venue, VenueSection, Seat
+from app.utils.seat_cache import SeatStateCache, cache
+from app.utils import seat_changes
+from app.utils.seat_changes import record_seat_changes
+from app.utils.seat_inventory import STATUS_CODES
+from flask_jwt_extended import create_access_token
+
+
+def test_availability_is_served_from_shared_cache(client, app, monkeypatch):
+    with app.app_context():
+        user = User(email='cache@example.com', password_hash='x', first_name='Ca', last_name='Che')
+        venue = Venue(name='Cache Hall', address='1 Rd', city='City', country='Country', capacity=4)
+        db.session.add_all([user, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=4, rows=2, seats_per_row=2)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=r, seat_number=n, status=Seat.Status.AVAILABLE) for r in (1, 2) for n in (1, 2)]
+        db.session.add_all(seats)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        resp = client.get(f'/api/seats/venue/{venue.id}/availability')
+        assert resp.get_json()['sections'][0]['counts']['available'] == 4
+
+        # Committed changes are written through to the shared file
+        client.post('/api/seats/reserve', json={'seat_ids': [seats[0].id], 'atomic': True}, headers=headers)
+        counts = client.get(f'/api/seats/venue/{venue.id}/availability').get_json()['sections'][0]['counts']
+        assert (counts['available'], counts['reserved']) == (3, 1)
+
+        # Another worker mapping the same file sees it without a rebuild
+        other = SeatStateCache()
+        other.enabled, other.directory, other.max_age_seconds = True, cache.directory, 60
+        grid = other.get(venue.id)
+        assert grid.statuses(section.id)[0] == STATUS_CODES[Seat.Status.RESERVED]
+
+        # A change committed on another host arrives through the change log
+        seats[3].status = Seat.Status.SOLD
+        db.session.flush()
+        record_seat_changes([seats[3].id])
+        monkeypatch.setattr(seat_changes, '_commit_listeners', [])
+        db.session.commit()
+        monkeypatch.undo()
+        assert grid.statuses(section.id)[3] == STATUS_CODES[Seat.Status.AVAILABLE]
+        other.max_age_seconds = 0
+        assert other.get(venue.id).statuses(section.id)[3] == STATUS_CODES[Seat.Status.SOLD]
+        assert other.get(venue.id).version == 2
+
+
+def test_seat_maps_are_served_from_the_cache(client, app, monkeypatch):
+    with app.app_context():
+        user = User(email='cache-map@example.com', password_hash='x', first_name='Ca', last_name='Map')
+        venue = Venue(name='Cache Map Hall', address='1 Rd', city='City', country='Country', capacity=3)
+        db.session.add_all([user, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=3, rows=1, seats_per_row=3)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=1, seat_number=n, status=Seat.Status.AVAILABLE, price=25.0) for n in (1, 2, 3)]
+        db.session.add_all(seats)
+        db.session.commit()
+        url = f'/api/seats/venue/{venue.id}/seatmap'
+        assert client.get(url).status_code == 200
+
+        # Once the venue file and layout exist, no full seat read is needed
+        def no_full_read(*args, **kwargs):
+            raise AssertionError('seat states read from the database')
+        monkeypatch.setattr('app.utils.seat_cache.status_grids', no_full_read)
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        client.post('/api/seats/reserve', json={'seat_ids': [seats[1].id], 'atomic': True}, headers=headers)
+
+        compact = client.get(f'{url}?format=compact').get_json()
+        assert compact['sections'][0]['status_runs'] == [0, 1, 1, 1, 0, 1]
+        assert compact['sections'][0]['price_palette'] == [25.0]
+        full = client.get(url).get_json()
+        held = full['sections'][0]['seats'][1]
+        assert (held['id'], held['status'], held['reserved_by']) == (seats[1].id, Seat.Status.RESERVED, user.id)
+        assert full['version'] == compact['version']
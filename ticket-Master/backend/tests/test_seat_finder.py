@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Venue, VenueSection, Seat
+from app.utils.seat_changes import bump_version, record_seat_changes
+from app.utils.seat_finder import get_index
+from app.utils.seat_generation import generate_section_seats
+from flask_jwt_extended import create_access_token
+
+
+def test_best_available_holds_centred_block_and_skips_taken_seats(client, app):
+    with app.app_context():
+        user = User(email='finder@example.com', password_hash='x', first_name='Fin', last_name='Der')
+        venue = Venue(name='Finder Hall', address='1 Rd', city='City', country='Country', capacity=14)
+        db.session.add_all([user, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=14, rows=2, seats_per_row=7)
+        db.session.add(section)
+        db.session.commit()
+
+        taken = {(1, 3), (1, 5)}
+        for row in (1, 2):
+            for number in range(1, 8):
+                status = Seat.Status.SOLD if (row, number) in taken else Seat.Status.AVAILABLE
+                db.session.add(Seat(section_id=section.id, row=row, seat_number=number, status=status, price=30.0))
+        db.session.commit()
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        body = {'venue_id': venue.id, 'quantity': 3, 'max_price': 30.0}
+
+        # Row 1 has no run of three, so the middle of row 2 wins
+        resp = client.post('/api/seats/best-available', json=body, headers=headers)
+        assert resp.status_code == 200
+        block = resp.get_json()['block']
+        assert (block['row'], block['seat_numbers']) == (2, [3, 4, 5])
+
+        # The index picks up the hold through the seat map delta, leaving no run of three
+        resp = client.post('/api/seats/best-available', json=body, headers=headers)
+        assert resp.status_code == 409
+
+        # Pairs are still available, front row first
+        resp = client.post('/api/seats/best-available', json=dict(body, quantity=2), headers=headers)
+        block = resp.get_json()['block']
+        assert block['row'] == 1 and block['seat_numbers'] in ([1, 2], [6, 7])
+
+        resp = client.post('/api/seats/best-available', json=dict(body, quantity=1, max_price=10.0), headers=headers)
+        assert resp.status_code == 409
+
+
+def test_best_available_in_virtual_section(client, app):
+    with app.app_context():
+        user = User(email='virtual-finder@example.com', password_hash='x', first_name='Vir', last_name='Finder')
+        venue = Venue(name='Virtual Finder Hall', address='1 Rd', city='City', country='Country', capacity=10)
+        db.session.add_all([user, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=10, rows=2, seats_per_row=5, is_virtual=True)
+        db.session.add(section)
+        db.session.commit()
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        resp = client.post('/api/seats/best-available', json={'venue_id': venue.id, 'quantity': 3}, headers=headers)
+        assert resp.status_code == 200
+        block = resp.get_json()['block']
+        assert (block['row'], block['seat_numbers']) == (1, [2, 3, 4])
+
+        held = Seat.query.filter_by(section_id=section.id).order_by(Seat.seat_number).all()
+        assert [s.id for s in held] == block['seat_ids']
+        assert {s.status for s in held} == {Seat.Status.RESERVED}
+
+        resp = client.post('/api/seats/best-available', json={'venue_id': venue.id, 'quantity': 3}, headers=headers)
+        assert resp.get_json()['block']['row'] == 2
+
+
+def test_index_updates_are_new_snapshots_judged_like_a_build(app):
+    with app.app_context():
+        venue = Venue(name='Snapshot Hall', address='1 Rd', city='City', country='Country', capacity=4)
+        db.session.add(venue)
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=4, rows=1, seats_per_row=4)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=1, seat_number=n, status=Seat.Status.AVAILABLE, price=20.0) for n in range(1, 5)]
+        db.session.add_all(seats)
+        db.session.commit()
+
+        before = get_index(venue.id)
+        assert before.find(4)[0]['seat_numbers'] == [1, 2, 3, 4]
+
+        # One hold that is live and one that has already lapsed
+        seats[0].status = seats[1].status = Seat.Status.RESERVED
+        seats[0].reserved_until = datetime.utcnow() + timedelta(minutes=10)
+        seats[1].reserved_until = datetime.utcnow() - timedelta(minutes=1)
+        record_seat_changes([seats[0].id, seats[1].id])
+        db.session.commit()
+
+        after = get_index(venue.id)
+        assert after is not before and after.version > before.version
+        assert after.find(3)[0]['seat_numbers'] == [2, 3, 4]
+        assert before.find(4)[0]['seat_numbers'] == [1, 2, 3, 4]
+
+
+def test_index_is_rebuilt_when_seats_are_generated(app):
+    with app.app_context():
+        venue = Venue(name='Growing Hall', address='1 Rd', city='City', country='Country', capacity=8)
+        db.session.add(venue)
+        db.session.commit()
+        lower = VenueSection(venue_id=venue.id, name='Lower', capacity=4, rows=1, seats_per_row=4)
+        db.session.add(lower)
+        db.session.commit()
+        generate_section_seats(lower)
+        bump_version(venue.id, layout=True)
+        db.session.commit()
+        assert {b['section_id'] for b in get_index(venue.id).find(2, limit=10)} == {lower.id}
+
+        # A section added later brings no seat deltas, only a new layout version
+        upper = VenueSection(venue_id=venue.id, name='Upper', capacity=4, rows=1, seats_per_row=4)
+        db.session.add(upper)
+        db.session.commit()
+        generate_section_seats(upper)
+        bump_version(venue.id, layout=True)
+        db.session.commit()
+        assert get_index(venue.id).find(4, section_ids=[upper.id])[0]['section_id'] == upper.id
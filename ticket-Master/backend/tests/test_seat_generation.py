@@ -0,0 +1,90 @@
+from app.models import db, User, Event, Seat, EventSeatInventory, BackgroundJob
+from flask_jwt_extended import create_access_token
+
+
+def full_event_payload(title, rows, seats_per_row, **extra):
+    payload = {
+        'event': {'title': title, 'start_date': '2026-12-01T19:00:00Z', 'end_date': '2026-12-01T23:00:00Z'},
+        'venue': {'name': f'{title} Arena', 'city': 'City', 'country': 'Country'},
+        'sections': [
+            {'name': 'Lower', 'ticket_type': 'vip', 'rows': rows, 'seats_per_row': seats_per_row},
+            {'name': 'Upper', 'ticket_type': 'regular', 'rows': rows, 'seats_per_row': seats_per_row},
+        ],
+        'ticket_types': [
+            {'name': 'VIP', 'type': 'vip', 'price': 120},
+            {'name': 'Regular', 'type': 'regular', 'price': 60},
+        ],
+    }
+    payload.update(extra)
+    return payload
+
+
+def admin_headers():
+    admin = User(email='bulk-admin@example.com', password_hash='x', first_name='Bulk', last_name='Admin', role=User.Role.ADMIN)
+    db.session.add(admin)
+    db.session.commit()
+    token = create_access_token(identity=admin.id, additional_claims={'role': admin.role})
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_create_full_event_generates_seats(client, app):
+    with app.app_context():
+        headers = admin_headers()
+
+        resp = client.post('/api/admin/events/create-full', json=full_event_payload('Sync', 3, 4), headers=headers)
+        assert resp.status_code == 201
+        event_id = resp.get_json()['event']['id']
+        event = db.session.get(Event, event_id)
+        assert event.status == Event.Status.PUBLISHED
+        section_ids = [inv.section_id for inv in EventSeatInventory.query.filter_by(event_id=event_id)]
+        assert len(section_ids) == 2
+        assert Seat.query.filter(Seat.section_id.in_(section_ids)).count() == 24
+
+        # Large layouts run as a job; the event is published once seats exist
+        resp = client.post('/api/admin/events/create-full', json=full_event_payload('Async', 50, 30, **{'async': True}), headers=headers)
+        assert resp.status_code == 202
+        job = resp.get_json()['job']
+        assert (job['status'], job['progress_done'], job['progress_total']) == ('succeeded', 3000, 3000)
+        assert job['result']['seats_created'] == 3000
+
+        resp = client.get(f"/api/admin/jobs/{job['id']}", headers=headers)
+        assert resp.get_json()['job']['status'] == 'succeeded'
+
+        event = db.session.get(Event, job['result']['event_id'])
+        db.session.refresh(event)
+        assert event.status == Event.Status.PUBLISHED
+        rows = db.session.execute(
+            db.select(Seat.section_id, db.func.count(), db.func.max(Seat.row), db.func.max(Seat.seat_number))
+            .where(Seat.section_id.in_([inv.section_id for inv in EventSeatInventory.query.filter_by(event_id=event.id)]))
+            .group_by(Seat.section_id)
+        ).all()
+        assert sorted(r[1:] for r in rows) == [(1500, 50, 30), (1500, 50, 30)]
+
+
+def test_rerun_failed_seat_generation_job(client, app):
+    with app.app_context():
+        admin = User(email='rerun-admin@example.com', password_hash='x', first_name='Rerun', last_name='Admin', role=User.Role.ADMIN)
+        db.session.add(admin)
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=admin.id, additional_claims={'role': admin.role})}"}
+
+        resp = client.post('/api/admin/events/create-full', json=full_event_payload('Rerun', 40, 30, **{'async': True}), headers=headers)
+        job = resp.get_json()['job']
+        event_id = job['result']['event_id']
+        section_ids = [inv.section_id for inv in EventSeatInventory.query.filter_by(event_id=event_id)]
+
+        # A run that died part-way: the last rows of one section were never written
+        db.session.execute(db.delete(Seat).where(Seat.section_id == section_ids[0], Seat.row > 25))
+        db.session.execute(db.update(BackgroundJob).where(BackgroundJob.id == job['id']).values(status=BackgroundJob.Status.FAILED))
+        db.session.commit()
+
+        resp = client.post(f"/api/admin/jobs/{job['id']}/rerun", headers=headers)
+        assert resp.status_code == 202
+        rerun = resp.get_json()['job']
+        assert (rerun['status'], rerun['progress_done']) == ('succeeded', 2400)
+        assert rerun['result']['seats_created'] == 450
+        assert Seat.query.filter(Seat.section_id.in_(section_ids)).count() == 2400
+
+        # Only failed jobs can be rerun
+        resp = client.post(f"/api/admin/jobs/{job['id']}/rerun", headers=headers)
+        assert resp.status_code == 409
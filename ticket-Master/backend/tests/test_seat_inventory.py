@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, Venue, VenueSection, Seat
+from app.utils.seat_inventory import create_event_inventory, load_section, flip_seats, diff_states
+from flask_jwt_extended import create_access_token
+
+
+def create_event(venue, organizer, title):
+    event = Event(
+        title=title, description='x', location='City', organizer_id=organizer.id, venue_id=venue.id,
+        start_date=datetime.utcnow() + timedelta(days=7), end_date=datetime.utcnow() + timedelta(days=8)
+    )
+    db.session.add(event)
+    db.session.commit()
+    return event
+
+
+def test_events_at_same_venue_have_separate_inventory(app):
+    with app.app_context():
+        organizer = User(email='inventory@example.com', password_hash='x', first_name='In', last_name='Ventory')
+        venue = Venue(name='Arena', address='1 Rd', city='City', country='Country', capacity=6)
+        db.session.add_all([organizer, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=6, rows=2, seats_per_row=3)
+        db.session.add(section)
+        db.session.commit()
+
+        first = create_event(venue, organizer, 'First Night')
+        second = create_event(venue, organizer, 'Second Night')
+        assert create_event_inventory(first.id, [section]) == 1
+        assert create_event_inventory(second.id, [section]) == 1
+        # Creating again is a no-op
+        assert create_event_inventory(first.id, [section]) == 0
+        db.session.commit()
+
+        before = bytes(load_section(first.id, section.id).statuses)
+        flipped, conflicts = flip_seats(first.id, section.id, {(2, 3): Seat.Status.SOLD})
+        db.session.commit()
+        assert conflicts == []
+        assert flipped.version == 1
+
+        assert load_section(first.id, section.id).get(2, 3) == Seat.Status.SOLD
+        assert load_section(second.id, section.id).get(2, 3) == Seat.Status.AVAILABLE
+        assert diff_states(before, flipped.statuses, section.seats_per_row) == [
+            {'row': 2, 'seat_number': 3, 'from': Seat.Status.AVAILABLE, 'to': Seat.Status.SOLD}
+        ]
+
+        # Conditional flips leave seats in other states alone
+        _, conflicts = flip_seats(
+            first.id, section.id, {(2, 3): Seat.Status.RESERVED}, allowed_from={Seat.Status.AVAILABLE}
+        )
+        db.session.commit()
+        assert conflicts == [(2, 3)]
+        assert load_section(first.id, section.id).get(2, 3) == Seat.Status.SOLD
+
+
+def test_event_mirror_checks_venue_and_follows_expiry_and_release(client, app):
+    with app.app_context():
+        organizer = User(email='mirror@example.com', password_hash='x', first_name='Mir', last_name='Ror')
+        venue = Venue(name='Mirror Hall', address='1 Rd', city='City', country='Country', capacity=2)
+        elsewhere = Venue(name='Other Hall', address='2 Rd', city='City', country='Country', capacity=1)
+        db.session.add_all([organizer, venue, elsewhere])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=2, rows=1, seats_per_row=2)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=1, seat_number=n, status=Seat.Status.AVAILABLE) for n in (1, 2)]
+        db.session.add_all(seats)
+        event = create_event(venue, organizer, 'Mirror Night')
+        other = create_event(elsewhere, organizer, 'Elsewhere Night')
+        create_event_inventory(event.id, [section])
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=organizer.id)}'}
+        seat_ids = [s.id for s in seats]
+
+        # An event at another venue is refused
+        resp = client.post('/api/seats/reserve', json={'seat_ids': seat_ids, 'event_id': other.id}, headers=headers)
+        assert resp.status_code == 400
+        assert db.session.get(Seat, seat_ids[0]).status == Seat.Status.AVAILABLE
+
+        resp = client.post('/api/seats/reserve', json={'seat_ids': seat_ids, 'event_id': event.id}, headers=headers)
+        assert resp.status_code == 200
+        assert load_section(event.id, section.id).counts()[Seat.Status.RESERVED] == 2
+
+        # A release that does not name the event still reaches its mirror
+        assert client.post('/api/seats/release', json={'seat_ids': seat_ids[:1]}, headers=headers).status_code == 200
+        assert load_section(event.id, section.id).get(1, 1) == Seat.Status.AVAILABLE
+
+        # So does a hold that lapses, before the inventory is served
+        lapsed = datetime.utcnow() - timedelta(seconds=1)
+        db.session.execute(db.update(Seat).where(Seat.id == seat_ids[1]).values(reserved_until=lapsed))
+        db.session.commit()
+        resp = client.get(f'/api/seats/event/{event.id}/inventory')
+        assert resp.get_json()['sections'][0]['counts'][Seat.Status.AVAILABLE] == 2
+        assert client.get('/api/seats/event/no-such-event/inventory').status_code == 404
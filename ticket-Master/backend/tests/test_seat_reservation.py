@@ -67,3 +67,34 @@ def test_reserve_and_expire_release(client, app):
         # Verify seat released
         s2 = db.session.get(Seat, seat.id)
         assert s2.status == Seat.Status.AVAILABLE
+
+
+def test_atomic_reserve_is_all_or_nothing(client, app):
+    with app.app_context():
+        buyer = create_user(app, email='atomic-a@example.com')
+        rival = create_user(app, email='atomic-b@example.com')
+        venue, section, seat = create_venue_and_seat(app)
+        other = Seat(section_id=section.id, row=1, seat_number=2, status=Seat.Status.AVAILABLE, price=50.0)
+        db.session.add(other)
+        db.session.commit()
+        seat_id, other_id = seat.id, other.id
+
+        rival_headers = {'Authorization': f'Bearer {create_access_token(identity=rival.id)}'}
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [other_id], 'atomic': True}, headers=rival_headers)
+        assert resp.status_code == 200
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=buyer.id)}'}
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [seat_id, other_id], 'atomic': True}, headers=headers)
+        assert resp.status_code == 409
+        assert [c['seat_id'] for c in resp.get_json()['conflicts']] == [other_id]
+
+        # The seat that was free must not have been left half-held
+        db.session.expire_all()
+        assert db.session.get(Seat, seat_id).status == Seat.Status.AVAILABLE
+
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [seat_id], 'atomic': True}, headers=headers)
+        assert resp.status_code == 200
+        db.session.expire_all()
+        held = db.session.get(Seat, seat_id)
+        assert held.status == Seat.Status.RESERVED
+        assert held.reserved_by == buyer.id
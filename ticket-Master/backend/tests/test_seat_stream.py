@@ -0,0 +1,94 @@
+import json
+import pytest
+from app.models import db, User, Venue, VenueSection, Seat
+from app.utils.seat_stream import RedisBackplane, hub, channel_for
+from flask_jwt_extended import create_access_token
+
+
+def test_stream_delivers_committed_changes(client, app, monkeypatch):
+    with app.app_context():
+        user = User(email='stream@example.com', password_hash='x', first_name='Str', last_name='Eam')
+        venue = Venue(name='Stream Hall', address='1 Rd', city='City', country='Country', capacity=2)
+        db.session.add_all([user, venue])
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=2, rows=1, seats_per_row=2)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=1, seat_number=n, status=Seat.Status.AVAILABLE) for n in (1, 2)]
+        db.session.add_all(seats)
+        db.session.commit()
+        venue_id, seat_ids = venue.id, [s.id for s in seats]
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+    monkeypatch.setattr(hub, 'max_stream_seconds', 1)
+    resp = client.get(f'/api/seats/venue/{venue_id}/stream', buffered=False)
+    assert resp.mimetype == 'text/event-stream'
+    frames = (chunk.decode() for chunk in resp.response)
+    assert next(frames).startswith('retry:')
+
+    # Two commits inside one tick arrive as a single coalesced event
+    client.post('/api/seats/reserve', json={'seat_ids': [seat_ids[0]], 'atomic': True}, headers=headers)
+    client.post('/api/seats/reserve', json={'seat_ids': [seat_ids[1]], 'atomic': True}, headers=headers)
+    frame = next(frames)
+    resp.close()
+    assert frame.startswith('event: seats\nid: 2\n')
+    data = json.loads(frame.split('data: ', 1)[1])
+    assert sorted(c['seat_id'] for c in data['changes']) == sorted(seat_ids)
+    assert {c['status'] for c in data['changes']} == {Seat.Status.RESERVED}
+
+
+def test_rolled_back_changes_are_not_published(app):
+    with app.app_context():
+        venue = Venue(name='Rollback Hall', address='1 Rd', city='City', country='Country', capacity=1)
+        db.session.add(venue)
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=1, rows=1, seats_per_row=1)
+        db.session.add(section)
+        db.session.commit()
+        seat = Seat(section_id=section.id, row=1, seat_number=1, status=Seat.Status.AVAILABLE)
+        db.session.add(seat)
+        db.session.commit()
+
+        from app.utils.seat_changes import record_seat_changes
+        subscription = hub.backplane.subscribe(channel_for(venue.id))
+        try:
+            seat.status = Seat.Status.SOLD
+            db.session.flush()
+            record_seat_changes([seat.id])
+            db.session.rollback()
+            assert subscription.get(0.05, 0) == ([], False)
+        finally:
+            subscription.close()
+
+
+def test_redis_backplane_fans_out_across_workers(app, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    # This process publishes; the subscriber stands for another worker
+    monkeypatch.setattr(hub, 'backplane', RedisBackplane(client=fakeredis.FakeRedis(server=server)))
+    other_worker = RedisBackplane(client=fakeredis.FakeRedis(server=server))
+    with app.app_context():
+        venue = Venue(name='Fan-out Hall', address='1 Rd', city='City', country='Country', capacity=2)
+        db.session.add(venue)
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Floor', capacity=2, rows=1, seats_per_row=2)
+        db.session.add(section)
+        db.session.commit()
+        seats = [Seat(section_id=section.id, row=1, seat_number=n, status=Seat.Status.AVAILABLE) for n in (1, 2)]
+        db.session.add_all(seats)
+        db.session.commit()
+
+        from app.utils.seat_changes import record_seat_changes
+        subscription = other_worker.subscribe(channel_for(venue.id))
+        try:
+            for seat in seats:
+                seat.status = Seat.Status.SOLD
+            record_seat_changes([s.id for s in seats])
+            db.session.commit()
+
+            messages, overflowed = subscription.get(1, 0.05)
+            assert not overflowed and len(messages) == 1
+            assert messages[0]['venue_id'] == venue.id
+            assert {(c['seat_number'], c['status']) for c in messages[0]['changes']} == {(1, 'sold'), (2, 'sold')}
+        finally:
+            subscription.close()
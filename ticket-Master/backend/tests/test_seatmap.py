@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Venue, VenueSection, Seat
+from app.utils.seat_changes import current_version, record_seat_changes
+from app.utils.seatmap import run_length_decode
+from flask_jwt_extended import create_access_token
+
+
+def create_section(name, rows=2, seats_per_row=3):
+    venue = Venue(name=name, address='1 Rd', city='City', country='Country', capacity=rows * seats_per_row)
+    db.session.add(venue)
+    db.session.commit()
+    section = VenueSection(venue_id=venue.id, name='Floor', capacity=rows * seats_per_row, rows=rows, seats_per_row=seats_per_row)
+    db.session.add(section)
+    db.session.commit()
+    return venue, section
+
+
+def test_compact_seatmap_round_trips(client, app):
+    with app.app_context():
+        venue, section = create_section('Compact Hall')
+        expired = datetime.utcnow() - timedelta(minutes=1)
+        db.session.add_all([
+            Seat(section_id=section.id, row=1, seat_number=1, status=Seat.Status.AVAILABLE, price=80.0),
+            Seat(section_id=section.id, row=1, seat_number=2, status=Seat.Status.SOLD, price=80.0),
+            Seat(section_id=section.id, row=1, seat_number=3, status=Seat.Status.RESERVED, price=80.0, reserved_until=expired),
+            Seat(section_id=section.id, row=2, seat_number=1, status=Seat.Status.AVAILABLE, price=40.0),
+            Seat(section_id=section.id, row=2, seat_number=2, status=Seat.Status.AVAILABLE, price=40.0),
+        ])
+        db.session.commit()
+
+        resp = client.get(f'/api/seats/venue/{venue.id}/seatmap?format=compact')
+        assert resp.status_code == 200
+        data = resp.get_json()
+        codes = data['status_codes']
+        sec = data['sections'][0]
+        assert (sec['rows'], sec['seats_per_row']) == (2, 3)
+
+        statuses = run_length_decode(sec['status_runs'])
+        assert statuses == [
+            codes['available'], codes['sold'], codes['available'],
+            codes['available'], codes['available'], codes['none'],
+        ]
+        prices = [sec['price_palette'][i] for i in run_length_decode(sec['price_runs'])]
+        assert prices == [80.0, 80.0, 80.0, 40.0, 40.0, None]
+
+
+def test_reserve_by_seat_address(client, app):
+    with app.app_context():
+        user = User(email='address@example.com', password_hash='x', first_name='Ad', last_name='Dress')
+        db.session.add(user)
+        venue, section = create_section('Address Hall')
+        seat = Seat(section_id=section.id, row=2, seat_number=3, status=Seat.Status.AVAILABLE)
+        db.session.add(seat)
+        db.session.commit()
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [f'{section.id}:2:3'], 'atomic': True}, headers=headers)
+        assert resp.status_code == 200
+        assert resp.get_json()['reserved'] == [seat.id]
+
+
+def test_seatmap_delta_and_etag(client, app):
+    with app.app_context():
+        user = User(email='delta@example.com', password_hash='x', first_name='Del', last_name='Ta')
+        db.session.add(user)
+        venue, section = create_section('Delta Hall')
+        seat = Seat(section_id=section.id, row=1, seat_number=1, status=Seat.Status.AVAILABLE)
+        db.session.add(seat)
+        db.session.commit()
+        url = f'/api/seats/venue/{venue.id}/seatmap'
+
+        first = client.get(url)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        client.post('/api/seats/reserve', json={'seat_ids': [seat.id], 'atomic': True}, headers=headers)
+
+        # The map changed, so the old ETag no longer matches
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+        delta = client.get(f'{url}?since={first.get_json()["version"]}').get_json()
+        assert delta['refetch'] is False
+        assert [(c['seat_id'], c['status']) for c in delta['changes']] == [(seat.id, Seat.Status.RESERVED)]
+
+        app.config['SEAT_CHANGE_RING_VERSIONS'] = 0
+        try:
+            assert client.get(f'{url}?since=0').get_json()['refetch'] is True
+        finally:
+            app.config['SEAT_CHANGE_RING_VERSIONS'] = 1000
+
+
+def test_versions_move_at_commit_and_on_hold_expiry(client, app):
+    with app.app_context():
+        venue, section = create_section('Expiry Hall')
+        seat = Seat(section_id=section.id, row=1, seat_number=1, status=Seat.Status.AVAILABLE)
+        db.session.add(seat)
+        db.session.commit()
+        url = f'/api/seats/venue/{venue.id}/seatmap'
+
+        # The version row is only touched as the transaction commits
+        seat.status = Seat.Status.RESERVED
+        seat.reserved_until = datetime.utcnow() + timedelta(seconds=1)
+        record_seat_changes([seat.id])
+        assert current_version(venue.id) == 0
+        db.session.commit()
+        assert current_version(venue.id) == 1
+
+        held = client.get(url)
+        assert held.get_json()['version'] == 1
+
+        # Nobody released the lapsed hold, yet the old ETag must not match
+        seat.reserved_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        resp = client.get(url, headers={'If-None-Match': held.headers['ETag']})
+        assert resp.status_code == 200 and resp.get_json()['version'] == 2
+        db.session.refresh(seat)
+        assert seat.status == Seat.Status.AVAILABLE
+
+
+def test_virtual_section_materializes_touched_seats(client, app):
+    with app.app_context():
+        user = User(email='virtual@example.com', password_hash='x', first_name='Vir', last_name='Tual')
+        db.session.add(user)
+        venue, section = create_section('Virtual Hall', rows=2, seats_per_row=3)
+        section.is_virtual = True
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        data = client.get(f'/api/seats/venue/{venue.id}/seatmap').get_json()
+        seats = data['sections'][0]['seats']
+        assert len(seats) == 6 and all(s['virtual'] and s['status'] == 'available' for s in seats)
+        assert Seat.query.filter_by(section_id=section.id).count() == 0
+
+        address = f'{section.id}:2:3'
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [address], 'atomic': True}, headers=headers)
+        assert resp.status_code == 200
+        seat = Seat.query.filter_by(section_id=section.id).one()
+        assert (seat.row, seat.seat_number, seat.status) == (2, 3, Seat.Status.RESERVED)
+        assert resp.get_json()['reserved'] == [seat.id]
+
+        # Reserving the same address again resolves to the stored row
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [address], 'atomic': True}, headers=headers)
+        assert resp.status_code == 200
+        assert Seat.query.filter_by(section_id=section.id).count() == 1
+
+        # Positions outside the grid are not created
+        resp = client.post('/api/seats/reserve', json={'seat_ids': [f'{section.id}:3:1'], 'atomic': True}, headers=headers)
+        assert resp.status_code in (404, 409)
+        assert Seat.query.filter_by(section_id=section.id).count() == 1
+
+        data = client.get(f'/api/seats/venue/{venue.id}/seatmap?format=compact').get_json()
+        codes = data['status_codes']
+        statuses = run_length_decode(data['sections'][0]['status_runs'])
+        assert statuses == [codes['available']] * 5 + [codes['reserved']]
+
+        # Releasing a position that was never taken creates no row
+        resp = client.post('/api/seats/release', json={'seat_ids': [f'{section.id}:1:1']}, headers=headers)
+        assert resp.status_code == 200
+        assert Seat.query.filter_by(section_id=section.id).count() == 1
+
+        # Released back to the default, the row goes and the change is still logged
+        version = data['version']
+        resp = client.post('/api/seats/release', json={'seat_ids': [address]}, headers=headers)
+        assert resp.status_code == 200
+        assert Seat.query.filter_by(section_id=section.id).count() == 0
+        delta = client.get(f'/api/seats/venue/{venue.id}/seatmap?since={version}').get_json()
+        assert [(c['row'], c['seat_number'], c['status']) for c in delta['changes']] == [(2, 3, 'available')]
+        data = client.get(f'/api/seats/venue/{venue.id}/seatmap?format=compact').get_json()
+        assert run_length_decode(data['sections'][0]['status_runs']) == [codes['available']] * 6
+
+
+def test_compact_seatmap_carries_virtual_seat_price_overrides(client, app):
+    with app.app_context():
+        venue, section = create_section('Virtual Price Hall', rows=1, seats_per_row=3)
+        section.is_virtual = True
+        db.session.add(Seat(section_id=section.id, row=1, seat_number=2, status=Seat.Status.AVAILABLE, price=55.0))
+        db.session.commit()
+
+        sec = client.get(f'/api/seats/venue/{venue.id}/seatmap?format=compact').get_json()['sections'][0]
+        prices = [sec['price_palette'][i] for i in run_length_decode(sec['price_runs'])]
+        assert prices == [None, 55.0, None]
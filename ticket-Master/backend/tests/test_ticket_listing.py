@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event as sa_event
+from app.models import db, User, Event, TicketType, Ticket, Payment, Venue, VenueSection, Seat
+from flask_jwt_extended import create_access_token
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        sa_event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        sa_event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def test_listing_tickets_takes_constant_queries(client, app):
+    with app.app_context():
+        user = User(email='listing@example.com', password_hash='x', first_name='L', last_name='U')
+        db.session.add(user)
+        db.session.commit()
+        start = datetime.utcnow() + timedelta(days=3)
+        venue = Venue(name='Listing Hall', address='1 St', city='City', country='Country', capacity=100)
+        db.session.add(venue)
+        db.session.commit()
+        section = VenueSection(venue_id=venue.id, name='Stalls', capacity=100, rows=5, seats_per_row=20)
+        db.session.add(section)
+        db.session.commit()
+        events = []
+        for i in range(5):
+            events.append(Event(title=f'Listing {i}', description='x', category='music', location='City',
+                                start_date=start, end_date=start + timedelta(hours=2), organizer_id=user.id))
+        db.session.add_all(events)
+        db.session.commit()
+        ticket_types = [TicketType(event_id=e.id, name='GA', type=TicketType.Type.REGULAR, price=10.0, quantity=100, sold=0)
+                        for e in events]
+        seats = [Seat(section_id=section.id, row=1 + i // 20, seat_number=1 + i % 20, status=Seat.Status.SOLD, price=10.0)
+                 for i in range(25)]
+        payment = Payment(user_id=user.id, amount=500.0, method=Payment.Method.CARD, transaction_id='TXN-LISTING-1')
+        db.session.add_all(ticket_types + seats + [payment])
+        db.session.commit()
+        db.session.add_all([
+            Ticket(event_id=events[i % 5].id, ticket_type_id=ticket_types[i % 5].id, attendee_id=user.id,
+                   seat_id=seats[i].id if i < 25 else None, payment_id=payment.id,
+                   ticket_number=f'TKT-LISTING-{i:03d}', price=10.0, status=Ticket.Status.CONFIRMED)
+            for i in range(50)
+        ])
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+        payment_id = payment.id
+        db.session.expunge_all()
+
+        with QueryCounter(db.engine) as counter:
+            resp = client.get('/api/tickets?limit=50', headers=headers)
+        assert resp.status_code == 200
+        tickets = resp.get_json()['tickets']
+        assert len(tickets) == 50 and resp.get_json()['pagination']['total'] == 50
+        assert counter.count <= 3
+        seated = next(t for t in tickets if t['ticket_number'] == 'TKT-LISTING-000')
+        assert seated['event_title'] == 'Listing 0' and seated['ticket_type_name'] == 'GA'
+        assert seated['seat_details'] == {'section': 'Stalls', 'row': 1, 'seat_number': 1}
+        assert next(t for t in tickets if t['ticket_number'] == 'TKT-LISTING-049')['seat_details'] is None
+
+        db.session.expunge_all()
+        with QueryCounter(db.engine) as counter:
+            resp = client.get(f'/api/payments/{payment_id}/status', headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.get_json()['tickets']) == 50
+        assert counter.count <= 3
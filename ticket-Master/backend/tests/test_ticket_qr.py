@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket
+from flask_jwt_extended import create_access_token
+
+
+def test_ticket_stores_payload_and_serves_cached_qr_image(client, app):
+    with app.app_context():
+        user = User(email='qr@example.com', password_hash='x', first_name='Q', last_name='R')
+        db.session.add(user)
+        db.session.commit()
+        start = datetime.utcnow() + timedelta(days=7)
+        event = Event(title='QR Night', description='QR', category='music', location='City',
+                      start_date=start, end_date=start + timedelta(hours=3), organizer_id=user.id)
+        db.session.add(event)
+        db.session.commit()
+        ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=15.0, quantity=5, sold=0)
+        db.session.add(ticket_type)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+        resp = client.post('/api/tickets', json={'ticket_type_id': ticket_type.id, 'quantity': 1}, headers=headers)
+        ticket = resp.get_json()['tickets'][0]
+        assert ticket['qr_code'] == f"TICKET:{ticket['ticket_number']}|EVENT:{event.id}"
+        assert db.session.get(Ticket, ticket['id']).qr_code == ticket['qr_code']
+
+        resp = client.get(ticket['qr_url'])
+        assert resp.status_code == 200
+        assert resp.mimetype == 'image/png' and resp.data.startswith(b'\x89PNG')
+        assert 'immutable' in resp.headers['Cache-Control']
+        etag = resp.headers['ETag']
+        assert not etag.startswith('W/')
+
+        resp = client.get(ticket['qr_url'], headers={'If-None-Match': etag})
+        assert resp.status_code == 304
+
+        # The URL must name the ticket's own payload hash and carry its signature
+        assert client.get(f"/api/tickets/{ticket['id']}/qr/{'0' * 32}.png").status_code == 404
+        path, sig = ticket['qr_url'].split('?sig=')
+        assert client.get(path).status_code == 404
+        assert client.get(f"{path}?sig={'0' * 32}").status_code == 404
+
+        # A cached image is only served under its own ticket's URL
+        other = client.post('/api/tickets', json={'ticket_type_id': ticket_type.id, 'quantity': 1}, headers=headers)
+        other_id = other.get_json()['tickets'][0]['id']
+        assert client.get(f"/api/tickets/{other_id}/qr/{path.rsplit('/', 1)[1]}?sig={sig}").status_code == 404
@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta
+import pytest
+from app.models import db, User, Event, TicketType, Ticket, TicketScan
+from app.utils.qr import ticket_payload
+from app.utils.ticket_scans import apply_pending_scans, parse_scan_time
+from app.utils.ticket_tokens import (
+    InvalidTicketToken, issue_ticket_token, resign_legacy_tickets, sign_ticket_token, verify_ticket_token,
+)
+from flask_jwt_extended import create_access_token
+
+
+def make_event(email):
+    organizer = User(email=email, password_hash='x', first_name='Gate', last_name='Staff', role=User.Role.ORGANIZER)
+    db.session.add(organizer)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(hours=2)
+    event = Event(title='Gate Night', description='Gate', category='music', location='City',
+                  start_date=start, end_date=start + timedelta(hours=3), organizer_id=organizer.id)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='VIP', type=TicketType.Type.VIP, price=50.0, quantity=10, sold=0)
+    db.session.add(ticket_type)
+    db.session.commit()
+    return organizer, event, ticket_type
+
+
+def make_ticket(event, ticket_type, attendee, number, status=Ticket.Status.CONFIRMED):
+    ticket = Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=attendee.id,
+                    ticket_number=number, price=50.0, status=status)
+    if status == Ticket.Status.CONFIRMED:
+        issue_ticket_token(ticket)
+    else:
+        ticket.qr_code = ticket_payload(number, event.id)
+    db.session.add(ticket)
+    db.session.commit()
+    return ticket
+
+
+def test_ticket_tokens_verify_offline(app):
+    with app.app_context():
+        token = sign_ticket_token('TKT-1', 'event-1', 'vip', 'A:3:7', 1000, 2000)
+        claims = verify_ticket_token(token, datetime.utcfromtimestamp(1500))
+        assert claims == {'ticket_number': 'TKT-1', 'event_id': 'event-1', 'tier': 'vip', 'seat': 'A:3:7',
+                          'not_before': 1000, 'not_after': 2000}
+
+        with pytest.raises(InvalidTicketToken) as e:
+            verify_ticket_token(token, datetime.utcfromtimestamp(2500))
+        assert e.value.reason == 'expired'
+
+        prefix, body, mac = token.split('.')
+        forged = sign_ticket_token('TKT-2', 'event-1', 'vip', 'A:3:7', 1000, 2000).split('.')[1]
+        with pytest.raises(InvalidTicketToken) as e:
+            verify_ticket_token(f'{prefix}.{forged}.{mac}', datetime.utcfromtimestamp(1500))
+        assert e.value.reason == 'bad_signature'
+
+        # Tokens signed with a retired key keep working while it is listed
+        app.config['TICKET_SIGNING_PREVIOUS_KEYS'] = [app.config['TICKET_SIGNING_KEY']]
+        app.config['TICKET_SIGNING_KEY'] = 'rotated-key'
+        try:
+            assert verify_ticket_token(token, datetime.utcfromtimestamp(1500))['ticket_number'] == 'TKT-1'
+        finally:
+            app.config['TICKET_SIGNING_KEY'] = app.config['TICKET_SIGNING_PREVIOUS_KEYS'][0]
+            app.config['TICKET_SIGNING_PREVIOUS_KEYS'] = []
+
+
+def test_scans_are_logged_and_applied_in_order(client, app):
+    with app.app_context():
+        organizer, event, ticket_type = make_event('gate@example.com')
+        ticket = make_ticket(event, ticket_type, organizer, 'TKT-GATE-1')
+        pending = make_ticket(event, ticket_type, organizer, 'TKT-GATE-2', Ticket.Status.PENDING)
+        headers = {'Authorization': f"Bearer {create_access_token(identity=organizer.id, additional_claims={'role': organizer.role})}"}
+
+        first = datetime.utcnow().replace(microsecond=0)
+        resp = client.post('/api/tickets/scan', json={'code': ticket.qr_code, 'device_id': 'gate-a',
+                                                      'scanned_at': first.isoformat()}, headers=headers)
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body['valid'] and not body['duplicate']
+        assert body['ticket']['tier'] == 'vip'
+
+        # The device retries the same upload, then another gate scans the ticket again
+        client.post('/api/tickets/scan', json={'code': ticket.qr_code, 'device_id': 'gate-a',
+                                               'scanned_at': first.isoformat()}, headers=headers)
+        resp = client.post('/api/tickets/scan', json={'code': ticket.qr_code, 'device_id': 'gate-b',
+                                                      'scanned_at': (first + timedelta(seconds=30)).isoformat()}, headers=headers)
+        assert resp.get_json()['duplicate']
+        assert TicketScan.query.filter_by(event_id=event.id).count() == 2
+
+        # Unpaid tickets carry no signed code and are refused
+        resp = client.post('/api/tickets/scan', json={'code': pending.qr_code, 'device_id': 'gate-a'}, headers=headers)
+        assert resp.status_code == 400
+
+        # Scanning does not touch the ticket until the log is applied
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.CONFIRMED
+        counts = apply_pending_scans()
+        db.session.commit()
+        assert counts == {TicketScan.Status.APPLIED: 1, TicketScan.Status.DUPLICATE: 1}
+
+        db.session.expire_all()
+        used = db.session.get(Ticket, ticket.id)
+        assert used.status == Ticket.Status.USED and used.used_at == first
+        duplicate = TicketScan.query.filter_by(status=TicketScan.Status.DUPLICATE).one()
+        assert duplicate.device_id == 'gate-b' and duplicate.ticket_id == ticket.id
+
+
+def test_legacy_codes_only_scan_while_they_are_the_tickets_code(client, app):
+    with app.app_context():
+        organizer, event, ticket_type = make_event('legacy-gate@example.com')
+        signed = make_ticket(event, ticket_type, organizer, 'TKT-LEGACY-1')
+        legacy = make_ticket(event, ticket_type, organizer, 'TKT-LEGACY-2', Ticket.Status.PENDING)
+        legacy.status = Ticket.Status.CONFIRMED
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=organizer.id, additional_claims={'role': organizer.role})}"}
+
+        # Written from the ticket number alone for a ticket that carries a token
+        forged = ticket_payload(signed.ticket_number, event.id)
+        resp = client.post('/api/tickets/scan', json={'code': forged, 'device_id': 'gate-l'}, headers=headers)
+        assert resp.status_code == 400
+        assert resp.get_json()['error'] == 'unknown_ticket'
+
+        resp = client.post('/api/tickets/scan', json={'code': legacy.qr_code, 'device_id': 'gate-l'}, headers=headers)
+        assert resp.get_json()['valid']
+
+        old_code = legacy.qr_code
+        assert resign_legacy_tickets() >= 1
+        db.session.expire_all()
+        assert db.session.get(Ticket, legacy.id).qr_code.startswith('TM1.')
+        resp = client.post('/api/tickets/scan', json={'code': old_code, 'device_id': 'gate-l'}, headers=headers)
+        assert resp.status_code == 400
+
+        resp = client.post('/api/tickets/scan', json={'code': signed.qr_code, 'device_id': 'gate-l',
+                                                      'scanned_at': 'yesterday'}, headers=headers)
+        assert resp.status_code == 400
+
+
+def test_scan_times_are_converted_to_utc():
+    assert parse_scan_time('2026-10-16T20:00:00+03:00') == datetime(2026, 10, 16, 17, 0)
+    assert parse_scan_time('2026-10-16T17:00:00Z') == datetime(2026, 10, 16, 17, 0)
+    assert parse_scan_time('2026-10-16T17:00:00') == datetime(2026, 10, 16, 17, 0)
+    with pytest.raises(ValueError):
+        parse_scan_time('16/10/2026')
+
+
+def test_organizers_only_scan_their_own_events(client, app):
+    with app.app_context():
+        organizer, event, ticket_type = make_event('owner@example.com')
+        ticket = make_ticket(event, ticket_type, organizer, 'TKT-GATE-3')
+        other = User(email='other-gate@example.com', password_hash='x', first_name='O', last_name='G', role=User.Role.ORGANIZER)
+        attendee = User(email='fan@example.com', password_hash='x', first_name='F', last_name='A')
+        db.session.add_all([other, attendee])
+        db.session.commit()
+
+        for user, status in ((other, 403), (attendee, 403)):
+            token = create_access_token(identity=user.id, additional_claims={'role': user.role})
+            resp = client.post('/api/tickets/scan', json={'code': ticket.qr_code, 'device_id': 'gate-c'},
+                               headers={'Authorization': f'Bearer {token}'})
+            assert resp.status_code == status
+        assert TicketScan.query.filter_by(event_id=event.id).count() == 0
+
+
+def test_batch_upload_applies_scans_and_is_idempotent(client, app):
+    with app.app_context():
+        organizer, event, ticket_type = make_event('batch-gate@example.com')
+        tickets = [make_ticket(event, ticket_type, organizer, f'TKT-BATCH-{i}') for i in range(3)]
+        cancelled = make_ticket(event, ticket_type, organizer, 'TKT-BATCH-X', Ticket.Status.CANCELLED)
+        headers = {'Authorization': f"Bearer {create_access_token(identity=organizer.id, additional_claims={'role': organizer.role})}"}
+
+        at = datetime.utcnow().replace(microsecond=0)
+        scans = [
+            {'ticket_number': 'TKT-BATCH-0', 'device_id': 'gate-a', 'scanned_at': (at + timedelta(seconds=5)).isoformat()},
+            {'ticket_number': 'TKT-BATCH-0', 'device_id': 'gate-b', 'scanned_at': at.isoformat()},
+            {'ticket_number': 'TKT-BATCH-1', 'device_id': 'gate-a', 'scanned_at': at.isoformat()},
+            {'ticket_number': 'TKT-BATCH-X', 'device_id': 'gate-a', 'scanned_at': at.isoformat()},
+            {'ticket_number': 'TKT-NOPE', 'device_id': 'gate-a', 'scanned_at': at.isoformat()},
+        ]
+        resp = client.post('/api/tickets/scans/batch', json={'event_id': event.id, 'scans': scans}, headers=headers)
+        assert resp.status_code == 200
+        first = resp.get_json()
+        assert [(r['status'], r['result']) for r in first['results']] == [
+            ('duplicate', 'already_used'),
+            ('applied', None),
+            ('applied', None),
+            ('rejected', 'ticket_cancelled'),
+            ('rejected', 'unknown_ticket'),
+        ]
+
+        db.session.expire_all()
+        assert db.session.get(Ticket, tickets[0].id).used_at == at
+        assert db.session.get(Ticket, tickets[2].id).status == Ticket.Status.CONFIRMED
+        assert db.session.get(Ticket, cancelled.id).status == Ticket.Status.CANCELLED
+
+        # A retried upload reports the same outcomes without logging anything twice
+        resp = client.post('/api/tickets/scans/batch', json={'event_id': event.id, 'scans': scans}, headers=headers)
+        assert resp.get_json()['results'] == first['results']
+        assert TicketScan.query.filter_by(event_id=event.id).count() == len(scans)
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from app.models import db, User, Event, TicketType, Ticket, Payment, PaymentReference, WebhookEvent
+from app.routes import payments as payment_routes
+from app.utils import webhook_inbox
+from app.utils.payment_refs import add_reference
+from app.utils.webhook_inbox import DEFERRED, RETRY, process_pending_webhooks
+
+PAYPAL = PaymentReference.Provider.PAYPAL
+
+
+class FakePayPal:
+    def verify_webhook(self, webhook_data):
+        return True
+
+
+def make_order(tag):
+    user = User(email=f'webhook-{tag}@example.com', password_hash='x', first_name='W', last_name='H')
+    db.session.add(user)
+    db.session.commit()
+    start = datetime.utcnow() + timedelta(days=1)
+    event = Event(title=f'Webhook {tag}', description='x', category='music', location='City',
+                  start_date=start, end_date=start + timedelta(hours=2), organizer_id=user.id, total_attendees=0)
+    db.session.add(event)
+    db.session.commit()
+    ticket_type = TicketType(event_id=event.id, name='GA', type=TicketType.Type.REGULAR, price=25.0, quantity=10, sold=1)
+    payment = Payment(user_id=user.id, amount=25.0, method=Payment.Method.CARD, transaction_id=f'TXN-WEBHOOK-{tag}')
+    db.session.add_all([ticket_type, payment])
+    db.session.commit()
+    ticket = Ticket(event_id=event.id, ticket_type_id=ticket_type.id, attendee_id=user.id, payment_id=payment.id,
+                    ticket_number=f'TKT-WEBHOOK-{tag}', price=25.0, status=Ticket.Status.PENDING)
+    db.session.add(ticket)
+    add_reference(payment.id, PAYPAL, PaymentReference.Type.ORDER, f'WH-ORDER-{tag}')
+    db.session.commit()
+    return payment, ticket
+
+
+def completed(tag):
+    return {'id': f'WH-COMPLETED-{tag}', 'event_type': 'PAYMENT.CAPTURE.COMPLETED',
+            'resource': {'id': f'WH-CAP-{tag}', 'supplementary_data': {'related_ids': {'order_id': f'WH-ORDER-{tag}'}}}}
+
+
+def refunded(tag):
+    return {'id': f'WH-REFUNDED-{tag}', 'event_type': 'PAYMENT.CAPTURE.REFUNDED', 'resource': {'id': f'WH-CAP-{tag}'}}
+
+
+def test_callback_stores_event_once_and_processor_applies_it(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        payment, ticket = make_order('A')
+
+        for expected in ('received', 'duplicate', 'duplicate'):
+            resp = client.post('/api/payments/paypal/callback', json=completed('A'))
+            assert resp.status_code == 200
+            assert resp.get_json()['status'] == expected
+        assert WebhookEvent.query.filter_by(event_id='WH-COMPLETED-A').count() == 1
+        # Nothing is applied until the processor runs
+        db.session.expire_all()
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.PENDING
+
+        counts = process_pending_webhooks(app.config)
+        assert counts[WebhookEvent.Status.PROCESSED] >= 1
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.COMPLETED
+        confirmed = db.session.get(Ticket, ticket.id)
+        assert confirmed.status == Ticket.Status.CONFIRMED
+        assert confirmed.qr_code
+
+        client.post('/api/payments/paypal/callback', json=refunded('A'))
+        process_pending_webhooks(app.config)
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.REFUNDED
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.REFUNDED
+        event = WebhookEvent.query.filter_by(event_id='WH-REFUNDED-A').one()
+        assert (event.status, event.payment_id, event.attempts) == (WebhookEvent.Status.PROCESSED, payment.id, 1)
+
+        # A redelivery after processing is still dropped on insert
+        resp = client.post('/api/payments/paypal/callback', json=refunded('A'))
+        assert resp.get_json()['status'] == 'duplicate'
+
+
+def test_failed_event_is_retried_and_holds_back_later_events_for_its_payment(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        payment, ticket = make_order('B')
+        # As the capture endpoint would have recorded it
+        add_reference(payment.id, PAYPAL, PaymentReference.Type.CAPTURE, 'WH-CAP-B')
+        db.session.commit()
+        other, other_ticket = make_order('C')
+        client.post('/api/payments/paypal/callback', json=completed('B'))
+        client.post('/api/payments/paypal/callback', json=completed('C'))
+
+        real_handler = webhook_inbox.PAYPAL_HANDLERS[webhook_inbox.CAPTURE_COMPLETED]
+
+        def failing(payment, resource):
+            if payment.transaction_id == 'TXN-WEBHOOK-B':
+                raise RuntimeError('database hiccup')
+            return real_handler[2](payment, resource)
+
+        monkeypatch.setitem(webhook_inbox.PAYPAL_HANDLERS, webhook_inbox.CAPTURE_COMPLETED,
+                            real_handler[:2] + (failing,))
+        counts = process_pending_webhooks(app.config)
+        assert counts[RETRY] == 1
+        db.session.expire_all()
+        # The other payment's event went through
+        assert db.session.get(Ticket, other_ticket.id).status == Ticket.Status.CONFIRMED
+        failed = WebhookEvent.query.filter_by(event_id='WH-COMPLETED-B').one()
+        assert failed.status == WebhookEvent.Status.PENDING
+        assert failed.attempts == 1
+        assert 'hiccup' in failed.last_error
+        retry_at = failed.next_attempt_at
+        assert retry_at > datetime.utcnow()
+
+        # The refund arrives while the capture is backing off: it waits its turn
+        client.post('/api/payments/paypal/callback', json=refunded('B'))
+        counts = process_pending_webhooks(app.config)
+        assert counts == {DEFERRED: 1}
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.PENDING
+
+        monkeypatch.setitem(webhook_inbox.PAYPAL_HANDLERS, webhook_inbox.CAPTURE_COMPLETED, real_handler)
+        counts = process_pending_webhooks(app.config, now=retry_at + timedelta(seconds=1))
+        assert counts[WebhookEvent.Status.PROCESSED] == 2
+        db.session.expire_all()
+        assert db.session.get(Payment, payment.id).status == Payment.Status.REFUNDED
+        assert db.session.get(Ticket, ticket.id).status == Ticket.Status.REFUNDED
+
+
+def test_event_for_unknown_payment_is_retried_then_ignored(client, app, monkeypatch):
+    monkeypatch.setattr(payment_routes, 'PayPalHandler', FakePayPal)
+    with app.app_context():
+        client.post('/api/payments/paypal/callback', json=refunded('UNKNOWN'))
+        assert process_pending_webhooks(app.config) == {RETRY: 1}
+        event = WebhookEvent.query.filter_by(event_id='WH-REFUNDED-UNKNOWN').one()
+        assert event.status == WebhookEvent.Status.PENDING
+
+        config = dict(app.config, WEBHOOK_MAX_ATTEMPTS=2)
+        assert process_pending_webhooks(config, now=datetime.utcnow() + timedelta(days=1)) == {WebhookEvent.Status.IGNORED: 1}
+        db.session.expire_all()
+        event = db.session.get(WebhookEvent, event.id)
+        assert (event.status, event.attempts) == (WebhookEvent.Status.IGNORED, 2)
@@ -0,0 +1,17 @@
+"""
+Script to add payment_references rows for payments whose PayPal ids are only
+in payments.metadata. Run with the app context, e.g.:
+`python -m backend.tools.backfill_payment_references`
+
+Migration 0014 backfills existing payments when it runs. Run this once
+after the deploy to cover payments that workers still on the old code
+created in the meantime. It is safe to run repeatedly.
+"""
+from app import create_app
+from app.utils.payment_refs import backfill_references
+
+app = create_app(bootstrap=False)
+
+with app.app_context():
+    added = backfill_references()
+    print(f"Added {added} payment references.")
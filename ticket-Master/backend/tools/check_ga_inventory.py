@@ -0,0 +1,34 @@
+"""
+Script to check general admission counters against the tickets that hold inventory.
+Run with the app context, e.g.: `python -m backend.tools.check_ga_inventory [--repair] [--event EVENT_ID]`
+
+Counters can only drift through direct database edits or a bug; with
+--repair they are reset to the ticket count.
+"""
+import sys
+from app import create_app
+from app.models import db, TicketType
+from app.utils.ga_inventory import check_ticket_type
+
+app = create_app(bootstrap=False)
+
+with app.app_context():
+    repair = '--repair' in sys.argv
+    query = TicketType.query
+    if '--event' in sys.argv:
+        query = query.filter_by(event_id=sys.argv[sys.argv.index('--event') + 1])
+
+    problems = 0
+    for ticket_type in query.order_by(TicketType.created_at.asc()):
+        report = check_ticket_type(ticket_type, repair=repair)
+        if report['issues']:
+            problems += 1
+            action = 'repaired' if report['repaired'] else 'found'
+            print(f"{ticket_type.id} ({ticket_type.name}) {action}: {'; '.join(report['issues'])}")
+    db.session.commit()
+
+    if problems:
+        print(f"{problems} ticket type(s) with inconsistent inventory.")
+    else:
+        print("All ticket type counters match their tickets.")
+    sys.exit(1 if problems and not repair else 0)
@@ -0,0 +1,22 @@
+"""
+Dedicated email outbox worker.
+Run with the app context, e.g.: `python -m backend.tools.email_worker`
+
+API processes send the outbox themselves while EMAIL_WORKER_ENABLED is on.
+To keep SMTP traffic off the API hosts, turn it off there and run this
+instead; any number of these can run side by side.
+"""
+import signal
+from app import create_app
+from app.utils.email_outbox import worker
+
+app = create_app(bootstrap=False)
+signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+
+worker.init_app(app)
+print(f"Sending the email outbox over {worker.connections} SMTP connections")
+try:
+    worker.join()
+except KeyboardInterrupt:
+    worker.stop()
+    worker.join()
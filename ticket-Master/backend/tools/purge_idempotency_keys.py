@@ -0,0 +1,22 @@
+"""
+Script to delete expired idempotency keys.
+Run with the app context, e.g.: `python -m backend.tools.purge_idempotency_keys`
+
+Expired keys are already ignored and reclaimed when a client reuses one; this
+only keeps the table from growing. Run it hourly or daily.
+"""
+from app import create_app
+from app.utils.idempotency import purge_expired_keys
+
+app = create_app(bootstrap=False)
+
+with app.app_context():
+    batch_size = 1000
+    purged = 0
+    while True:
+        batch = purge_expired_keys(batch_size)
+        purged += batch
+        if batch < batch_size:
+            break
+
+    print(f"Purged {purged} expired idempotency keys.")
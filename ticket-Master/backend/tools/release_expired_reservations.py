@@ -1,32 +1,38 @@
 """
-Script to release expired seat reservations.
+Script to release expired seat reservations and fail stale pending payments.
 Run with the app context, e.g.: `python -m backend.tools.release_expired_reservations`
-Or integrate into a scheduler/cron that runs every minute.
+
+The API workers already release expired holds in-process (see
+app/utils/hold_expiry.py), so this is only needed as a manual fallback or
+when HOLD_EXPIRY_ENABLED is turned off.
 """
-from datetime import datetime
 from app import create_app
-from app.models import db, Seat
+from app.models import db
+from app.utils.hold_expiry import DEFAULT_PAYMENT_TTL_SECONDS, expire_pending_payments, release_expired_holds
 
-app = create_app()
+app = create_app(bootstrap=False)
 
 with app.app_context():
-    now = datetime.utcnow()
-    expired = Seat.query.filter(Seat.status == Seat.Status.RESERVED, Seat.reserved_until.isnot(None), Seat.reserved_until < now).all()
+    batch_size = app.config.get('HOLD_EXPIRY_BATCH_SIZE', 500)
     released = []
-    for seat in expired:
-        seat.status = Seat.Status.AVAILABLE
-        try:
-            seat.reserved_by = None
-        except Exception:
-            pass
-        try:
-            seat.reserved_until = None
-        except Exception:
-            pass
-        released.append(seat.id)
+    while True:
+        batch, _ = release_expired_holds(batch_size=batch_size)
+        db.session.commit()
+        released.extend(batch)
+        if len(batch) < batch_size:
+            break
 
     if released:
-        db.session.commit()
         print(f"Released {len(released)} seats: {released}")
     else:
         print("No expired reservations found.")
+
+    ttl = app.config.get('PENDING_PAYMENT_TTL_SECONDS', DEFAULT_PAYMENT_TTL_SECONDS)
+    expired = []
+    while True:
+        batch = expire_pending_payments(ttl, batch_size=batch_size)
+        db.session.commit()
+        expired.extend(batch)
+        if len(batch) < batch_size:
+            break
+    print(f"Failed {len(expired)} stale pending payments.")
@@ -0,0 +1,16 @@
+"""
+Script to sign tickets confirmed before ticket codes were signed.
+Run with the app context, e.g.: `python -m backend.tools.resign_legacy_tickets`
+
+Gates accept an unsigned ``TICKET:...|EVENT:...`` code only while it is still
+the ticket's stored code. After this runs no ticket has one, so the old
+codes stop scanning: resend the affected tickets to their holders.
+"""
+from app import create_app
+from app.utils.ticket_tokens import resign_legacy_tickets
+
+app = create_app(bootstrap=False)
+
+with app.app_context():
+    signed = resign_legacy_tickets()
+    print(f"Signed {signed} tickets that still had unsigned codes.")
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { fetchUserTickets, transferTicket } from '../redux/slices/ticketsSlice';
 import ticketService from '../services/ticketService';
+import { apiAssetUrl } from '../services/api';
 import {
   FaTicketAlt,
   FaCalendar,
@@ -194,7 +195,7 @@ const DashboardPage = () => {
       });
 
       // QR code section
-      const qrRaw = data.qr_code || ticket.qr_code;
+      const qrUrl = data.qr_url || ticket.qr_url;
       const qrX = W - 155, qrY = H / 2 - 58, qrSize = 116;
 
       const finalize = () => {
@@ -216,7 +217,7 @@ const DashboardPage = () => {
         toast.success('Ticket downloaded!');
       };
 
-      if (qrRaw) {
+      if (qrUrl) {
         const img = new Image();
         img.crossOrigin = 'anonymous';
         img.onload = () => { ctx.drawImage(img, qrX, qrY, qrSize, qrSize); finalize(); };
@@ -230,7 +231,7 @@ const DashboardPage = () => {
           ctx.textAlign = 'left';
           finalize();
         };
-        img.src = qrRaw.startsWith('http') ? qrRaw : `data:image/png;base64,${qrRaw}`;
+        img.src = apiAssetUrl(qrUrl);
       } else {
         ctx.fillStyle = '#f3f4f6';
         ctx.fillRect(qrX, qrY, qrSize, qrSize);
@@ -409,10 +410,10 @@ const DashboardPage = () => {
 
                           {/* QR Code Module */}
                           <div className="hidden xl:flex flex-col items-center justify-center p-3 bg-gray-50 border border-gray-100 rounded-2xl group-hover:bg-white group-hover:border-blue-100 transition-colors">
-                            {ticket.qr_code ? (
+                            {ticket.qr_url ? (
                               <div className="relative group/qr">
                                 <img
-                                  src={ticket.qr_code.startsWith('http') ? ticket.qr_code : `data:image/png;base64,${ticket.qr_code}`}
+                                  src={apiAssetUrl(ticket.qr_url)}
                                   alt="Ticket QR"
                                   className="w-20 h-20 opacity-80 group-hover:opacity-100 transition-opacity"
                                 />
@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { fetchEvents } from '../redux/slices/eventsSlice';
 import SeatMap from '../components/SeatMap';
-import api from '../services/api';
+import api, { apiAssetUrl } from '../services/api';
 import {
     FaTicketAlt,
     FaUser,
@@ -253,8 +253,8 @@ const QuickTicketPage = () => {
 
                                 <div className="p-8 flex flex-col items-center">
                                     <div className="w-48 h-48 bg-gray-50 rounded-2xl flex items-center justify-center p-2 border-2 border-gray-100">
-                                        {resultTicket.qr_code ? (
-                                            <img src={`data:image/png;base64,${resultTicket.qr_code}`} alt="QR Code" className="w-full h-full" />
+                                        {resultTicket.qr_url ? (
+                                            <img src={apiAssetUrl(resultTicket.qr_url)} alt="QR Code" className="w-full h-full" />
                                         ) : (
                                             <FaQrcode className="text-7xl text-gray-200" />
                                         )}
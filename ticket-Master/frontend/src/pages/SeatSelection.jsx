@@ -10,7 +10,7 @@ const SeatSelection = () => {
   const eventId = searchParams.get('eventId');
 
   const handleReserve = (seat_ids, onSuccess) => {
-    api.post('/seats/reserve', { seat_ids, event_id: eventId })
+    api.post('/seats/reserve', { seat_ids, event_id: eventId, atomic: true })
       .then((res) => {
         if (res.conflicts && res.conflicts.length > 0) {
           toast.error(`Some seats could not be reserved: ${res.conflicts.map(c => c.seat_id).join(', ')}`);
@@ -33,4 +33,9 @@ api.interceptors.response.use(
   }
 );
 
+// Absolute URL for paths the API returns, such as ticket QR images
+export const apiAssetUrl = (path) => (
+  !path || /^https?:/.test(path) ? path : `${API_URL.replace(/\/api$/, '')}${path}`
+);
+
 export default api;
@@ -19,6 +19,9 @@ const ticketService = {
   validateTicket: (ticketId) =>
     api.post(`/tickets/${ticketId}/validate`),
 
+  scanTicket: (scanData) =>
+    api.post('/tickets/scan', scanData),
+
   transferTicket: (ticketId, transferData) =>
     api.post(`/tickets/${ticketId}/transfer`, transferData),
 